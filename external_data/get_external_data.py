@@ -1,51 +1,261 @@
-from ftplib import FTP
-
-# According to http://www.genenames.org/about/overview (copied 2013/07/08)
-# "No restrictions are imposed on access to, or use of, the data provided by
-# the HGNC, which are provided to enhance knowledge and encourage progress
-# in the scientific community. The HGNC provide these data in good faith,
-# but make no warranty, express or implied, nor assume any legal liability
-# or responsibility for any purpose for which they are used."
-hgnc_ftp = FTP('ftp.ebi.ac.uk')
-hgnc_ftp.login()
-# The following download is the HGNC gene symbols, which we use as gene names.
-with open('hgnc_gene_with_protein_product.txt.gz', 'wb') as outfile:
-    hgnc_ftp.retrbinary('RETR pub/databases/genenames/locus_types/' + 
-                        'gene_with_protein_product.txt.gz', 
-                        outfile.write)
-hgnc_ftp.quit()
-
-# According to ftp://hgdownload.soe.ucsc.edu/goldenPath/hg19/database/README.txt
-# (copied 2013/07/08): "All the files and tables in this directory are
-# freely usable for any purpose."
-ucsc_ftp = FTP('hgdownload.soe.ucsc.edu')
-ucsc_ftp.login()
-# The following download is the list of knownCanonical genes our genome
-# interpretation uses (thus the list of all possible genes we could matchl).
-# Gene objects in the Django site come from (and only from) this list.
-with open('ucsc_hg19_knownCanonical.txt.gz', 'wb') as outfile:
-    ucsc_ftp.retrbinary('RETR goldenPath/hg19/database/knownCanonical.txt.gz',
-                        outfile.write)
-# The following download links UCSC transcript IDs to HGNC Gene Symbols.
-with open('ucsc_hg19_kgXref.txt.gz', 'wb') as outfile:
-    ucsc_ftp.retrbinary('RETR goldenPath/hg19/database/kgXref.txt.gz',
-                        outfile.write)
-ucsc_ftp.quit()
-
-# There was no data use, copyright, or licensing information found on the NCBI
-# FTP site (checked 2013/07/08). We believe these files are work produced by the
-# US government and thus public domain under Section 105 of the Copyright Act.
-ncbi_ftp = FTP('ftp.ncbi.nih.gov')
-ncbi_ftp.login()
-# The following is from NCBI's Genetic Testing Registry, which tells us which
-# genes have registered clinical testing (uses NCBI Gene IDs).
-with open('ncbi_gene_testing_registry.txt', 'wb') as outfile:
-    ncbi_ftp.retrbinary('RETR pub/GTR/data/test_condition_gene.txt', outfile.write)
-# The following download links NCBI Gene IDs with HGNC Gene Symbols.
-with open('ncbi_homo_sapiens_gene_info.txt.gz', 'wb') as outfile:
-    ncbi_ftp.retrbinary('RETR gene/DATA/GENE_INFO/Mammalia/Homo_sapiens.gene_info.gz',
-                        outfile.write)
-# The following download links NCBI Gene IDs with MIM IDs.
-with open('ncbi_mim2gene.txt', 'wb') as outfile:
-    ncbi_ftp.retrbinary('RETR gene/DATA/mim2gene', outfile.write)
-ncbi_ftp.quit()
+"""
+Download the gene data files parsed by parse_external_data.py, into the
+current directory.
+
+    python get_external_data.py [--workers N] [--force] [--manifest <file>]
+
+Each FTP host's files are fetched over one connection, with hosts fetched
+in parallel. A file is skipped if its remote size and modification time
+(MDTM) match the manifest, and the local copy still has the SHA-256
+checksum recorded there. Files are downloaded to a '.part' file, renamed
+once its size matches the remote size. An interrupted download is resumed
+on the next run if the remote file hasn't changed since it started.
+
+The manifest (external_data_manifest.json) records the host, path, size,
+modification time, checksum and download time of each file.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from ftplib import FTP, all_errors, error_perm
+from optparse import OptionParser
+
+MANIFEST = 'external_data_manifest.json'
+
+# Seconds to wait on an unresponsive FTP server.
+TIMEOUT = 120
+
+# FTP hosts (optionally 'host:port'), each with (remote path, local file).
+SOURCES = [
+    # According to http://www.genenames.org/about/overview (copied 2013/07/08)
+    # "No restrictions are imposed on access to, or use of, the data
+    # provided by the HGNC, which are provided to enhance knowledge and
+    # encourage progress in the scientific community. The HGNC provide
+    # these data in good faith, but make no warranty, express or implied,
+    # nor assume any legal liability or responsibility for any purpose for
+    # which they are used."
+    ('ftp.ebi.ac.uk', [
+        # HGNC gene symbols, which we use as gene names.
+        ('pub/databases/genenames/locus_types/gene_with_protein_product.txt.gz',
+         'hgnc_gene_with_protein_product.txt.gz'),
+    ]),
+    # According to ftp://hgdownload.soe.ucsc.edu/goldenPath/hg19/database/README.txt
+    # (copied 2013/07/08): "All the files and tables in this directory are
+    # freely usable for any purpose."
+    ('hgdownload.soe.ucsc.edu', [
+        # The list of knownCanonical genes our genome interpretation uses
+        # (thus the list of all possible genes we could match). Gene objects
+        # in the Django site come from (and only from) this list.
+        ('goldenPath/hg19/database/knownCanonical.txt.gz',
+         'ucsc_hg19_knownCanonical.txt.gz'),
+        # Links UCSC transcript IDs to HGNC Gene Symbols.
+        ('goldenPath/hg19/database/kgXref.txt.gz',
+         'ucsc_hg19_kgXref.txt.gz'),
+    ]),
+    # There was no data use, copyright, or licensing information found on the
+    # NCBI FTP site (checked 2013/07/08). We believe these files are work
+    # produced by the US government and thus public domain under Section 105
+    # of the Copyright Act.
+    ('ftp.ncbi.nih.gov', [
+        # NCBI's Genetic Testing Registry, which tells us which genes have
+        # registered clinical testing (uses NCBI Gene IDs).
+        ('pub/GTR/data/test_condition_gene.txt',
+         'ncbi_gene_testing_registry.txt'),
+        # Links NCBI Gene IDs with HGNC Gene Symbols.
+        ('gene/DATA/GENE_INFO/Mammalia/Homo_sapiens.gene_info.gz',
+         'ncbi_homo_sapiens_gene_info.txt.gz'),
+        # Links NCBI Gene IDs with MIM IDs.
+        ('gene/DATA/mim2gene', 'ncbi_mim2gene.txt'),
+    ]),
+]
+
+
+class DownloadError(IOError):
+    """Raised when a downloaded file doesn't match the remote file."""
+
+
+class Manifest(object):
+    """Records of downloaded files, saved to a JSON file on every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = dict()
+        if os.path.exists(path):
+            with open(path) as manifest_file:
+                self.entries = json.load(manifest_file)
+
+    def get(self, filename):
+        with self._lock:
+            return dict(self.entries.get(filename, {}))
+
+    def set(self, filename, entry):
+        with self._lock:
+            self.entries[filename] = entry
+            # Write whole file then rename, so it's never left half written.
+            with open(self.path + '.tmp', 'w') as manifest_file:
+                json.dump(self.entries, manifest_file, indent=2,
+                          sort_keys=True)
+            os.rename(self.path + '.tmp', self.path)
+
+
+def file_sha256(filename):
+    """Return hex SHA-256 checksum of a file."""
+    checksum = hashlib.sha256()
+    with open(filename, 'rb') as data:
+        for chunk in iter(lambda: data.read(1 << 20), ''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def remote_stat(ftp, remote_path):
+    """Return (size, modification time) of a remote file.
+
+    Modification time is the MDTM timestamp string, or None if the server
+    doesn't support MDTM.
+    """
+    ftp.voidcmd('TYPE I')
+    size = ftp.size(remote_path)
+    try:
+        mtime = ftp.sendcmd('MDTM ' + remote_path).split()[1]
+    except error_perm:
+        mtime = None
+    return size, mtime
+
+
+def fetch_file(ftp, host, remote_path, filename, manifest, force=False):
+    """Download a file unless unchanged, returning what was done.
+
+    Returns 'unchanged', 'downloaded' or 'resumed'. Raises DownloadError
+    if the downloaded size doesn't match the remote size.
+    """
+    size, mtime = remote_stat(ftp, remote_path)
+    entry = manifest.get(filename)
+    if (not force and entry.get('size') == size and entry.get('mtime') ==
+            mtime and mtime and os.path.exists(filename) and
+            file_sha256(filename) == entry.get('sha256')):
+        return 'unchanged'
+
+    part = filename + '.part'
+    offset = 0
+    partial = entry.get('partial', {})
+    if (os.path.exists(part) and partial.get('size') == size and
+            partial.get('mtime') == mtime and mtime):
+        offset = os.path.getsize(part)
+    entry['partial'] = {'size': size, 'mtime': mtime}
+    manifest.set(filename, entry)
+
+    with open(part, 'ab' if offset else 'wb') as outfile:
+        if offset < size:
+            ftp.retrbinary('RETR ' + remote_path, outfile.write,
+                           rest=offset or None)
+    received = os.path.getsize(part)
+    if received != size:
+        # A short file can be resumed next time; a long one can't.
+        if received > size:
+            os.remove(part)
+        raise DownloadError('%s: got %d bytes, expected %d' %
+                            (filename, received, size))
+    os.rename(part, filename)
+    manifest.set(filename, {'host': host,
+                            'path': remote_path,
+                            'size': size,
+                            'mtime': mtime,
+                            'sha256': file_sha256(filename),
+                            'downloaded': datetime.utcnow().isoformat()})
+    return 'resumed' if offset else 'downloaded'
+
+
+def connect(host):
+    """Return FTP connection, logged in, to 'host' or 'host:port'."""
+    hostname, unused, port = host.partition(':')
+    ftp = FTP(timeout=TIMEOUT)
+    ftp.connect(hostname, int(port or 21))
+    ftp.login()
+    return ftp
+
+
+def fetch_host(host, files, manifest, force=False):
+    """Download a host's files over one connection.
+
+    Returns list of (filename, result), where result is what fetch_file
+    returned, or the error raised.
+    """
+    results = []
+    ftp = None
+    for remote_path, filename in files:
+        try:
+            if ftp is None:
+                ftp = connect(host)
+            results.append((filename, fetch_file(
+                ftp, host, remote_path, filename, manifest, force=force)))
+        except all_errors as e:
+            results.append((filename, e))
+            # The connection may be unusable after a failed transfer.
+            if ftp is not None:
+                ftp.close()
+                ftp = None
+    if ftp is not None:
+        try:
+            ftp.quit()
+        except all_errors:
+            ftp.close()
+    return results
+
+
+def fetch_all(sources=SOURCES, manifest_path=MANIFEST, workers=None,
+              force=False):
+    """Download files from all sources, hosts in parallel.
+
+    Returns list of (filename, result) in source order; see fetch_host.
+    """
+    manifest = Manifest(manifest_path)
+    workers = workers or len(sources)
+    results = dict()
+    pending = list(enumerate(sources))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                index, (host, files) = pending.pop(0)
+            results[index] = fetch_host(host, files, manifest, force=force)
+
+    threads = [threading.Thread(target=worker) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [result for index in sorted(results) for result in results[index]]
+
+
+def main(workers=None, force=False, manifest_path=MANIFEST):
+    failed = False
+    for filename, result in fetch_all(manifest_path=manifest_path,
+                                      workers=workers, force=force):
+        if isinstance(result, Exception):
+            failed = True
+            print '%s: failed (%s)' % (filename, result)
+        else:
+            print '%s: %s' % (filename, result)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = OptionParser(
+        usage='%prog [--workers N] [--force] [--manifest <file>]')
+    parser.add_option('--workers', type='int', default=None,
+                      help='Number of hosts to download from at once '
+                           '(default: all)')
+    parser.add_option('--force', action='store_true', default=False,
+                      help='Download files even if unchanged')
+    parser.add_option('--manifest', dest='manifest_path', default=MANIFEST,
+                      help='Manifest file (default: %s)' % MANIFEST)
+    options, args = parser.parse_args()
+    sys.exit(main(workers=options.workers, force=options.force,
+                  manifest_path=options.manifest_path))
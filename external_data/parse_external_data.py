@@ -1,229 +1,410 @@
+"""
+Parse gene data files downloaded by get_external_data.py into a CSV of
+gene data (getevidence_external_gene_data.csv), read by the
+add_external_gene_data management command.
+
+Run in the directory holding the downloaded files:
+
+    python parse_external_data.py [--processes N] [--benchmark]
+        [--aliases <alias_file>] <output_file>
+
+Each source file is read a line at a time. The small sources are parsed
+by pure functions, independently, in a pool of processes. The large UCSC
+kgXref and NCBI gene_info files are streamed through the merge in this
+process instead, so memory use doesn't grow with their size. Results are
+merged in a fixed order, so output doesn't depend on which parse finishes
+first. With --benchmark, wall time and peak memory after each stage are
+reported.
+
+With --aliases, HGNC previous symbols, synonyms and accession numbers of
+the genes written are also written to a CSV file
+(getevidence_external_gene_aliases.csv), read by the load_gene_aliases
+management command. Aliases shared by several genes are written for each
+of them.
+"""
 import csv
 import gzip
+import multiprocessing
 import re
+import resource
 import sys
+import time
+from optparse import OptionParser
 
-# All final data will be stored in gene_symbols.
-gene_symbols = dict()
+HEADER = ['hgnc_symbol', 'hgnc_id', 'hgnc_name', 'ucsc_knowngene',
+          'ncbi_gene_id', 'mim_id', 'clinical_testing', 'acmg_recommended']
 
-def tsv_row(line):
-    return line.rstrip('\n').split('\t')
+ALIAS_HEADER = ['alias', 'alias_type', 'hgnc_id']
 
-def process_hgnc_data(hgnc_data):
+# Alias types, and the HGNC column listing aliases of each type.
+ALIAS_COLUMNS = [('previous', 4), ('synonym', 6), ('accession', 8)]
+
+
+def read_tsv(filename, skip_header=False):
+    """Yield rows of a tab-separated file, gzipped if named '.gz'."""
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename) as tsv_file:
+        if skip_header:
+            next(tsv_file, None)
+        for line in tsv_file:
+            yield line.rstrip('\n').split('\t')
+
+
+def add_unique(index, keys, symbol):
+    """Map each key to symbol in index, or to None if seen before."""
+    for key in keys:
+        if key in index:
+            index[key] = None
+        else:
+            index[key] = symbol
+
+
+def parse_hgnc_data(filename):
+    """Return genes keyed by HGNC symbol, and indexes of HGNC data.
+
+    Returns (genes, hgnc_ids, hgnc_prev_symbols, hgnc_synonyms,
+    hgnc_accessions). hgnc_ids maps HGNC IDs to symbols; the other
+    indexes map previous symbols, synonyms and accession numbers to a
+    symbol, or to None if more than one gene has them.
+    """
+    genes = dict()
     hgnc_ids = dict()
     hgnc_prev_symbols = dict()
     hgnc_synonyms = dict()
     hgnc_accessions = dict()
-    for row in [tsv_row(x) for x in hgnc_data]:
+    for row in read_tsv(filename):
         hgnc_ids[row[0]] = row[1]
-        gene_symbols[row[1]] = { 'hgnc_id': row[0],
-                                 'hgnc_symbol': row[1],
-                                 'hgnc_name': row[2] }
-
+        genes[row[1]] = { 'hgnc_id': row[0],
+                          'hgnc_symbol': row[1],
+                          'hgnc_name': row[2] }
         if row[4]:
-            prev_symbols = row[4].split(', ')
-            for symbol in prev_symbols:
-                if symbol in hgnc_prev_symbols:
-                    hgnc_prev_symbols[symbol] = None
-                else:
-                    hgnc_prev_symbols[symbol] = row[1]
-
+            add_unique(hgnc_prev_symbols, row[4].split(', '), row[1])
         if row[6]:
-            synonyms = row[6].split(', ')
-            for synonym in synonyms:
-                if synonym in hgnc_synonyms:
-                    hgnc_synonyms[synonym] = None
-                else:
-                    hgnc_synonyms[synonym] = row[1]
-
+            add_unique(hgnc_synonyms, row[6].split(', '), row[1])
         if row[8]:
-            accessions = row[8].split(', ')
-            for accession in accessions:
-                if accession in hgnc_accessions:
-                    hgnc_accessions[accession] = None
-                else:
-                    hgnc_accessions[accession] = row[1]
-    return hgnc_ids, hgnc_prev_symbols, hgnc_synonyms, hgnc_accessions
+            add_unique(hgnc_accessions, row[8].split(', '), row[1])
+    return genes, hgnc_ids, hgnc_prev_symbols, hgnc_synonyms, hgnc_accessions
+
+
+def parse_hgnc_aliases(filename):
+    """Return list of HGNC aliases, in file order.
 
+    Each alias is a tuple of (alias, alias type, HGNC ID).
+    """
+    aliases = []
+    for row in read_tsv(filename):
+        for alias_type, column in ALIAS_COLUMNS:
+            if row[column]:
+                for alias in row[column].split(', '):
+                    aliases.append((alias, alias_type, row[0]))
+    return aliases
 
-def process_ucsc_knowncanonical(ucsc_knowncanonical_data):
+
+def parse_ucsc_knowncanonical(filename):
+    """Return set of UCSC knownCanonical transcript IDs."""
     ucsc_knowncanonical = set()
-    for row in [tsv_row(x) for x in ucsc_knowncanonical_data]:
+    for row in read_tsv(filename):
         ucsc_knowncanonical.add(row[4])
     return ucsc_knowncanonical
 
 
-def process_ucsc_kgxref(ucsc_kgxref_data, ucsc_knowncanonical,
-                        hgnc_accessions, hgnc_prev_symbols, hgnc_synonyms):
-    for row in [tsv_row(x) for x in ucsc_kgxref_data]:
-        ucsc_data = { 'ucsc_transcript': row[0] }
-        if row[0] in ucsc_knowncanonical:
-            ucsc_data['ucsc_canonical'] = True
-        if row[4]:
-            ucsc_data['ucsc_symbol'] = row[4]
-        if row[1]:
-            ucsc_data['ucsc_mrna'] = row[1]
-        if row[7]:
-            ucsc_data['ucsc_description'] = row[7]
+def iter_ucsc_kgxref(filename):
+    """Yield UCSC kgXref transcripts, in file order.
+
+    Each transcript is a tuple of (transcript ID, mRNA accession, UCSC's
+    gene symbol, whether its description names it "variant 1").
+    """
+    for row in read_tsv(filename):
+        yield (row[0], row[1], row[4],
+               bool(row[7]) and bool(re.search('variant [Aa1]', row[7])))
 
+
+def iter_ncbi_gene_info(filename):
+    """Yield NCBI genes, in file order.
+
+    Each gene is a tuple of (NCBI Gene ID, symbol, HGNC ID, MIM ID), with
+    None for crossreferences a gene doesn't have.
+    """
+    for row in read_tsv(filename, skip_header=True):
+        # Get crossreference database IDs.
+        hgnc_id = None
+        mim_id = None
+        for xref in row[5].split('|'):
+            if xref[0:5] == 'HGNC:':
+                hgnc_id = xref
+            if xref[0:4] == 'MIM:':
+                mim_id = xref
+        yield row[1], row[2], hgnc_id, mim_id
+
+
+def parse_ncbi_gene_testing(filename):
+    """Return set of NCBI Gene IDs with tests in the Genetic Testing Registry."""
+    tested = set()
+    for row in read_tsv(filename, skip_header=True):
+        if row[3] == 'gene':
+            tested.add(row[7])
+    return tested
+
+
+def parse_acmg_recommendations(filename):
+    """Return set of symbols on the ACMG's 2013 list of recommended genes."""
+    return set(row[0] for row in read_tsv(filename))
+
+
+def merge_ucsc_transcripts(genes, ucsc_knowncanonical, kgxref_transcripts,
+                           hgnc_accessions, hgnc_prev_symbols, hgnc_synonyms):
+    """Return UCSC transcripts of genes, keyed by HGNC symbol.
+
+    Each transcript is a tuple of (transcript ID, whether it's
+    knownCanonical, whether its description names it "variant 1").
+    """
+    transcripts = dict()
+    for tx_id, accession, symbol, variant1 in kgxref_transcripts:
         # Set of decisions to decide on a symbol.
-        symbol = row[4]
         # Symbol uniquely associated with accession supersedes UCSC's pick.
-        if row[1] in hgnc_accessions and hgnc_accessions[row[1]]:
-            symbol = hgnc_accessions[row[1]]
+        if accession in hgnc_accessions and hgnc_accessions[accession]:
+            symbol = hgnc_accessions[accession]
         # If UCSC pick isn't in HGNC list: try previous symbols, then synonyms.
-        if not symbol in gene_symbols:
+        if not symbol in genes:
             if symbol in hgnc_prev_symbols and hgnc_prev_symbols[symbol]:
                 symbol = hgnc_prev_symbols[symbol]
             elif symbol in hgnc_synonyms and hgnc_synonyms[symbol]:
                 symbol = hgnc_synonyms[symbol]
 
         # If we found an HGNC symbol match, add this transcript.
-        if symbol in gene_symbols:
-            if 'ucsc_transcripts' in gene_symbols[symbol]:
-                gene_symbols[symbol]['ucsc_transcripts'].append(ucsc_data)
-            else:
-                gene_symbols[symbol]['ucsc_transcripts'] = [ ucsc_data ]
+        if symbol in genes:
+            transcripts.setdefault(symbol, []).append(
+                (tx_id, tx_id in ucsc_knowncanonical, variant1))
+    return transcripts
 
 
 def resolve_ucsc_transcripts(transcript_list):
+    """Return ID of the transcript chosen to represent a gene."""
     if len(transcript_list) == 1:
-        return transcript_list[0]['ucsc_transcript']
-    canonical = list()
+        return transcript_list[0][0]
 
     # Return unique knowncanonical transcript if possible.
-    for tx in transcript_list:
-        if 'ucsc_canonical' in tx:
-            canonical.append(tx)
+    canonical = [tx for tx in transcript_list if tx[1]]
     if len(canonical) == 1:
-        return canonical[0]['ucsc_transcript']
+        return canonical[0][0]
     elif len(canonical) > 1:
         # And if there's more than one canonical, choose between these.
         transcript_list = canonical
 
     # Search for a transcript named something like "variant 1"
-    variant1 = list()
-    for tx in transcript_list:
-        if 'ucsc_description' in tx and re.search('variant [Aa1]', 
-                                                  tx['ucsc_description']):
-            variant1.append(tx['ucsc_transcript'])
+    variant1 = [tx[0] for tx in transcript_list if tx[2]]
     if len(variant1) == 1:
         return variant1[0]
 
     # If all else failed, take the alphabetically first UCSC transcript ID.
-    tx_names = list()
-    for tx in transcript_list:
-        tx_names.append(tx['ucsc_transcript'])
-    tx_names.sort()
-    return tx_names[0]
-
+    return min([tx[0] for tx in transcript_list])
 
-def process_ncbi_gene_info(ncbi_gene_info_data, hgnc_ids):
-    ncbi_gene_info_data.next()
-    ncbi_gene_ids = dict()
-    for row in [tsv_row(x) for x in ncbi_gene_info_data]:
-        ncbi_gene_id = row[1]
-        symbol = row[2]
 
-        # Get crossreference database IDs.
-        hgnc_id = None
-        mim_id = None
-        dbXrefs = row[5].split('|')
-        for xref in dbXrefs:
-            if xref[0:5] == 'HGNC:':
-                hgnc_id = xref
-            if xref[0:4] == 'MIM:':
-                mim_id = xref
+def merge_ncbi_gene_info(genes, hgnc_ids, ncbi_genes):
+    """Add NCBI Gene and MIM IDs to genes.
 
+    Genes are applied in file order, so a later NCBI gene matching the
+    same HGNC gene wins. Returns dict mapping NCBI Gene IDs to HGNC
+    symbols.
+    """
+    ncbi_gene_ids = dict()
+    for ncbi_gene_id, symbol, hgnc_id, mim_id in ncbi_genes:
         # Identify using HGNC IDs, since symbols can change.
         if hgnc_id in hgnc_ids:
             symbol = hgnc_ids[hgnc_id]
 
-        if symbol in gene_symbols:
+        if symbol in genes:
             ncbi_gene_ids[ncbi_gene_id] = symbol
-            gene_symbols[symbol]['ncbi_gene_id'] = ncbi_gene_id
+            genes[symbol]['ncbi_gene_id'] = ncbi_gene_id
             if mim_id:
-                gene_symbols[symbol]['mim_id'] = mim_id
-
+                genes[symbol]['mim_id'] = mim_id
     return ncbi_gene_ids
 
 
-def process_ncbi_gene_testing(ncbi_gene_testing_data, ncbi_gene_ids):
-    ncbi_gene_testing_data.next()
-    for row in [tsv_row(x) for x in ncbi_gene_testing_data]:
-        if not row[3] == 'gene':
-            continue
-        if row[7] in ncbi_gene_ids:
-            symbol = ncbi_gene_ids[row[7]]
-            if symbol in gene_symbols:
-                gene_symbols[symbol]['clinical_testing'] = True
-
-
-def process_acmg_recommendations(acmg_recommendations_data):
-    for line in acmg_recommendations_data:
-        row = line.rstrip('\n').split('\t')
-        if row[0] in gene_symbols:
-            gene_symbols[row[0]]['acmg_recommended'] = True
-
-
-def main(outputfilename):
-    with gzip.open('hgnc_gene_with_protein_product.txt.gz') as hgnc_data:
-        (hgnc_ids, hgnc_prev_symbols, 
-         hgnc_synonyms, hgnc_accessions) = process_hgnc_data(hgnc_data)
-
-    with gzip.open('ucsc_hg19_knownCanonical.txt.gz') as ucsc_knowncanonical_data:
-        ucsc_knowncanonical = process_ucsc_knowncanonical(ucsc_knowncanonical_data)
-    with gzip.open('ucsc_hg19_kgXref.txt.gz') as ucsc_kgxref_data:
-        process_ucsc_kgxref(ucsc_kgxref_data, ucsc_knowncanonical,
-                            hgnc_accessions, hgnc_prev_symbols, hgnc_synonyms)
+def merge_ncbi_gene_testing(genes, ncbi_gene_ids, tested):
+    """Mark genes with tests in NCBI's Genetic Testing Registry."""
+    for ncbi_gene_id in tested:
+        if ncbi_gene_id in ncbi_gene_ids:
+            symbol = ncbi_gene_ids[ncbi_gene_id]
+            if symbol in genes:
+                genes[symbol]['clinical_testing'] = True
+
+
+def merge_acmg_recommendations(genes, acmg_symbols):
+    """Mark genes on the ACMG's 2013 list of recommended genes."""
+    for symbol in acmg_symbols:
+        if symbol in genes:
+            genes[symbol]['acmg_recommended'] = True
+
+
+def write_gene_data(genes, outputfilename):
+    """Write genes to a CSV file, sorted by symbol."""
+    with open(outputfilename, 'w') as data_out:
+        csv_out = csv.writer(data_out, lineterminator='\n')
+        csv_out.writerow(HEADER)
+        for symbol in sorted(genes.keys()):
+            data = genes[symbol]
+            row = [None for x in range(len(HEADER))]
+            row[0] = data['hgnc_symbol']
+            row[1] = data['hgnc_id'][5:]
+            row[2] = data['hgnc_name']
+            row[3] = data['ucsc_knowngene_id']
+            row[4] = data['ncbi_gene_id']
+            if 'mim_id' in data:
+                row[5] = data['mim_id'][4:]
+            if 'clinical_testing' in data and data['clinical_testing']:
+                row[6] = 'Y'
+            if 'acmg_recommended' in data and data['acmg_recommended']:
+                row[7] = 'Y'
+            csv_out.writerow(row)
+
+
+def write_gene_aliases(genes, aliases, outputfilename):
+    """Write aliases of genes to a CSV file, sorted by alias."""
+    hgnc_ids = set(data['hgnc_id'] for data in genes.values())
+    with open(outputfilename, 'w') as data_out:
+        csv_out = csv.writer(data_out, lineterminator='\n')
+        csv_out.writerow(ALIAS_HEADER)
+        for alias, alias_type, hgnc_id in sorted(set(aliases)):
+            if hgnc_id in hgnc_ids:
+                csv_out.writerow([alias, alias_type, hgnc_id[5:]])
+
+
+class Benchmark(object):
+    """Records wall time and peak memory after each stage of a run."""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.start = self.last = time.time()
+
+    def stage(self, name):
+        if not self.enabled:
+            return
+        now = time.time()
+        # ru_maxrss is in kilobytes on Linux (bytes on Mac OS X).
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        sys.stderr.write('%-16s %7.2fs  peak RSS %8d KB (largest child %d KB)\n'
+                         % (name, now - self.last, peak, children))
+        self.last = now
+
+    def total(self):
+        if self.enabled:
+            sys.stderr.write('%-16s %7.2fs\n' %
+                             ('total', time.time() - self.start))
+
+
+# Each source is parsed independently, so parses can run in parallel.
+SOURCES = [
+    ('hgnc', parse_hgnc_data, 'hgnc_gene_with_protein_product.txt.gz'),
+    ('knowncanonical', parse_ucsc_knowncanonical,
+     'ucsc_hg19_knownCanonical.txt.gz'),
+    ('gene_testing', parse_ncbi_gene_testing, 'ncbi_gene_testing_registry.txt'),
+    ('acmg', parse_acmg_recommendations,
+     'acmg_2013_recommendations_hgnc_list.txt'),
+]
+
+# Large sources, streamed through the merge rather than parsed in full.
+STREAMED_SOURCES = [
+    ('kgxref', iter_ucsc_kgxref, 'ucsc_hg19_kgXref.txt.gz'),
+    ('gene_info', iter_ncbi_gene_info, 'ncbi_homo_sapiens_gene_info.txt.gz'),
+]
+
+
+ALIAS_SOURCE = ('aliases', parse_hgnc_aliases,
+                'hgnc_gene_with_protein_product.txt.gz')
+
+
+def parse_sources(processes=None, aliases=False):
+    """Return dict of each source's parse result, keyed by source name.
+
+    Sources are parsed in a pool of processes (by default, one per CPU).
+    With processes=1, they're parsed one after another in this process.
+    If aliases is True, HGNC aliases are parsed too. Streamed sources are
+    returned as iterators, read when merged.
+    """
+    sources = SOURCES + [ALIAS_SOURCE] if aliases else SOURCES
+    if processes is None:
+        processes = min(multiprocessing.cpu_count(), len(sources))
+    if processes == 1:
+        parsed = dict((name, parse(filename))
+                      for name, parse, filename in sources)
+    else:
+        pool = multiprocessing.Pool(processes=processes)
+        try:
+            pending = [(name, pool.apply_async(parse, (filename,)))
+                       for name, parse, filename in sources]
+            parsed = dict((name, result.get()) for name, result in pending)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    for name, stream, filename in STREAMED_SOURCES:
+        parsed[name] = stream(filename)
+    return parsed
+
+
+def merge_sources(parsed):
+    """Return genes keyed by HGNC symbol, merged from parse results.
+
+    Merging runs in a fixed order, whatever order parses finished in, so
+    the output is deterministic.
+    """
+    (genes, hgnc_ids, hgnc_prev_symbols, hgnc_synonyms,
+     hgnc_accessions) = parsed.pop('hgnc')
+    transcripts = merge_ucsc_transcripts(
+        genes, parsed.pop('knowncanonical'), parsed.pop('kgxref'),
+        hgnc_accessions, hgnc_prev_symbols, hgnc_synonyms)
+    del hgnc_accessions, hgnc_prev_symbols, hgnc_synonyms
 
     # Resolve on a single UCSC knownGene transcript for each gene.
     # (Typically this will be the knownCanonical transcript for a locus.)
     # If there are none, remove the gene symbol.
-    symbols = gene_symbols.keys()
-    for symbol in symbols:
-        if 'ucsc_transcripts' in gene_symbols[symbol]:
-            kg_tx_id = resolve_ucsc_transcripts(gene_symbols[symbol]
-                                                ['ucsc_transcripts'])
-            gene_symbols[symbol]['ucsc_knowngene_id'] = kg_tx_id
-            del gene_symbols[symbol]['ucsc_transcripts']
+    for symbol in genes.keys():
+        if symbol in transcripts:
+            genes[symbol]['ucsc_knowngene_id'] = resolve_ucsc_transcripts(
+                transcripts[symbol])
         else:
-            del gene_symbols[symbol]
-
-    with gzip.open('ncbi_homo_sapiens_gene_info.txt.gz') as ncbi_gene_info_data:
-        ncbi_gene_ids = process_ncbi_gene_info(ncbi_gene_info_data, hgnc_ids)
-    with open('ncbi_gene_testing_registry.txt') as ncbi_gene_testing_data:
-        process_ncbi_gene_testing(ncbi_gene_testing_data, ncbi_gene_ids)
-    with open('acmg_2013_recommendations_hgnc_list.txt') as acmg_recommendations_data:
-        process_acmg_recommendations(acmg_recommendations_data)
-
-    data_out = open(outputfilename, 'w')
-    csv_out = csv.writer(data_out, lineterminator='\n')
-    header = ['hgnc_symbol', 'hgnc_id', 'hgnc_name', 'ucsc_knowngene',
-              'ncbi_gene_id', 'mim_id', 'clinical_testing', 'acmg_recommended']
-    csv_out.writerow(header)
-
-    gene_symbol_list = gene_symbols.keys()
-    gene_symbol_list.sort()
-    for symbol in gene_symbol_list:
-        data = gene_symbols[symbol]
-        data_out = [None for x in range(len(header))]
-        data_out[0] = data['hgnc_symbol']
-        data_out[1] = data['hgnc_id'][5:]
-        data_out[2] = data['hgnc_name']
-        data_out[3] = data['ucsc_knowngene_id']
-        data_out[4] = data['ncbi_gene_id']
-        if 'mim_id' in data:
-            data_out[5] = data['mim_id'][4:]
-        if 'clinical_testing' in data and data['clinical_testing']:
-            data_out[6] = 'Y'
-        if 'acmg_recommended' in data and data['acmg_recommended']:
-            data_out[7] = 'Y'
-        csv_out.writerow(data_out)
+            del genes[symbol]
+    del transcripts
+
+    ncbi_gene_ids = merge_ncbi_gene_info(genes, hgnc_ids,
+                                         parsed.pop('gene_info'))
+    merge_ncbi_gene_testing(genes, ncbi_gene_ids, parsed.pop('gene_testing'))
+    merge_acmg_recommendations(genes, parsed.pop('acmg'))
+    return genes
+
+
+def main(outputfilename, processes=None, benchmark=False,
+         aliasfilename=None):
+    bench = Benchmark(benchmark)
+    parsed = parse_sources(processes=processes, aliases=bool(aliasfilename))
+    aliases = parsed.pop('aliases', None)
+    bench.stage('Parse sources')
+    genes = merge_sources(parsed)
+    bench.stage('Merge')
+    write_gene_data(genes, outputfilename)
+    if aliasfilename:
+        write_gene_aliases(genes, aliases, aliasfilename)
+    bench.stage('CSV output')
+    bench.total()
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
+    parser = OptionParser(
+        usage='%prog [--processes N] [--benchmark] [--aliases <alias_file>] '
+              '<output_file>')
+    parser.add_option('--processes', type='int', default=None,
+                      help='Number of processes to parse sources with '
+                           '(default: one per CPU)')
+    parser.add_option('--aliases', dest='aliasfilename', default=None,
+                      help='Also write aliases of genes to this file')
+    parser.add_option('--benchmark', action='store_true', default=False,
+                      help='Report wall time and peak memory of each stage')
+    options, args = parser.parse_args()
+    if len(args) < 1:
         print "Please provide output filename as an argument."
     else:
-        main(sys.argv[1])
+        main(args[0], processes=options.processes,
+             benchmark=options.benchmark,
+             aliasfilename=options.aliasfilename)
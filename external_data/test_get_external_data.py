@@ -0,0 +1,200 @@
+"""
+Tests get_external_data.py against local FTP stand-ins.
+
+    python -m unittest test_get_external_data
+"""
+import os
+import shutil
+import socket
+import SocketServer
+import tempfile
+import threading
+import unittest
+import get_external_data
+from get_external_data import Manifest, fetch_all
+
+
+class FTPStandIn(object):
+    """Minimal anonymous, passive-mode FTP server for tests.
+
+    files:      dict of remote path to (data, MDTM timestamp)
+    cut_off:    dict of remote path to number of bytes after which the next
+                RETR of the file is aborted
+    retrieved:  list of (remote path, REST offset) for each RETR
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.cut_off = dict()
+        self.retrieved = []
+        stand_in = self
+
+        class Handler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                stand_in.handle(self)
+
+        self.server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0),
+                                                      Handler)
+        self.server.daemon_threads = True
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, handler):
+        def reply(line):
+            handler.wfile.write(line + '\r\n')
+            handler.wfile.flush()
+
+        reply('220 Stand-in ready.')
+        passive = None
+        rest = 0
+        while True:
+            line = handler.rfile.readline()
+            if not line:
+                return
+            command, unused, arg = line.strip().partition(' ')
+            command = command.upper()
+            if command == 'USER':
+                reply('331 Any password.')
+            elif command == 'PASS':
+                reply('230 Logged in.')
+            elif command == 'TYPE':
+                reply('200 Type set.')
+            elif command == 'SIZE' and arg in self.files:
+                reply('213 %d' % len(self.files[arg][0]))
+            elif command == 'MDTM' and arg in self.files:
+                reply('213 %s' % self.files[arg][1])
+            elif command == 'PASV':
+                passive = socket.socket()
+                passive.bind(('127.0.0.1', 0))
+                passive.listen(1)
+                port = passive.getsockname()[1]
+                reply('227 Entering Passive Mode (127,0,0,1,%d,%d).' %
+                      (port >> 8, port & 255))
+            elif command == 'REST':
+                rest = int(arg)
+                reply('350 Restarting.')
+            elif command == 'RETR' and arg in self.files and passive:
+                self.retrieved.append((arg, rest))
+                reply('150 Sending.')
+                data = self.files[arg][0][rest:]
+                aborted = arg in self.cut_off
+                if aborted:
+                    data = data[:self.cut_off.pop(arg)]
+                connection, unused = passive.accept()
+                connection.sendall(data)
+                connection.close()
+                passive.close()
+                passive = None
+                rest = 0
+                if aborted:
+                    reply('426 Transfer aborted.')
+                else:
+                    reply('226 Transfer complete.')
+            elif command == 'QUIT':
+                reply('221 Bye.')
+                return
+            else:
+                reply('550 Not available.')
+
+
+class GetExternalDataTest(unittest.TestCase):
+    """Tests downloading, skipping and resuming external data files."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        self.hgnc = FTPStandIn({
+            'hgnc/genes.txt.gz': ('HGNC data ' * 1000, '20130708120000')})
+        self.ncbi = FTPStandIn({
+            'ncbi/gene_info.gz': ('NCBI data ' * 5000, '20130708120000'),
+            'ncbi/gtr.txt': ('GTR data', '20130708120000')})
+        self.sources = [
+            (self.hgnc.host, [('hgnc/genes.txt.gz', 'hgnc.txt.gz')]),
+            (self.ncbi.host, [('ncbi/gene_info.gz', 'gene_info.txt.gz'),
+                              ('ncbi/gtr.txt', 'gtr.txt')]),
+        ]
+
+    def tearDown(self):
+        self.hgnc.stop()
+        self.ncbi.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def fetch(self, **kwargs):
+        return dict(fetch_all(self.sources, manifest_path='manifest.json',
+                              **kwargs))
+
+    def test_conditional_download(self):
+        """Test unchanged files are skipped and changed ones downloaded."""
+        self.assertEqual(self.fetch(), {'hgnc.txt.gz': 'downloaded',
+                                        'gene_info.txt.gz': 'downloaded',
+                                        'gtr.txt': 'downloaded'})
+        with open('gene_info.txt.gz') as data:
+            self.assertEqual(data.read(), 'NCBI data ' * 5000)
+        entry = Manifest('manifest.json').get('gene_info.txt.gz')
+        self.assertEqual(entry['size'], 50000)
+        self.assertEqual(entry['mtime'], '20130708120000')
+        self.assertEqual(entry['path'], 'ncbi/gene_info.gz')
+        self.assertEqual(entry['sha256'], get_external_data.file_sha256(
+            'gene_info.txt.gz'))
+
+        self.assertEqual(set(self.fetch().values()), set(['unchanged']))
+        self.assertEqual(len(self.ncbi.retrieved), 2)
+
+        # A changed remote file, or a damaged local copy, is fetched again.
+        self.ncbi.files['ncbi/gtr.txt'] = ('New GTR data', '20140101000000')
+        with open('hgnc.txt.gz', 'w') as data:
+            data.write('HGNC data ' * 999 + 'HGNC DATA ')
+        self.assertEqual(self.fetch(), {'hgnc.txt.gz': 'downloaded',
+                                        'gene_info.txt.gz': 'unchanged',
+                                        'gtr.txt': 'downloaded'})
+        with open('gtr.txt') as data:
+            self.assertEqual(data.read(), 'New GTR data')
+        self.assertEqual(self.fetch(force=True)['gtr.txt'], 'downloaded')
+
+    def test_resume(self):
+        """Test an interrupted download resumes where it stopped."""
+        self.ncbi.cut_off['ncbi/gene_info.gz'] = 20000
+        results = self.fetch(workers=1)
+        self.assertTrue(isinstance(results['gene_info.txt.gz'], Exception))
+        # Files after a failure are fetched over a new connection.
+        self.assertEqual(results['gtr.txt'], 'downloaded')
+        self.assertEqual(os.path.getsize('gene_info.txt.gz.part'), 20000)
+        self.assertFalse(os.path.exists('gene_info.txt.gz'))
+
+        self.assertEqual(self.fetch()['gene_info.txt.gz'], 'resumed')
+        self.assertEqual(self.ncbi.retrieved[-1],
+                         ('ncbi/gene_info.gz', 20000))
+        with open('gene_info.txt.gz') as data:
+            self.assertEqual(data.read(), 'NCBI data ' * 5000)
+        self.assertFalse(os.path.exists('gene_info.txt.gz.part'))
+
+        # A partial file of an older remote version is started again.
+        self.ncbi.files['ncbi/gene_info.gz'] = ('NCBI 2 ' * 5000,
+                                                '20140101000000')
+        self.ncbi.cut_off['ncbi/gene_info.gz'] = 100
+        self.fetch()
+        self.ncbi.files['ncbi/gene_info.gz'] = ('NCBI 3 ' * 5000,
+                                                '20140201000000')
+        self.assertEqual(self.fetch()['gene_info.txt.gz'], 'downloaded')
+        with open('gene_info.txt.gz') as data:
+            self.assertEqual(data.read(), 'NCBI 3 ' * 5000)
+
+    def test_unreachable_host(self):
+        """Test an unreachable host fails only its own files."""
+        self.hgnc.stop()
+        results = self.fetch()
+        self.assertTrue(isinstance(results['hgnc.txt.gz'], Exception))
+        self.assertEqual(results['gtr.txt'], 'downloaded')
+        self.hgnc = FTPStandIn(self.hgnc.files)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1 @@
+# The API serves data from other apps' models and has none of its own.
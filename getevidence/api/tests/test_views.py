@@ -0,0 +1,130 @@
+"""
+Tests views.py in api app.
+"""
+
+import json
+import reversion
+from django.conf import settings
+from django.test import TestCase
+from django.test.client import Client
+from genes.models import Gene, GeneAlias
+from variants.management.commands.add_external_gene_data import add_external_gene_data
+from variants.management.commands.sample_data import create_sample_data
+from variants.models import Variant
+from .. import views
+
+
+class ApiViewsTest(TestCase):
+    """Tests the JSON views in views.py."""
+
+    def setUp(self):
+        self.cl = Client()
+        add_external_gene_data(settings.SITE_ROOT + '/../external_data/getevidence_external_gene_data_mini.csv')
+        create_sample_data()
+
+    def test_variant(self):
+        """Test variant data and conditional GETs."""
+        response = self.cl.get('/api/v1/variant/HBB-E7V')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['name'], 'HBB-E7V')
+        self.assertEqual(data['dbsnps'], ['rs334'])
+        self.assertEqual(data['review']['impact'], 'pat')
+        self.assertEqual([p['pmid'] for p in data['publications']],
+                         [655188, 10631276])
+        etag = response['ETag']
+
+        # Variant, latest revision: no review tables.
+        with self.assertNumQueries(2):
+            response = self.cl.get('/api/v1/variant/HBB-E7V',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Edits change the ETag.
+        self.cl.post('/variant/HBB-E7V/edit',
+                     {'review_summary': "Sickle cell.", 'review_long': '',
+                      'impact': 'pat', 'inheritance': 'rec'})
+        response = self.cl.get('/api/v1/variant/HBB-E7V',
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # So do changes to the Gene, which aren't Variant revisions.
+        etag = response['ETag']
+        Gene.objects.filter(hgnc_symbol='HBB').update(mim_id='999999')
+        response = self.cl.get('/api/v1/variant/HBB-E7V',
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        response = self.cl.get('/api/v1/variant/HBB-E27V')
+        self.assertEqual(response.status_code, 404)
+
+        # Ambiguous gene aliases list the genes they could mean.
+        for symbol in ['JAK2', 'HBB']:
+            gene = Gene.objects.get(hgnc_symbol=symbol)
+            GeneAlias.objects.create(gene=gene, alias='HBX', alias_type='syn')
+        response = self.cl.get('/api/v1/variant/HBX-E7V')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content)['symbols'],
+                         ['HBB', 'JAK2'])
+
+    def test_variant_changes(self):
+        """Test listing variants changed since a revision."""
+        data = json.loads(self.cl.get('/api/v1/variant/changes').content)
+        self.assertEqual(sorted(data['variants']),
+                         ['HBB-E7V', 'JAK2-V617F', 'SCN5A-G615E'])
+        since = data['latest_revision']
+        data = json.loads(self.cl.get('/api/v1/variant/changes',
+                                      {'since': since}).content)
+        self.assertEqual(data['variants'], [])
+        self.cl.post('/variant/JAK2-V617F/edit',
+                     {'review_summary': "Somatic.", 'review_long': '',
+                      'impact': 'not', 'inheritance': 'unk'})
+        data = json.loads(self.cl.get('/api/v1/variant/changes',
+                                      {'since': since}).content)
+        self.assertEqual(data['variants'], ['JAK2-V617F'])
+
+    def test_variant_changes_pages(self):
+        """Test pages end with all Variants of their last revision."""
+        since = json.loads(self.cl.get(
+            '/api/v1/variant/changes').content)['latest_revision']
+        reversion.default_revision_manager.save_revision(
+            list(Variant.objects.all()), comment='Test.')
+        self.cl.post('/variant/JAK2-V617F/edit',
+                     {'review_summary': "Somatic.", 'review_long': '',
+                      'impact': 'not', 'inheritance': 'unk'})
+        views.CHANGES_LIMIT = 1
+        try:
+            data = json.loads(self.cl.get('/api/v1/variant/changes',
+                                          {'since': since}).content)
+            self.assertEqual(sorted(data['variants']),
+                             ['HBB-E7V', 'SCN5A-G615E'])
+            self.assertTrue(data['more'])
+            data = json.loads(self.cl.get(
+                '/api/v1/variant/changes',
+                {'since': data['latest_revision']}).content)
+            self.assertEqual(data['variants'], ['JAK2-V617F'])
+            self.assertFalse(data['more'])
+        finally:
+            views.CHANGES_LIMIT = 1000
+
+    def test_gene(self):
+        """Test gene data and conditional GETs."""
+        response = self.cl.get('/api/v1/gene/HBB')
+        self.assertEqual(json.loads(response.content)['ncbi_gene_id'], '3043')
+        response = self.cl.get('/api/v1/gene/HBB',
+                               HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.cl.get('/api/v1/gene/NOTAGENE')
+        self.assertEqual(response.status_code, 404)
+
+    def test_publication(self):
+        """Test publication data and conditional GETs."""
+        response = self.cl.get('/api/v1/publication/655188')
+        self.assertEqual(json.loads(response.content)['pmid'], 655188)
+        response = self.cl.get('/api/v1/publication/655188',
+                               HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.cl.get('/api/v1/publication/1')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,12 @@
+from django.conf.urls import patterns, url
+
+from . import views
+
+urlpatterns = patterns(
+    '',
+    url(r'^v1/variant/changes/?$', views.variant_changes,
+        name='variant_changes'),
+    url(r'^v1/variant/([^/]+)/?$', views.variant, name='variant'),
+    url(r'^v1/gene/([^/]+)/?$', views.gene, name='gene'),
+    url(r'^v1/publication/(\d+)/?$', views.publication, name='publication'),
+)
@@ -0,0 +1,176 @@
+"""
+=========
+API views
+=========
+
+Read-only JSON views, versioned by URL (currently /api/v1/).
+
+Views
+=====
+variant:          view returning Variant and VariantReview data
+variant_changes:  view listing Variants changed since a revision
+gene:             view returning Gene data
+publication:      view returning Publication data
+
+Responses carry strong ETags. Variant ETags are derived from the latest
+revision including the Variant and the Gene's data (see
+Variant.page_cache_key), so a conditional GET answered with 304 reads
+only the Variant, Gene and reversion tables. Gene and Publication ETags
+are a hash of the (small) response body.
+
+"""
+
+import hashlib
+import json
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Max
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         HttpResponseNotFound, HttpResponseNotModified)
+from django.utils.http import parse_etags, quote_etag
+from reversion.models import Version
+from genes.models import AmbiguousGeneAlias, Gene
+from publications.models import Publication
+from variants.models import Variant
+
+REVIEW_FIELDS = ['review_summary', 'review_long', 'impact', 'inheritance',
+                 'evidence_computational', 'evidence_functional',
+                 'evidence_casecontrol', 'evidence_familial',
+                 'clinical_severity', 'clinical_treatability',
+                 'clinical_penetrance']
+
+GENE_FIELDS = ['hgnc_symbol', 'hgnc_name', 'hgnc_id', 'ucsc_knowngene',
+               'ncbi_gene_id', 'mim_id', 'clinical_testing',
+               'acmg_recommended', 'retired']
+
+PUBLICATION_FIELDS = ['pmid', 'author_list', 'title', 'pub_date', 'journal',
+                      'journal_location', 'abstract', 'pending']
+
+# Maximum number of Variant names returned by variant_changes.
+CHANGES_LIMIT = 1000
+
+
+def _dumps(data):
+    """Return compact JSON for data."""
+    return json.dumps(data, separators=(',', ':'), sort_keys=True)
+
+
+def _not_modified(request, etag):
+    """Return True if the request's If-None-Match matches etag."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return etag in etags or '*' in etags
+
+
+def _json_response(request, etag, content):
+    """Return JSON response with ETag, or 304 if the client has it."""
+    if _not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = quote_etag(etag)
+    return response
+
+
+def variant(request, variant_pattern):
+    """Return Variant, dbSNP, VariantReview and publication data.
+
+    An alias of more than one gene gets a 404 listing the genes' symbols.
+    """
+    try:
+        variant = Variant.variant_lookup(variant_pattern)
+    except AmbiguousGeneAlias as e:
+        return HttpResponseNotFound(
+            _dumps({'error': 'ambiguous gene alias', 'alias': e.alias,
+                    'symbols': e.symbols}),
+            content_type='application/json')
+    except (AssertionError, Variant.DoesNotExist):
+        raise Http404
+    etag = hashlib.md5(variant.page_cache_key('api-v1')).hexdigest()
+    if _not_modified(request, etag):
+        return _json_response(request, etag, None)
+
+    variant = Variant.objects.with_review_bundle().get(pk=variant.pk)
+    review = variant.variantreview
+    data = {'name': variant.name,
+            'gene': variant.gene.hgnc_symbol,
+            'aa_reference': variant.aa_reference,
+            'aa_position': variant.aa_position,
+            'aa_variant': variant.aa_variant,
+            'dbsnps': sorted(dbsnp.rsid for dbsnp in variant.dbsnps.all()),
+            'revision': variant.latest_revision()[0],
+            'review': dict((field, getattr(review, field))
+                           for field in REVIEW_FIELDS),
+            'publications': sorted(
+                ({'pmid': varpubreview.publication.pmid,
+                  'summary': varpubreview.summary} for varpubreview in
+                 review.variantpublicationreview_set.all()),
+                key=lambda publication: publication['pmid']),
+            }
+    return _json_response(request, etag, _dumps(data))
+
+
+def variant_changes(request):
+    """List names of Variants changed since revision 'since'.
+
+    Returns the latest revision id, to use as 'since' when polling next,
+    and names of about CHANGES_LIMIT changed Variants. If more Variants
+    changed, 'more' is true and 'latest_revision' is the last revision
+    covered, so clients can page through by polling again. A page always
+    ends with all Variants of its last revision (one revision can cover
+    many Variants), so it can be longer than CHANGES_LIMIT.
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return HttpResponseBadRequest('since must be a revision id.')
+    versions = Version.objects.filter(
+        content_type=ContentType.objects.get_for_model(Variant),
+        revision__id__gt=since,
+        ).values('object_id_int').annotate(
+        revision=Max('revision')).order_by('revision')
+    changes = list(versions[:CHANGES_LIMIT + 1])
+    more = len(changes) > CHANGES_LIMIT
+    if more:
+        changes = changes[:CHANGES_LIMIT]
+        last_revision = changes[-1]['revision']
+        # Finish the last revision, since the next poll starts after it.
+        listed = set(change['object_id_int'] for change in changes)
+        changes.extend(change for change in
+                       versions.filter(revision=last_revision)
+                       if change['object_id_int'] not in listed)
+        more = versions.filter(revision__gt=last_revision).exists()
+    names = dict(Variant.objects.filter(
+        pk__in=[change['object_id_int'] for change in changes]
+        ).values_list('pk', 'name'))
+    data = {'since': since,
+            'latest_revision': changes[-1]['revision'] if changes else since,
+            'more': more,
+            'variants': [names[change['object_id_int']] for change in changes
+                         if change['object_id_int'] in names],
+            }
+    content = _dumps(data)
+    return _json_response(request, hashlib.md5(content).hexdigest(), content)
+
+
+def gene(request, hgnc_symbol):
+    """Return Gene data."""
+    try:
+        gene = Gene.gene_lookup(hgnc_symbol)
+    except Gene.DoesNotExist:
+        raise Http404
+    content = _dumps(dict((field, getattr(gene, field))
+                          for field in GENE_FIELDS))
+    return _json_response(request, hashlib.md5(content).hexdigest(), content)
+
+
+def publication(request, pmid):
+    """Return Publication data."""
+    try:
+        pub = Publication.pub_lookup(pmid)
+    except Publication.DoesNotExist:
+        raise Http404
+    content = _dumps(dict((field, getattr(pub, field))
+                          for field in PUBLICATION_FIELDS))
+    return _json_response(request, hashlib.md5(content).hexdigest(), content)
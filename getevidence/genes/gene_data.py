@@ -0,0 +1,308 @@
+"""
+==================
+External gene data
+==================
+
+Functions for reading the external gene data and gene alias files written
+by external_data/parse_external_data.py, and bringing Genes up to date.
+
+read_gene_data:    yields Gene fields for each row of a gene data file
+diff_gene_data:    compares gene data with Genes, returning a GeneDataDiff
+apply_gene_diff:   applies a GeneDataDiff's inserts, updates and retirements
+read_gene_aliases: yields (alias, alias type, HGNC ID) for a gene alias file
+load_gene_aliases: replaces GeneAliases with those in a gene alias file
+update_gene_registry: writes the gene registry from Genes
+
+Gene data is matched to Genes by HGNC ID, which stays the same when HGNC
+renames a gene. Genes missing from the data are retired, not deleted, so
+their Variants are kept.
+
+"""
+
+import csv
+from django.conf import settings
+from django.db import transaction
+from .models import Gene, GeneAlias, GeneVariantSummary, gene_resolver
+from .registry import write_gene_registry
+
+# Gene fields set from external gene data, in the order of the data file.
+GENE_FIELDS = ['hgnc_symbol', 'hgnc_id', 'hgnc_name', 'ucsc_knowngene',
+               'ncbi_gene_id', 'mim_id', 'clinical_testing',
+               'acmg_recommended']
+
+# Unique Gene fields that can change for an HGNC ID.
+UNIQUE_FIELDS = ['hgnc_symbol', 'ucsc_knowngene', 'ncbi_gene_id']
+
+# Number of Genes or GeneAliases created, or Genes retired, per query.
+BATCH_SIZE = 500
+
+# GeneAlias alias_type for each alias type in gene alias files.
+ALIAS_TYPES = {'previous': 'pre', 'synonym': 'syn', 'accession': 'acc'}
+
+
+def gene_data_fields(row):
+    """Return dict of Gene fields from a row of external gene data."""
+    fields = dict(zip(GENE_FIELDS, [value.decode('utf-8') for value in row]))
+    fields['clinical_testing'] = fields['clinical_testing'] == 'Y'
+    fields['acmg_recommended'] = fields['acmg_recommended'] == 'Y'
+    return fields
+
+
+def read_gene_data(gene_data_filepath):
+    """Yield dict of Gene fields for each row of a gene data file."""
+    with open(gene_data_filepath) as gene_data_file:
+        gene_data = csv.reader(gene_data_file)
+        gene_data.next()
+        for row in gene_data:
+            yield gene_data_fields(row)
+
+
+class GeneDataDiff(object):
+    """Changes needed to bring Genes up to date with external gene data.
+
+    inserts:     list of Gene fields for new Genes
+    updates:     list of (Gene ID, old fields, new fields); includes renames,
+                 and retired Genes back in the data
+    retirements: list of (Gene ID, fields) for Genes missing from the data
+    conflicts:   list of (fields, reason) for data that can't be applied
+                 because a unique value is held by another Gene
+    unchanged:   number of Genes already up to date
+
+    """
+
+    def __init__(self):
+        self.inserts = []
+        self.updates = []
+        self.retirements = []
+        self.conflicts = []
+        self.unchanged = 0
+
+    def has_changes(self):
+        return bool(self.inserts or self.updates or self.retirements)
+
+    def renames(self):
+        """Return list of (old symbol, new symbol) for renamed Genes."""
+        return [(old['hgnc_symbol'], new['hgnc_symbol'])
+                for pk, old, new in self.updates
+                if old['hgnc_symbol'] != new['hgnc_symbol']]
+
+    def counts(self):
+        return {'inserted': len(self.inserts),
+                'updated': len(self.updates),
+                'renamed': len(self.renames()),
+                'retired': len(self.retirements),
+                'conflicts': len(self.conflicts),
+                'unchanged': self.unchanged}
+
+    def report(self):
+        """Return list of lines describing changes."""
+        lines = ['%(inserted)d inserted, %(updated)d updated '
+                 '(%(renamed)d renamed), %(retired)d retired, '
+                 '%(conflicts)d conflicts, %(unchanged)d unchanged.' %
+                 self.counts()]
+        for fields in self.inserts:
+            lines.append('Inserted %s (HGNC:%s)' %
+                         (fields['hgnc_symbol'], fields['hgnc_id']))
+        for pk, old, new in self.updates:
+            changed = [field for field in GENE_FIELDS
+                       if old[field] != new[field]]
+            if old['retired']:
+                changed.append('no longer retired')
+            if old['hgnc_symbol'] != new['hgnc_symbol']:
+                lines.append('Renamed %s to %s (HGNC:%s): %s' %
+                             (old['hgnc_symbol'], new['hgnc_symbol'],
+                              new['hgnc_id'], ', '.join(changed)))
+            else:
+                lines.append('Updated %s (HGNC:%s): %s' %
+                             (new['hgnc_symbol'], new['hgnc_id'],
+                              ', '.join(changed)))
+        for pk, fields in self.retirements:
+            lines.append('Retired %s (HGNC:%s)' %
+                         (fields['hgnc_symbol'], fields['hgnc_id']))
+        for fields, reason in self.conflicts:
+            lines.append('Skipped %s (HGNC:%s): %s' %
+                         (fields['hgnc_symbol'], fields['hgnc_id'], reason))
+        return lines
+
+
+def _find_conflicts(final, changed):
+    """Return dict of reasons, keyed by HGNC ID, for changes to drop.
+
+    final maps HGNC IDs to Gene fields once changes are applied; changed
+    is the set of HGNC IDs being inserted or updated. A change conflicts
+    if one of its unique values would also be held by another Gene.
+    """
+    holders = dict()
+    for hgnc_id, fields in final.iteritems():
+        for field in UNIQUE_FIELDS:
+            holders.setdefault((field, fields[field]), []).append(hgnc_id)
+    conflicts = dict()
+    for (field, value), hgnc_ids in holders.iteritems():
+        if len(hgnc_ids) < 2:
+            continue
+        for hgnc_id in hgnc_ids:
+            if hgnc_id in changed and hgnc_id not in conflicts:
+                others = ', '.join(['HGNC:%s' % other for other in
+                                    sorted(hgnc_ids) if other != hgnc_id])
+                conflicts[hgnc_id] = '%s %s is also held by %s' % (
+                    field, value, others)
+    return conflicts
+
+
+def diff_gene_data(gene_data):
+    """Compare gene data with Genes, returning a GeneDataDiff.
+
+    gene_data is an iterable of Gene fields, e.g. from read_gene_data.
+    Genes are read in one query and joined with the data on HGNC ID.
+    """
+    existing = dict()
+    for values in Gene.objects.values_list('pk', 'retired', *GENE_FIELDS):
+        fields = dict(zip(GENE_FIELDS, values[2:]))
+        fields['retired'] = values[1]
+        existing[fields['hgnc_id']] = (values[0], fields)
+
+    new = dict()
+    final = dict()
+    changed = set()
+    diff = GeneDataDiff()
+    for fields in gene_data:
+        hgnc_id = fields['hgnc_id']
+        new[hgnc_id] = final[hgnc_id] = fields
+        if hgnc_id in existing:
+            old = existing[hgnc_id][1]
+            if not old['retired'] and all([old[field] == fields[field]
+                                           for field in GENE_FIELDS]):
+                diff.unchanged += 1
+                continue
+        changed.add(hgnc_id)
+    for hgnc_id, (pk, fields) in existing.iteritems():
+        if hgnc_id not in new:
+            final[hgnc_id] = fields
+
+    # Drop conflicting changes, keeping the Gene as it is, until none are
+    # left. Dropping a change can restore a value another change took.
+    conflicts = _find_conflicts(final, changed)
+    while conflicts:
+        for hgnc_id, reason in conflicts.iteritems():
+            diff.conflicts.append((new[hgnc_id], reason))
+            changed.discard(hgnc_id)
+            if hgnc_id in existing:
+                final[hgnc_id] = existing[hgnc_id][1]
+            else:
+                del final[hgnc_id]
+        conflicts = _find_conflicts(final, changed)
+
+    for hgnc_id in changed:
+        if hgnc_id in existing:
+            pk, old = existing[hgnc_id]
+            diff.updates.append((pk, old, new[hgnc_id]))
+        else:
+            diff.inserts.append(new[hgnc_id])
+    for hgnc_id, (pk, fields) in existing.iteritems():
+        if hgnc_id not in new and not fields['retired']:
+            diff.retirements.append((pk, fields))
+
+    diff.inserts.sort(key=lambda fields: fields['hgnc_symbol'])
+    diff.updates.sort(key=lambda update: update[2]['hgnc_symbol'])
+    diff.retirements.sort(key=lambda retirement: retirement[1]['hgnc_symbol'])
+    diff.conflicts.sort(key=lambda conflict: conflict[0]['hgnc_symbol'])
+    return diff
+
+
+def apply_gene_diff(diff, batch_size=BATCH_SIZE):
+    """Apply a GeneDataDiff's inserts, updates and retirements.
+
+    All changes are made in one transaction. Renamed Genes are saved, so
+    the names of their Variants are updated too; other changes use bulk
+    queries. New Genes get an empty GeneVariantSummary. Afterwards, the
+    Variants of updated and retired Genes are reindexed for search.
+    """
+    # Imported here: variants and search import this app's models.
+    from search.index import index_variants
+    from variants.models import Variant, variant_lookup_cache
+    with transaction.commit_on_success():
+        retired = [pk for pk, fields in diff.retirements]
+        for start in range(0, len(retired), batch_size):
+            Gene.objects.filter(
+                pk__in=retired[start:start + batch_size]).update(retired=True)
+
+        # Move changing unique values out of the way first, so Genes can
+        # swap values without a transient clash.
+        for pk, old, new in diff.updates:
+            if any([old[field] != new[field] for field in UNIQUE_FIELDS]):
+                Gene.objects.filter(pk=pk).update(**dict(
+                    [(field, '~%d' % pk) for field in UNIQUE_FIELDS]))
+        for pk, old, new in diff.updates:
+            if old['hgnc_symbol'] != new['hgnc_symbol']:
+                gene = Gene.objects.get(pk=pk)
+                for field in GENE_FIELDS:
+                    setattr(gene, field, new[field])
+                gene.retired = False
+                gene.save()
+            else:
+                Gene.objects.filter(pk=pk).update(retired=False, **new)
+
+        if diff.inserts:
+            Gene.objects.bulk_create(
+                [Gene(**fields) for fields in diff.inserts],
+                batch_size=batch_size)
+            GeneVariantSummary.create_missing(batch_size=batch_size)
+    # Bulk queries don't send post_save, which would clear these and
+    # reindex. Cached variant pages need nothing: their keys include the
+    # Gene's fields.
+    gene_resolver.clear()
+    variant_lookup_cache.clear()
+    changed = retired + [pk for pk, old, new in diff.updates]
+    for start in range(0, len(changed), batch_size):
+        index_variants(Variant.objects.filter(
+            gene__in=changed[start:start + batch_size]).values_list(
+            'pk', flat=True))
+
+
+def read_gene_aliases(gene_aliases_filepath):
+    """Yield (alias, GeneAlias alias_type, HGNC ID) for each alias in a file."""
+    with open(gene_aliases_filepath) as gene_aliases_file:
+        gene_aliases = csv.reader(gene_aliases_file)
+        gene_aliases.next()
+        for alias, alias_type, hgnc_id in gene_aliases:
+            yield alias.decode('utf-8'), ALIAS_TYPES[alias_type], hgnc_id
+
+
+def load_gene_aliases(gene_aliases_filepath, batch_size=BATCH_SIZE):
+    """Replace all GeneAliases with those in a gene alias file.
+
+    Aliases are matched to Genes by HGNC ID, in one transaction. Returns
+    dict counting 'loaded' aliases, and those 'skipped' because no Gene
+    has their HGNC ID.
+    """
+    genes = dict(Gene.objects.values_list('hgnc_id', 'pk'))
+    aliases = []
+    skipped = 0
+    for alias, alias_type, hgnc_id in read_gene_aliases(
+            gene_aliases_filepath):
+        if hgnc_id in genes:
+            aliases.append(GeneAlias(alias=alias, alias_type=alias_type,
+                                     gene_id=genes[hgnc_id]))
+        else:
+            skipped += 1
+    with transaction.commit_on_success():
+        GeneAlias.objects.all().delete()
+        GeneAlias.objects.bulk_create(aliases, batch_size=batch_size)
+    gene_resolver.clear()
+    return {'loaded': len(aliases), 'skipped': skipped}
+
+
+def update_gene_registry():
+    """Write the gene registry (settings.GENE_REGISTRY_PATH) from Genes.
+
+    Genes are read in one query. Returns the number of Genes written, or
+    None if GENE_REGISTRY_PATH isn't set.
+    """
+    path = getattr(settings, 'GENE_REGISTRY_PATH', None)
+    if not path:
+        return None
+    count = write_gene_registry(path, Gene.objects.values_list(
+        'pk', 'hgnc_symbol', 'retired', 'clinical_testing',
+        'acmg_recommended'))
+    gene_resolver.clear()
+    return count
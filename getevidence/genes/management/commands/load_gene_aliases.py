@@ -0,0 +1,35 @@
+"""Replace gene aliases with those in a gene alias file."""
+
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from ...gene_data import BATCH_SIZE, load_gene_aliases
+from ...models import gene_resolver
+
+
+class Command(BaseCommand):
+    args = '<gene_alias_file>'
+    help = ('Replaces gene aliases with those in a gene alias file (from ' +
+            'external_data/parse_external_data.py --aliases), and reports ' +
+            'ambiguous aliases')
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=BATCH_SIZE,
+                    help='Number of aliases created per query'),
+        )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Please provide path to gene alias file as ' +
+                               'an argument.')
+        try:
+            counts = load_gene_aliases(args[0],
+                                       batch_size=options['batch_size'])
+        except IOError as e:
+            raise CommandError(str(e))
+        ambiguous = gene_resolver.ambiguous()
+        self.stdout.write('Loaded %d aliases (%d skipped, for unknown genes), '
+                          '%d ambiguous.' %
+                          (counts['loaded'], counts['skipped'],
+                           len(ambiguous)))
+        for alias in sorted(ambiguous):
+            self.stdout.write('%s: %s' % (alias, ', '.join(ambiguous[alias])))
@@ -0,0 +1,52 @@
+"""Recompute every Gene's GeneVariantSummary from VariantReviews."""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from variants.models import VariantReview
+from ...gene_data import BATCH_SIZE
+from ...models import Gene, GeneVariantSummary
+
+
+def rebuild_gene_summaries(batch_size=BATCH_SIZE):
+    """Replace all GeneVariantSummaries, returning how many have Variants.
+
+    VariantReviews are aggregated per Gene in two queries, and summaries
+    replaced in one transaction.
+    """
+    summaries = dict([(gene_id, GeneVariantSummary(gene_id=gene_id))
+                      for gene_id in Gene.objects.values_list('pk',
+                                                              flat=True)])
+    for values in VariantReview.objects.values(
+            'variant__gene', 'impact').annotate(
+            reviews=Count('pk')).order_by():
+        summary = summaries[values['variant__gene']]
+        field = GeneVariantSummary.IMPACT_FIELDS[values['impact']]
+        setattr(summary, field, values['reviews'])
+        summary.variant_count += values['reviews']
+    aggregates = dict()
+    for field in GeneVariantSummary.EVIDENCE_FIELDS:
+        aggregates[field + '_total'] = Sum(field)
+        aggregates[field + '_count'] = Count(field)
+    for values in VariantReview.objects.values('variant__gene').annotate(
+            **aggregates).order_by():
+        summary = summaries[values['variant__gene']]
+        for field in aggregates:
+            setattr(summary, field, values[field] or 0)
+
+    with transaction.commit_on_success():
+        GeneVariantSummary.objects.all().delete()
+        GeneVariantSummary.objects.bulk_create(summaries.values(),
+                                               batch_size=batch_size)
+    return len([summary for summary in summaries.itervalues()
+                if summary.variant_count])
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the variant counts and evidence scores shown on ' +
+            'gene pages from variant reviews')
+
+    def handle(self, *args, **options):
+        with_variants = rebuild_gene_summaries()
+        self.stdout.write('Rebuilt summaries of %d genes (%d with '
+                          'variants).' % (Gene.objects.count(), with_variants))
@@ -0,0 +1,51 @@
+"""Bring Genes up to date with external gene data, reporting changes."""
+
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from ...gene_data import (BATCH_SIZE, apply_gene_diff, diff_gene_data,
+                          read_gene_data, update_gene_registry)
+
+
+def refresh_gene_data(gene_data_filepath, dry_run=False,
+                      batch_size=BATCH_SIZE):
+    """Apply changes in a gene data file to Genes, returning the diff.
+
+    The gene registry is written afterwards, unless this is a dry run.
+    """
+    diff = diff_gene_data(read_gene_data(gene_data_filepath))
+    if not dry_run:
+        if diff.has_changes():
+            apply_gene_diff(diff, batch_size=batch_size)
+        update_gene_registry()
+    return diff
+
+
+class Command(BaseCommand):
+    args = '<gene_data_file>'
+    help = ('Inserts, updates and retires Genes to match a gene data file ' +
+            '(from external_data/parse_external_data.py)')
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    default=False,
+                    help='Report changes without applying them'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=BATCH_SIZE,
+                    help='Number of genes created or retired per query'),
+        )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Please provide path to external gene data ' +
+                               'file as an argument.')
+        start = time.time()
+        try:
+            diff = refresh_gene_data(args[0], dry_run=options['dry_run'],
+                                     batch_size=options['batch_size'])
+        except IOError as e:
+            raise CommandError(str(e))
+        for line in diff.report():
+            self.stdout.write(line)
+        self.stdout.write('%s in %.1fs.' %
+                          ('Checked' if options['dry_run'] else 'Refreshed',
+                           time.time() - start))
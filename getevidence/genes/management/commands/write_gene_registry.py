@@ -0,0 +1,18 @@
+"""Write the gene registry from Genes."""
+
+from django.core.management.base import BaseCommand, CommandError
+from ...gene_data import update_gene_registry
+
+
+class Command(BaseCommand):
+    help = ('Writes the gene registry (settings.GENE_REGISTRY_PATH), a ' +
+            'memory-mapped snapshot of Genes used to check gene symbols')
+
+    def handle(self, *args, **options):
+        try:
+            count = update_gene_registry()
+        except (IOError, OSError) as e:
+            raise CommandError(str(e))
+        if count is None:
+            raise CommandError('GENE_REGISTRY_PATH is not set.')
+        self.stdout.write('Wrote %d genes to the gene registry.' % count)
@@ -6,17 +6,33 @@ Gene models
 Functions
 =========
 
-gene_lookup(variant_string): Returns Gene object matching gene symbol
+gene_lookup(variant_string): Returns Gene object matching gene symbol or alias
 
 
 Models
 ======
 
-Gene: Contains non-user-editable gene data.
+Gene:      Contains non-user-editable gene data.
+GeneAlias: Previous symbol, synonym or accession number of a Gene.
+GeneVariantSummary: Counts and mean evidence scores of a Gene's Variants.
+
+
+Resolver
+========
+
+GeneResolver: Process-local map of gene symbols and aliases to current
+              HGNC symbols, shared as gene_resolver. Backed by the gene
+              registry (registry.py) when there is one.
+AmbiguousGeneAlias: Raised when an alias belongs to more than one Gene.
 
 """
 
+import threading
+from django.conf import settings
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from .registry import GeneRegistry, RETIRED
 
 
 class Gene(models.Model):
@@ -38,6 +54,9 @@ class Gene(models.Model):
     mim_id:           MIM (Mendelian Inheritance in Man) ID (CharField)
     clinical_testing: Listed in NCBI's Genetic Testing Registry (BooleanField)
     acmg_recommended: In ACMG's 2013 return of data guidelines (BooleanField)
+    retired:          No longer in external gene data (BooleanField). Retired
+                      Genes are kept for their Variants, but new Variants
+                      can't be added to them.
 
     """
 
@@ -60,12 +79,368 @@ class Gene(models.Model):
                               max_length=6,)
     clinical_testing = models.BooleanField(default=False)
     acmg_recommended = models.BooleanField(default=False)
+    retired = models.BooleanField(default=False)
 
     def __unicode__(self):
         return self.hgnc_symbol
 
     @classmethod
     def gene_lookup(cls, gene_name):
-        """Find and return Gene in database matching identifying string."""
-        gene_match = cls.objects.get(hgnc_symbol__exact=gene_name)
+        """Find and return Gene in database matching identifying string.
+
+        The string may be a current symbol or an alias. Raises
+        AmbiguousGeneAlias (a Gene.DoesNotExist) for an alias of more than
+        one Gene.
+        """
+        gene_match = cls.objects.get(pk=gene_resolver.gene_id(gene_name))
         return gene_match
+
+
+class GeneAlias(models.Model):
+    """Previous symbol, synonym or accession number of a Gene, from HGNC.
+
+    gene:       Gene the alias refers to (ForeignKey)
+    alias:      Alias (CharField)
+    alias_type: Kind of alias (CharField, choices in ALIAS_TYPE_CHOICES)
+
+    The same alias can belong to more than one Gene.
+    """
+
+    ALIAS_TYPE_CHOICES = (
+        ('pre', 'previous symbol'),
+        ('syn', 'synonym'),
+        ('acc', 'accession number'),
+    )
+
+    gene = models.ForeignKey(Gene, related_name='aliases')
+    alias = models.CharField(max_length=40, db_index=True)
+    alias_type = models.CharField(max_length=3, choices=ALIAS_TYPE_CHOICES)
+
+    class Meta:
+        unique_together = ('alias', 'gene', 'alias_type')
+
+    def __unicode__(self):
+        return self.alias
+
+
+class GeneVariantSummary(models.Model):
+    """Counts and evidence scores of a Gene's Variants, kept up to date.
+
+    Every Gene has one, so gene pages and the gene listing don't aggregate
+    over Variants. variants.models applies the change each VariantReview
+    save or delete makes (each Variant has one VariantReview), and
+    rebuild_gene_summaries recomputes them all.
+
+    gene:               Gene summarized (OneToOneField, primary key)
+    variant_count:      number of Variants (IntegerField)
+    benign_count, pathogenic_count, pharmacogenetic_count, protective_count,
+    not_reviewed_count: number of Variants reviewed with each impact
+                        (IntegerField)
+    <score>_total:      sum of each VariantReview evidence score, where set
+                        (IntegerField)
+    <score>_count:      number of Variants with each evidence score set
+                        (IntegerField)
+
+    """
+
+    # Count field for each VariantReview impact.
+    IMPACT_FIELDS = {'ben': 'benign_count',
+                     'pat': 'pathogenic_count',
+                     'pha': 'pharmacogenetic_count',
+                     'pro': 'protective_count',
+                     'not': 'not_reviewed_count'}
+
+    # VariantReview evidence scores, averaged per Gene.
+    EVIDENCE_FIELDS = ['evidence_computational', 'evidence_functional',
+                       'evidence_casecontrol', 'evidence_familial']
+
+    # Number of Genes listed per page of the gene listing.
+    LIST_PAGE_SIZE = 100
+
+    gene = models.OneToOneField(Gene, primary_key=True,
+                                related_name='variant_summary')
+    variant_count = models.IntegerField(default=0)
+    benign_count = models.IntegerField(default=0)
+    pathogenic_count = models.IntegerField(default=0)
+    pharmacogenetic_count = models.IntegerField(default=0)
+    protective_count = models.IntegerField(default=0)
+    not_reviewed_count = models.IntegerField(default=0)
+    evidence_computational_total = models.IntegerField(default=0)
+    evidence_computational_count = models.IntegerField(default=0)
+    evidence_functional_total = models.IntegerField(default=0)
+    evidence_functional_count = models.IntegerField(default=0)
+    evidence_casecontrol_total = models.IntegerField(default=0)
+    evidence_casecontrol_count = models.IntegerField(default=0)
+    evidence_familial_total = models.IntegerField(default=0)
+    evidence_familial_count = models.IntegerField(default=0)
+
+    class Meta:
+        # The gene listing reads this index in order.
+        index_together = [['pathogenic_count', 'gene']]
+
+    def __unicode__(self):
+        return unicode(self.gene_id)
+
+    @classmethod
+    def review_counts(cls, impact, scores):
+        """Return dict of what one VariantReview adds to summary fields.
+
+        scores are the review's evidence scores, in EVIDENCE_FIELDS order.
+        """
+        counts = {'variant_count': 1, cls.IMPACT_FIELDS[impact]: 1}
+        for field, score in zip(cls.EVIDENCE_FIELDS, scores):
+            if score is not None:
+                counts[field + '_total'] = score
+                counts[field + '_count'] = 1
+        return counts
+
+    @classmethod
+    def add_counts(cls, gene_id, old=None, new=None):
+        """Change a Gene's summary from old review counts to new ones.
+
+        old and new are dicts from review_counts, or None for a review
+        created or deleted. Applied in one UPDATE, with no query if
+        nothing summarized changed.
+        """
+        changes = dict()
+        for field, value in (new or {}).iteritems():
+            changes[field] = changes.get(field, 0) + value
+        for field, value in (old or {}).iteritems():
+            changes[field] = changes.get(field, 0) - value
+        changes = dict([(field, F(field) + value)
+                        for field, value in changes.iteritems() if value])
+        if gene_id is None or not changes:
+            return
+        if not cls.objects.filter(gene=gene_id).update(**changes):
+            # Genes from before summaries existed get complete ones from
+            # rebuild_gene_summaries.
+            cls.objects.create(gene_id=gene_id)
+            cls.objects.filter(gene=gene_id).update(**changes)
+
+    @classmethod
+    def create_missing(cls, batch_size=500):
+        """Create empty summaries for Genes without one, returning how many.
+
+        For Genes created in bulk, which don't send post_save.
+        """
+        gene_ids = Gene.objects.filter(
+            variant_summary__isnull=True).values_list('pk', flat=True)
+        summaries = [cls(gene_id=gene_id) for gene_id in gene_ids]
+        cls.objects.bulk_create(summaries, batch_size=batch_size)
+        return len(summaries)
+
+    @classmethod
+    def list_page(cls, after=None, page_size=None):
+        """Return one page of summaries, most pathogenic Variants first.
+
+        Genes with the same number of pathogenic Variants are ordered by
+        descending Gene ID, so each page is read from the index on
+        (pathogenic_count, gene) in one query, with the Gene joined. Pages
+        are found by keyset: 'after' is the cursor returned for the
+        previous page.
+
+        Returns a tuple of (list of GeneVariantSummaries, cursor for next
+        page or None).
+        """
+        page_size = page_size or cls.LIST_PAGE_SIZE
+        summaries = cls.objects.select_related('gene').order_by(
+            '-pathogenic_count', '-pk')
+        if after:
+            pathogenic_count, gene_id = [int(value) for value in
+                                         after.split('-')]
+            summaries = summaries.filter(
+                pathogenic_count__lte=pathogenic_count).exclude(
+                pathogenic_count=pathogenic_count, pk__gte=gene_id)
+        # Fetch one extra row to learn whether another page follows.
+        summary_list = list(summaries[:page_size + 1])
+        if len(summary_list) > page_size:
+            summary_list = summary_list[:page_size]
+            last = summary_list[-1]
+            return summary_list, '%d-%d' % (last.pathogenic_count,
+                                            last.gene_id)
+        return summary_list, None
+
+    def evidence_means(self):
+        """Return list of (score name, mean score or None) for each score.
+
+        Score names drop the 'evidence_' prefix, e.g. 'functional'.
+        """
+        means = []
+        for field in self.EVIDENCE_FIELDS:
+            count = getattr(self, field + '_count')
+            total = getattr(self, field + '_total')
+            means.append((field[len('evidence_'):],
+                          float(total) / count if count else None))
+        return means
+
+
+class AmbiguousGeneAlias(Gene.DoesNotExist):
+    """Raised when resolving an alias belonging to more than one Gene.
+
+    alias:   The alias (string)
+    symbols: Sorted list of the current symbols of Genes with the alias
+    """
+
+    def __init__(self, alias, symbols):
+        self.alias = alias
+        self.symbols = symbols
+        super(AmbiguousGeneAlias, self).__init__(
+            'Gene alias "%s" is ambiguous: %s' % (alias, ', '.join(symbols)))
+
+
+class GeneResolver(object):
+    """Process-local map of gene symbols and aliases to current symbols.
+
+    If settings.GENE_REGISTRY_PATH names a gene registry file (see
+    registry.py), current symbols are looked up there, with no query, and
+    aliases are read in one query the first time a name isn't a current
+    symbol. The file is mapped again when an import replaces it. Without a
+    registry, all current symbols and aliases are read in two queries the
+    first time a name is resolved. Later lookups need no queries.
+
+    Signal receivers clear the map when a Gene or GeneAlias is saved or
+    deleted; bulk updates call clear() themselves. The registry this
+    process mapped is then ignored until its file is replaced. Names not
+    found are checked in the database, in case another process added the
+    Gene.
+
+    Data attributes:
+    loads: number of times the map has been read from the database (int)
+
+    """
+
+    def __init__(self):
+        self.loads = 0
+        self._lock = threading.Lock()
+        self._symbols = None
+        self._aliases = None
+        self._registry = None
+        self._stale_registry = None
+
+    def _get_registry(self):
+        """Return the current GeneRegistry, or None to use the database."""
+        path = getattr(settings, 'GENE_REGISTRY_PATH', None)
+        if not path:
+            return None
+        with self._lock:
+            registry = self._registry
+            if (registry is None or registry.path != path or
+                    not registry.is_current()):
+                # Processes still reading an old mapping keep it open;
+                # it's unmapped once garbage collected.
+                try:
+                    registry = GeneRegistry(path)
+                except (IOError, OSError):
+                    registry = None
+                self._registry = registry
+            if registry is None or registry.identity == self._stale_registry:
+                return None
+            return registry
+
+    def _load(self, registry=None):
+        """Return (symbols, aliases), reading them if needed.
+
+        symbols maps current symbols to (Gene ID, retired), and is only
+        read without a registry; aliases maps aliases to sets of symbols.
+        """
+        with self._lock:
+            if self._aliases is None or (registry is None and
+                                         self._symbols is None):
+                if registry is None:
+                    self._symbols = dict(
+                        (symbol, (pk, retired)) for pk, symbol, retired in
+                        Gene.objects.values_list('pk', 'hgnc_symbol',
+                                                 'retired'))
+                aliases = dict()
+                for alias, symbol in GeneAlias.objects.values_list(
+                        'alias', 'gene__hgnc_symbol'):
+                    aliases.setdefault(alias, set()).add(symbol)
+                self._aliases = aliases
+                self.loads += 1
+            return self._symbols, self._aliases
+
+    def _symbol(self, name):
+        """Return ((Gene ID, retired) or None, registry) for a symbol."""
+        registry = self._get_registry()
+        if registry is not None:
+            found = registry.lookup(name)
+            if found is None:
+                return None, registry
+            return (found[0], bool(found[1] & RETIRED)), registry
+        symbols, aliases = self._load()
+        return symbols.get(name), None
+
+    def resolve(self, name, check_database=True):
+        """Return current HGNC symbol of the Gene with a symbol or alias.
+
+        Current symbols are preferred to aliases. Raises AmbiguousGeneAlias
+        if an alias belongs to several Genes, or Gene.DoesNotExist if no
+        Gene has the name. With check_database=False, names not in the map
+        aren't looked for in the database.
+        """
+        found, registry = self._symbol(name)
+        if found is not None:
+            return name
+        symbols, aliases = self._load(registry)
+        if name in aliases:
+            if len(aliases[name]) > 1:
+                raise AmbiguousGeneAlias(name, sorted(aliases[name]))
+            return iter(aliases[name]).next()
+        if (check_database and
+                Gene.objects.filter(hgnc_symbol=name).exists()):
+            self.clear()
+            return name
+        raise Gene.DoesNotExist('No gene with symbol or alias "%s".' % name)
+
+    def gene_id(self, name):
+        """Return ID of the Gene with a symbol or alias; see resolve."""
+        symbol = self.resolve(name)
+        found, registry = self._symbol(symbol)
+        if found is not None:
+            return found[0]
+        return Gene.objects.get(hgnc_symbol=symbol).pk
+
+    def is_retired(self, symbol):
+        """Return whether the Gene with a current symbol is retired."""
+        found, registry = self._symbol(symbol)
+        if found is not None:
+            return found[1]
+        return Gene.objects.get(hgnc_symbol=symbol).retired
+
+    def ambiguous(self):
+        """Return dict of ambiguous aliases to sorted lists of symbols."""
+        registry = self._get_registry()
+        symbols, aliases = self._load(registry)
+        return dict((alias, sorted(alias_symbols)) for alias, alias_symbols
+                    in aliases.iteritems()
+                    if len(alias_symbols) > 1 and
+                    self._symbol(alias)[0] is None)
+
+    def clear(self):
+        """Drop the map, to be read again on next use."""
+        with self._lock:
+            self._symbols = None
+            self._aliases = None
+            if self._registry is not None:
+                self._stale_registry = self._registry.identity
+
+
+gene_resolver = GeneResolver()
+
+
+def _create_variant_summary(sender, instance, created, **kwargs):
+    """Create a new Gene's GeneVariantSummary."""
+    if created:
+        GeneVariantSummary.objects.create(gene=instance)
+
+
+def _clear_gene_resolver(sender, instance, **kwargs):
+    """Clear gene_resolver when a Gene or GeneAlias is saved or deleted."""
+    gene_resolver.clear()
+
+
+post_save.connect(_create_variant_summary, sender=Gene)
+post_save.connect(_clear_gene_resolver, sender=Gene)
+post_delete.connect(_clear_gene_resolver, sender=Gene)
+post_save.connect(_clear_gene_resolver, sender=GeneAlias)
+post_delete.connect(_clear_gene_resolver, sender=GeneAlias)
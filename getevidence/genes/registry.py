@@ -0,0 +1,133 @@
+"""
+=============
+Gene registry
+=============
+
+A compact, read-only binary snapshot of the Gene table, so gene symbols
+can be checked and resolved to Gene IDs without a database query. Genes
+only change when external gene data is imported, and the import commands
+write the snapshot (to settings.GENE_REGISTRY_PATH, with
+gene_data.update_gene_registry) when they finish. Each process
+memory-maps it read-only, so worker processes share pages instead of each
+holding a copy.
+
+write_gene_registry: Writes a snapshot of genes to a file
+GeneRegistry:        Memory-mapped snapshot, searched by symbol
+
+File layout (little-endian):
+header:   magic (8 bytes), number of genes (uint32), size of symbols (uint32)
+index:    per gene, sorted by symbol: symbol offset (uint32), symbol length
+          (uint16), flags (uint16), Gene ID (uint32)
+symbols:  UTF-8 symbols, one after another
+
+"""
+
+import mmap
+import os
+import struct
+
+MAGIC = 'GEREG001'
+HEADER = struct.Struct('<8sII')
+ENTRY = struct.Struct('<IHHI')
+
+# Flags recorded for each gene.
+RETIRED = 1
+CLINICAL_TESTING = 2
+ACMG_RECOMMENDED = 4
+
+
+def write_gene_registry(path, genes):
+    """Write a snapshot of genes to a file, returning the number of genes.
+
+    genes is an iterable of (Gene ID, symbol, retired, clinical_testing,
+    acmg_recommended). The file is replaced atomically, so processes that
+    have mapped the old file keep reading it unharmed.
+    """
+    entries = []
+    for pk, symbol, retired, clinical_testing, acmg_recommended in genes:
+        flags = ((RETIRED if retired else 0) |
+                 (CLINICAL_TESTING if clinical_testing else 0) |
+                 (ACMG_RECOMMENDED if acmg_recommended else 0))
+        entries.append((symbol.encode('utf-8'), flags, pk))
+    entries.sort()
+
+    index = []
+    symbols = []
+    offset = 0
+    for symbol, flags, pk in entries:
+        index.append(ENTRY.pack(offset, len(symbol), flags, pk))
+        symbols.append(symbol)
+        offset += len(symbol)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as registry_file:
+        registry_file.write(HEADER.pack(MAGIC, len(entries), offset))
+        registry_file.write(''.join(index))
+        registry_file.write(''.join(symbols))
+    os.rename(temp_path, path)
+    return len(entries)
+
+
+class GeneRegistry(object):
+    """Memory-mapped, read-only snapshot of the Gene table.
+
+    lookup(symbol) binary searches the sorted index, so it reads only a
+    few pages of the file. Raises IOError if the file isn't a registry.
+
+    path:     Path of the registry file
+    identity: (inode, modification time, size) of the file when mapped
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as registry_file:
+            stat = os.fstat(registry_file.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime, stat.st_size)
+            if stat.st_size < HEADER.size:
+                raise IOError('Not a gene registry: %s' % path)
+            self._map = mmap.mmap(registry_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        magic, self._count, symbols_size = HEADER.unpack_from(self._map, 0)
+        self._symbols_start = HEADER.size + self._count * ENTRY.size
+        if (magic != MAGIC or
+                self._symbols_start + symbols_size != stat.st_size):
+            self._map.close()
+            raise IOError('Not a gene registry: %s' % path)
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, position):
+        offset, length, flags, pk = ENTRY.unpack_from(
+            self._map, HEADER.size + position * ENTRY.size)
+        start = self._symbols_start + offset
+        return self._map[start:start + length], flags, pk
+
+    def lookup(self, symbol):
+        """Return (Gene ID, flags) for a gene symbol, or None."""
+        key = symbol.encode('utf-8') if isinstance(symbol, unicode) else symbol
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry_symbol, flags, pk = self._entry(middle)
+            if entry_symbol < key:
+                low = middle + 1
+            elif entry_symbol > key:
+                high = middle
+            else:
+                return pk, flags
+        return None
+
+    def is_current(self):
+        """Return whether the file hasn't been replaced since mapped."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_mtime, stat.st_size) == self.identity
+
+    def close(self):
+        self._map.close()
@@ -1,2 +1,4 @@
+from test_gene_data import *
 from test_models import *
+from test_registry import *
 from test_views import *
@@ -0,0 +1,133 @@
+"""
+Tests gene_data.py in genes app.
+"""
+
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from django.test import TestCase
+from variants.forms import NewVariantForm
+from search.index import SearchResults
+from variants.models import Variant, variant_lookup_cache
+from ..gene_data import load_gene_aliases
+from ..management.commands.refresh_gene_data import refresh_gene_data
+from ..models import Gene, GeneAlias, gene_resolver
+
+MINI_DATA = settings.SITE_ROOT + '/../external_data/getevidence_external_gene_data_mini.csv'
+MINI_ALIASES = settings.SITE_ROOT + '/../external_data/getevidence_external_gene_aliases_mini.csv'
+
+
+class GenesGeneDataTest(TestCase):
+    """Tests differential refreshes of Genes from external gene data."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        refresh_gene_data(MINI_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write_gene_data(self, replacements, extra=''):
+        """Write a copy of the mini gene data with changes."""
+        with open(MINI_DATA) as mini_data:
+            data = mini_data.read()
+        for old, new in replacements:
+            data = data.replace(old, new)
+        path = os.path.join(self.tempdir, 'genes.csv')
+        with open(path, 'w') as gene_data:
+            gene_data.write(data + extra)
+        return path
+
+    def test_unchanged(self):
+        """Test refreshing unchanged data reads Genes in one query."""
+        self.assertEqual(Gene.objects.count(), 4)
+        with self.assertNumQueries(1):
+            diff = refresh_gene_data(MINI_DATA)
+        self.assertFalse(diff.has_changes())
+        self.assertEqual(diff.unchanged, 4)
+
+    def test_refresh(self):
+        """Test inserts, updates, renames and retirements."""
+        Variant.create(gene_name='HFE', aa_ref='C', aa_pos=282, aa_var='Y')
+        path = self.write_gene_data(
+            [('HFE,', 'HFE1,'),
+             ('Janus kinase 2', 'Janus kinase 2 (new)'),
+             # Swap transcripts, which must be unique.
+             ('uc001mae.1', 'uc00XXXX'), ('uc003ziw.3', 'uc001mae.1'),
+             ('uc00XXXX', 'uc003ziw.3'),
+             ('SCN5A,10593,"sodium channel, voltage-gated, type V, alpha ' +
+              'subunit",uc021wvl.1,6331,600163,Y,Y\n', '')],
+            extra='TP53,11998,tumor protein p53,uc002gim.2,7157,191170,Y,\n')
+        diff = refresh_gene_data(path)
+        self.assertEqual(diff.counts(), {'inserted': 1, 'updated': 3,
+                                         'renamed': 1, 'retired': 1,
+                                         'conflicts': 0, 'unchanged': 0})
+        self.assertEqual(diff.renames(), [('HFE', 'HFE1')])
+        self.assertTrue('Renamed HFE to HFE1 (HGNC:4886): hgnc_symbol' in
+                        diff.report())
+        self.assertEqual(Gene.objects.get(hgnc_id='4886').hgnc_symbol, 'HFE1')
+        self.assertEqual(Variant.variant_lookup('HFE1-C282Y').gene.hgnc_id,
+                         '4886')
+        self.assertEqual(Gene.objects.get(hgnc_symbol='HBB').ucsc_knowngene,
+                         'uc003ziw.3')
+        self.assertEqual(Gene.objects.get(hgnc_symbol='JAK2').hgnc_name,
+                         'Janus kinase 2 (new)')
+        self.assertTrue(Gene.objects.get(hgnc_symbol='SCN5A').retired)
+        self.assertEqual(Gene.objects.get(hgnc_symbol='TP53').mim_id, '191170')
+        form = NewVariantForm({'gene': 'SCN5A', 'aa_reference': 'G',
+                               'aa_position': '615', 'aa_variant': 'E'})
+        self.assertFalse(form.is_valid())
+        self.assertTrue('retired' in form.errors['gene'][0])
+
+        # Refreshing again changes nothing; restoring the old data brings
+        # retired Genes back.
+        self.assertFalse(refresh_gene_data(path).has_changes())
+        diff = refresh_gene_data(MINI_DATA)
+        self.assertEqual(diff.counts()['retired'], 1)
+        self.assertFalse(Gene.objects.get(hgnc_symbol='SCN5A').retired)
+        self.assertTrue(Gene.objects.get(hgnc_symbol='TP53').retired)
+
+    def test_refresh_variants(self):
+        """Test bulk updates reach variant lookups and the search index."""
+        Variant.create(gene_name='JAK2', aa_ref='V', aa_pos=617, aa_var='F')
+        Variant.variant_lookup('JAK2-V617F')
+        self.assertNotEqual(variant_lookup_cache.get('JAK2-V617F'), None)
+        self.assertEqual(SearchResults('janus').count(), 1)
+        refresh_gene_data(self.write_gene_data(
+            [('Janus kinase 2', 'Tyrosine-protein kinase')]))
+        self.assertEqual(variant_lookup_cache.get('JAK2-V617F'), None)
+        self.assertEqual(SearchResults('janus').count(), 0)
+        self.assertEqual([variant.name for variant in
+                          SearchResults('tyrosine kinase')], ['JAK2-V617F'])
+
+    def test_conflict(self):
+        """Test changes clashing with a unique value are skipped."""
+        path = self.write_gene_data(
+            [('SCN5A,10593,"sodium channel, voltage-gated, type V, alpha ' +
+              'subunit",uc021wvl.1,6331,600163,Y,Y\n', '')],
+            extra='SCN5B,10594,sodium channel beta,uc001pwz.3,6331,,,\n')
+        diff = refresh_gene_data(path, dry_run=True)
+        self.assertEqual(diff.counts()['conflicts'], 1)
+        self.assertEqual(diff.conflicts[0][1],
+                         'ncbi_gene_id 6331 is also held by HGNC:10593')
+        self.assertFalse(Gene.objects.get(hgnc_symbol='SCN5A').retired)
+        refresh_gene_data(path)
+        self.assertTrue(Gene.objects.get(hgnc_symbol='SCN5A').retired)
+        self.assertFalse(Gene.objects.filter(hgnc_symbol='SCN5B').exists())
+
+    def test_load_gene_aliases(self):
+        """Test gene aliases replace those loaded before."""
+        GeneAlias.objects.create(gene=Gene.objects.get(hgnc_symbol='HBB'),
+                                 alias='OLD', alias_type='syn')
+        path = os.path.join(self.tempdir, 'aliases.csv')
+        with open(MINI_ALIASES) as mini_aliases:
+            data = mini_aliases.read()
+        with open(path, 'w') as aliases:
+            aliases.write(data + 'HFE1,synonym,6192\nTP53,synonym,11998\n')
+        self.assertEqual(load_gene_aliases(path),
+                         {'loaded': 5, 'skipped': 1})
+        self.assertFalse(GeneAlias.objects.filter(alias='OLD').exists())
+        self.assertEqual(gene_resolver.resolve('HLA-H'), 'HFE')
+        self.assertEqual(gene_resolver.resolve('LQT3'), 'SCN5A')
+        self.assertEqual(gene_resolver.ambiguous(), {'HFE1': ['HFE', 'JAK2']})
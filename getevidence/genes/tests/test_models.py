@@ -2,8 +2,12 @@
 Tests models.py in genes app.
 """
 
+import reversion
 from django.test import TestCase
-from ..models import Gene
+from variants.models import Variant
+from ..management.commands.rebuild_gene_summaries import rebuild_gene_summaries
+from ..models import (AmbiguousGeneAlias, Gene, GeneAlias, GeneVariantSummary,
+                      gene_resolver)
 
 class GenesModelsTest(TestCase):
     """Tests models in models.py"""
@@ -28,3 +32,90 @@ class GenesModelsTest(TestCase):
     def test_Gene_delete_with_HBB(self):
         """Tests Gene deletion."""
         Gene.objects.get(hgnc_symbol='HBB').delete()
+
+    def test_gene_resolver(self):
+        """Tests resolving symbols and aliases with gene_resolver."""
+        hbb = Gene.objects.get(hgnc_symbol='HBB')
+        hbd = Gene.objects.create(hgnc_symbol='HBD', hgnc_id='4829',
+                                  ucsc_knowngene='uc001maa.1',
+                                  ncbi_gene_id='3045')
+        GeneAlias.objects.create(gene=hbb, alias='CD113t-C', alias_type='syn')
+        GeneAlias.objects.create(gene=hbb, alias='HBX', alias_type='pre')
+        GeneAlias.objects.create(gene=hbd, alias='HBX', alias_type='syn')
+        GeneAlias.objects.create(gene=hbd, alias='HBB', alias_type='syn')
+        gene_resolver.resolve('HBB')
+        loads = gene_resolver.loads
+        with self.assertNumQueries(0):
+            self.assertEqual(gene_resolver.resolve('CD113t-C'), 'HBB')
+            # Current symbols win over aliases of other genes.
+            self.assertEqual(gene_resolver.resolve('HBB'), 'HBB')
+            self.assertEqual(gene_resolver.ambiguous(),
+                             {'HBX': ['HBB', 'HBD']})
+        try:
+            gene_resolver.resolve('HBX')
+            self.fail('Ambiguous alias resolved.')
+        except AmbiguousGeneAlias as e:
+            self.assertEqual(e.symbols, ['HBB', 'HBD'])
+        self.assertRaises(Gene.DoesNotExist, gene_resolver.resolve, 'HBQ')
+        self.assertEqual(Gene.gene_lookup('CD113t-C'), hbb)
+        self.assertEqual(gene_resolver.loads, loads)
+
+        # Saving a Gene drops the map, so it's read again.
+        Gene.objects.create(hgnc_symbol='HBQ1', hgnc_id='4833',
+                            ucsc_knowngene='uc002cgk.3', ncbi_gene_id='3049')
+        self.assertEqual(gene_resolver.resolve('HBQ1'), 'HBQ1')
+        self.assertEqual(gene_resolver.loads, loads + 1)
+
+    def test_gene_variant_summary(self):
+        """Tests GeneVariantSummary follows VariantReview changes."""
+        hbb = Gene.objects.get(hgnc_symbol='HBB')
+        summary = lambda: GeneVariantSummary.objects.get(gene=hbb)
+        self.assertEqual(summary().variant_count, 0)
+        e7v = Variant.create(gene_name='HBB', aa_ref='E', aa_pos=7, aa_var='V')
+        e7k = Variant.create(gene_name='HBB', aa_ref='E', aa_pos=7, aa_var='K')
+        self.assertEqual(summary().variant_count, 2)
+        self.assertEqual(summary().not_reviewed_count, 2)
+
+        review = e7v.variantreview
+        with reversion.create_revision():
+            review.impact = 'pat'
+            review.evidence_functional = 3
+            review.save()
+        other_review = e7k.variantreview
+        other_review.impact = 'pat'
+        other_review.evidence_functional = 4
+        other_review.evidence_familial = -1
+        other_review.save()
+        self.assertEqual(summary().pathogenic_count, 2)
+        self.assertEqual(summary().not_reviewed_count, 0)
+        self.assertEqual(summary().evidence_means(),
+                         [('computational', None), ('functional', 3.5),
+                          ('casecontrol', None), ('familial', -1.0)])
+
+        # Changes to fields not summarized don't update it.
+        counts = GeneVariantSummary.review_counts('pat', [None, 3, None, None])
+        with self.assertNumQueries(0):
+            GeneVariantSummary.add_counts(hbb.pk, old=counts, new=counts)
+
+        # Reverting a revision is summarized like any other change.
+        with reversion.create_revision():
+            review.impact = 'ben'
+            review.evidence_functional = None
+            review.save()
+        self.assertEqual(summary().benign_count, 1)
+        self.assertEqual(summary().evidence_means()[1], ('functional', 4.0))
+        review.history()[1].revert()
+        self.assertEqual(summary().benign_count, 0)
+        self.assertEqual(summary().pathogenic_count, 2)
+        self.assertEqual(summary().evidence_means()[1], ('functional', 3.5))
+
+        Variant.remove(e7k)
+        self.assertEqual(summary().variant_count, 1)
+        self.assertEqual(summary().evidence_means()[3], ('familial', None))
+
+        # Rebuilding gives the same summaries.
+        fields = [field.name for field in GeneVariantSummary._meta.fields]
+        expected = list(GeneVariantSummary.objects.values_list(*fields))
+        self.assertEqual(rebuild_gene_summaries(), 1)
+        self.assertEqual(list(GeneVariantSummary.objects.values_list(*fields)),
+                         expected)
@@ -0,0 +1,124 @@
+"""
+Tests registry.py in genes app, and gene_resolver's use of it.
+"""
+
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+from variants.forms import NewVariantForm
+from ..gene_data import load_gene_aliases, update_gene_registry
+from ..management.commands.refresh_gene_data import refresh_gene_data
+from ..models import Gene, gene_resolver
+from ..registry import (ACMG_RECOMMENDED, CLINICAL_TESTING, RETIRED,
+                        GeneRegistry, write_gene_registry)
+
+MINI_DATA = settings.SITE_ROOT + '/../external_data/getevidence_external_gene_data_mini.csv'
+MINI_ALIASES = settings.SITE_ROOT + '/../external_data/getevidence_external_gene_aliases_mini.csv'
+
+
+class GenesRegistryTest(TestCase):
+    """Tests writing, reading and resolving genes with the gene registry."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'gene_registry.bin')
+        self.settings_override = override_settings(
+            GENE_REGISTRY_PATH=self.path)
+        self.settings_override.enable()
+        gene_resolver.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        gene_resolver.clear()
+        shutil.rmtree(self.tempdir)
+
+    def test_write_gene_registry(self):
+        """Tests a registry reads back what was written."""
+        count = write_gene_registry(self.path, [
+            (7, u'JAK2', False, True, False),
+            (3, u'HBB', False, True, True),
+            (12, u'C1orf\xe9', True, False, False)])
+        self.assertEqual(count, 3)
+        registry = GeneRegistry(self.path)
+        self.assertEqual(len(registry), 3)
+        self.assertEqual(registry.lookup(u'HBB'),
+                         (3, CLINICAL_TESTING | ACMG_RECOMMENDED))
+        self.assertEqual(registry.lookup('JAK2'), (7, CLINICAL_TESTING))
+        self.assertEqual(registry.lookup(u'C1orf\xe9'), (12, RETIRED))
+        for missing in ['', 'A', 'HBA', 'JAK', 'JAK21', 'ZZZ']:
+            self.assertEqual(registry.lookup(missing), None)
+        self.assertTrue(registry.is_current())
+
+        # Replacing the file leaves the old mapping readable.
+        write_gene_registry(self.path, [(7, u'JAK2', False, False, False)])
+        self.assertFalse(registry.is_current())
+        self.assertEqual(registry.lookup(u'HBB')[0], 3)
+        registry.close()
+        self.assertEqual(len(GeneRegistry(self.path)), 1)
+
+        write_gene_registry(self.path, [])
+        self.assertEqual(GeneRegistry(self.path).lookup(u'JAK2'), None)
+
+    def test_bad_registry(self):
+        """Tests files that aren't registries are rejected."""
+        for data in ['', 'GEREG', 'NOTREG01' + '\0' * 8,
+                     'GEREG001\x01\0\0\0\0\0\0\0']:
+            with open(self.path, 'wb') as registry_file:
+                registry_file.write(data)
+            self.assertRaises(IOError, GeneRegistry, self.path)
+
+    def test_gene_resolver_with_registry(self):
+        """Tests gene_resolver checks symbols in the registry, no queries."""
+        refresh_gene_data(MINI_DATA)
+        load_gene_aliases(MINI_ALIASES)
+        self.assertTrue(os.path.exists(self.path))
+        jak2 = Gene.objects.get(hgnc_symbol='JAK2')
+        with self.assertNumQueries(0):
+            self.assertEqual(gene_resolver.resolve('JAK2'), 'JAK2')
+            self.assertEqual(gene_resolver.gene_id('JAK2'), jak2.pk)
+            self.assertFalse(gene_resolver.is_retired('JAK2'))
+            form = NewVariantForm({'gene': 'JAK2', 'aa_reference': 'V',
+                                   'aa_position': '617', 'aa_variant': 'F'})
+            self.assertTrue(form.is_valid())
+        with self.assertNumQueries(1):
+            self.assertEqual(Gene.gene_lookup('JAK2'), jak2)
+
+        # Aliases are read from the database once, when first needed.
+        loads = gene_resolver.loads
+        with self.assertNumQueries(1):
+            self.assertEqual(gene_resolver.resolve('JTK10'), 'JAK2')
+            self.assertEqual(gene_resolver.resolve('HFE1'), 'HFE')
+        self.assertEqual(gene_resolver.loads, loads + 1)
+        self.assertRaises(Gene.DoesNotExist, gene_resolver.resolve, 'HBQ1')
+
+        # Saving a Gene makes this process ignore the registry until it's
+        # written again.
+        hbq1 = Gene.objects.create(hgnc_symbol='HBQ1', hgnc_id='4833',
+                                   ucsc_knowngene='uc002cfy.3',
+                                   ncbi_gene_id='3049')
+        self.assertEqual(gene_resolver.gene_id('HBQ1'), hbq1.pk)
+        self.assertEqual(update_gene_registry(), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(gene_resolver.gene_id('HBQ1'), hbq1.pk)
+        self.assertEqual(len(GeneRegistry(self.path)), 5)
+
+        # Retirement is read from the registry's flags.
+        refresh_gene_data(MINI_DATA)
+        with self.assertNumQueries(0):
+            self.assertTrue(gene_resolver.is_retired('HBQ1'))
+
+    def test_gene_resolver_without_registry(self):
+        """Tests gene_resolver uses the database until a registry exists."""
+        refresh_gene_data(MINI_DATA, dry_run=True)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(Gene.objects.count(), 0)
+        refresh_gene_data(MINI_DATA)
+        load_gene_aliases(MINI_ALIASES)
+        os.remove(self.path)
+        gene_resolver.clear()
+        self.assertEqual(gene_resolver.resolve('SCN5A'), 'SCN5A')
+        with self.assertNumQueries(0):
+            self.assertEqual(gene_resolver.resolve('LQT3'), 'SCN5A')
@@ -2,12 +2,87 @@
 Tests views.py in genes app.
 """
 
+import re
+from django.conf import settings
 from django.test import TestCase
 from django.test.client import Client
+from variants.management.commands.add_external_gene_data import add_external_gene_data
+from variants.management.commands.sample_data import create_sample_data
+from ..gene_data import load_gene_aliases
+from ..models import Gene, GeneVariantSummary
 
 
 class GenesViewsTest(TestCase):
     """Tests the functions and models in views.py."""
 
     def setUp(self):
+        """Set up a client and sample data using variants' sample_data"""
         self.cl = Client()
+        add_external_gene_data(settings.SITE_ROOT + '/../external_data/getevidence_external_gene_data_mini.csv')
+        create_sample_data()
+
+    def test_index(self):
+        """Test genes index, most pathogenic variants first."""
+        with self.assertNumQueries(1):
+            summary_list, next_cursor = GeneVariantSummary.list_page()
+        self.assertEqual(next_cursor, None)
+        self.assertEqual(len(summary_list), Gene.objects.count())
+        counts = [summary.pathogenic_count for summary in summary_list]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertEqual(set([summary.gene.hgnc_symbol for summary
+                              in summary_list[:2]]), set(['HBB', 'SCN5A']))
+        self.assertEqual(counts[:3], [1, 1, 0])
+
+        response = self.cl.get('/gene/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['summary_list'], summary_list)
+        self.assertTrue(re.search('href="/gene/HBB"', response.content))
+
+    def test_index_after(self):
+        """Test genes index pages following a cursor."""
+        all_genes = [summary.gene.hgnc_symbol for summary in
+                     GeneVariantSummary.list_page()[0]]
+        GeneVariantSummary.LIST_PAGE_SIZE = 3
+        try:
+            response = self.cl.get('/gene/')
+            first_page = response.context['summary_list']
+            self.assertEqual(len(first_page), 3)
+            next_cursor = response.context['next_cursor']
+            response = self.cl.get('/gene/', {'after': next_cursor})
+            self.assertEqual(response.context['next_cursor'], None)
+            self.assertEqual([summary.gene.hgnc_symbol for summary in
+                              first_page + response.context['summary_list']],
+                             all_genes)
+        finally:
+            GeneVariantSummary.LIST_PAGE_SIZE = 100
+        response = self.cl.get('/gene/', {'after': '<script>'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse('<script>' in response.content)
+
+    def test_detail(self):
+        """Test gene detail page."""
+        response = self.cl.get('/gene/HBB')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['gene'].hgnc_symbol, 'HBB')
+        summary = response.context['summary']
+        self.assertEqual(summary.variant_count, 1)
+        self.assertEqual(summary.pathogenic_count, 1)
+        self.assertEqual(summary.evidence_means()[1], ('functional', 3.0))
+        self.assertEqual([variant.name for variant in
+                          response.context['variant_list']], ['HBB-E7V'])
+        self.assertTrue(re.search('HBB-E7V', response.content))
+
+        # Genes without variants have an empty summary.
+        response = self.cl.get('/gene/HFE')
+        self.assertEqual(response.context['summary'].variant_count, 0)
+        self.assertEqual(response.context['summary'].evidence_means()[0],
+                         ('computational', None))
+
+    def test_detail_alias(self):
+        """Test gene pages found by alias, and unknown genes."""
+        load_gene_aliases(settings.SITE_ROOT + '/../external_data/getevidence_external_gene_aliases_mini.csv')
+        response = self.cl.get('/gene/JTK10')
+        self.assertEqual(response.status_code, 301)
+        self.assertTrue(response['Location'].endswith('/gene/JAK2'))
+        response = self.cl.get('/gene/NOTAGENE')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,9 @@
+from django.conf.urls import patterns, url
+
+from . import views
+
+urlpatterns = patterns(
+    '',
+    url(r'^/?$', views.index, name='index'),
+    url(r'^/([^/]+)/?$', views.detail, name='detail'),
+)
@@ -1 +1,65 @@
-# Create your views here.
+"""
+==========
+Gene views
+==========
+
+Views
+=====
+index:  view to list Genes, most pathogenic Variants first
+detail: view to display a Gene and its Variants
+
+"""
+
+from django.core.urlresolvers import reverse
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         HttpResponsePermanentRedirect)
+from django.shortcuts import render
+from variants.models import Variant
+from .models import AmbiguousGeneAlias, Gene, GeneVariantSummary
+
+
+def index(request):
+    """Lists Genes with their Variant counts, one keyset page at a time.
+
+    Genes are ordered by number of pathogenic Variants, read from
+    GeneVariantSummary in one query per page.
+    """
+    after = request.GET.get('after')
+    try:
+        summary_list, next_cursor = GeneVariantSummary.list_page(after=after)
+    except ValueError:
+        return HttpResponseBadRequest('Bad page cursor.')
+    return render(request, 'genes/index.html',
+                  {'summary_list': summary_list,
+                   'after': after,
+                   'next_cursor': next_cursor,
+                   })
+
+
+def detail(request, gene_name):
+    """Display a Gene, its Variant counts and mean scores, and its Variants.
+
+    Genes found by alias redirect to the page for their current symbol.
+    """
+    try:
+        gene = Gene.gene_lookup(gene_name)
+    except AmbiguousGeneAlias as e:
+        return HttpResponse('Ambiguous gene symbol "' + e.alias +
+                            '"; did you mean ' + ' or '.join(e.symbols) +
+                            '?')
+    except Gene.DoesNotExist:
+        raise Http404
+    if gene.hgnc_symbol != gene_name:
+        return HttpResponsePermanentRedirect(
+            reverse('genes:detail', args=(gene.hgnc_symbol,)))
+    try:
+        summary = gene.variant_summary
+    except GeneVariantSummary.DoesNotExist:
+        summary = GeneVariantSummary(gene=gene)
+    variant_list = Variant.objects.filter(gene=gene).select_related(
+        'variantreview').order_by('aa_position', 'name')
+    return render(request, 'genes/detail.html',
+                  {'gene': gene,
+                   'summary': summary,
+                   'variant_list': variant_list,
+                   })
@@ -5,8 +5,10 @@ may override these.
 
 """
 
+from multiprocessing import cpu_count
 from os.path import abspath, basename, dirname, join, normpath
 from sys import path
+from tempfile import gettempdir
 
 
 ########## DEBUG CONFIGURATION
@@ -165,6 +167,8 @@ LOCAL_APPS = (
     'genes',
     'variants',
     'publications',
+    'api',
+    'search',
 )
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#installed-apps
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -202,6 +206,52 @@ LOGGING = {
 }
 
 
+########## GET-EVIDENCE CONFIGURATION
+# Maximum number of variant strings kept in each process's lookup cache.
+VARIANT_LOOKUP_CACHE_SIZE = 4096
+
+# Gene registry, a memory-mapped snapshot of Genes used to check gene
+# symbols without a query. Written by the gene data import commands, or
+# write_gene_registry. Set to None to always use the database.
+GENE_REGISTRY_PATH = normpath(join(SITE_ROOT, 'gene_registry.bin'))
+
+# Seconds to keep cached variant pages. Keys change with each revision, so
+# this only bounds how long unused pages take up cache space.
+VARIANT_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Directory for uploaded variant lists and their annotation reports.
+ANNOTATION_DIR = normpath(join(SITE_ROOT, 'annotations'))
+# Run annotation jobs in a separate process, and with how many workers.
+ANNOTATION_BACKGROUND = True
+ANNOTATION_WORKERS = cpu_count()
+
+# NCBI E-utilities client (see publications/entrez.py). NCBI asks for a
+# contact email and tool name, and allows 3 requests/second per host, or
+# 10 with an API key. ENTREZ_RATE_FILE holds the rate limiter's state,
+# shared by every process on the host.
+ENTREZ_EMAIL = 'mad-getevidence@printf.net'
+ENTREZ_TOOL = 'getevidence'
+ENTREZ_API_KEY = None
+ENTREZ_RATE = 3
+ENTREZ_RATE_FILE = join(gettempdir(), 'getevidence-entrez-rate')
+# Retries of 429/5xx responses, first backoff delay and timeout in seconds.
+ENTREZ_MAX_RETRIES = 5
+ENTREZ_BACKOFF = 0.5
+ENTREZ_TIMEOUT = 60
+
+# NCBI E-utilities efetch endpoint used for batched Pubmed requests.
+PUBMED_EFETCH_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi'
+
+# Persistent cache of Pubmed XML, and its maximum size in bytes. With
+# PUBMED_OFFLINE set, Pubmed data comes only from the cache.
+PUBMED_CACHE_DIR = normpath(join(SITE_ROOT, 'pubmed_cache'))
+PUBMED_CACHE_MAX_SIZE = 512 * 1024 * 1024
+PUBMED_OFFLINE = False
+
+# Days after which refresh_publications fetches a publication's data again.
+PUBLICATION_REFRESH_AGE = 90
+
+
 ########## WSGI CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#wsgi-application
 WSGI_APPLICATION = 'getevidence.wsgi.application'
@@ -1,5 +1,6 @@
 """Development settings and globals."""
 
+from tempfile import gettempdir
 from .base import *
 
 ########## TEST SETTINGS
@@ -19,3 +20,21 @@ DATABASES = {
         'PORT': '',
         },
     }
+
+########## GENE REGISTRY
+# Tests see only the test database; registry tests use their own file.
+GENE_REGISTRY_PATH = None
+
+########## ANNOTATION JOBS
+# Run jobs in the test process, since it alone sees the test database.
+ANNOTATION_DIR = join(gettempdir(), 'getevidence-test-annotations')
+ANNOTATION_BACKGROUND = False
+
+########## PUBMED
+# Never contact NCBI from tests; tests using the local efetch fixture
+# server turn this off along with a fresh cache directory.
+PUBMED_CACHE_DIR = join(gettempdir(), 'getevidence-test-pubmed')
+PUBMED_OFFLINE = True
+ENTREZ_RATE = 1000
+ENTREZ_RATE_FILE = join(gettempdir(), 'getevidence-test-entrez-rate')
+ENTREZ_BACKOFF = 0.01
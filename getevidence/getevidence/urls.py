@@ -18,5 +18,8 @@ urlpatterns = patterns('',
     # Uncomment the next line to enable the admin:
     url(r'^admin', include(admin.site.urls)),
 
+    url(r'^api/', include('api.urls', namespace="api")),
+    url(r'^search/', include('search.urls', namespace="search")),
     url(r'variant', include('variants.urls', namespace="variants")),
+    url(r'^gene', include('genes.urls', namespace="genes")),
 )
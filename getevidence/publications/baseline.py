@@ -0,0 +1,170 @@
+"""
+======================
+Pubmed baseline loader
+======================
+
+Functions for loading Publications from local Pubmed XML files, such as
+NCBI's baseline and update files (plain or .gz).
+
+article_record:          convert a PubmedArticle element to a record
+iter_article_fields:     yields Publication fields for each article in a file
+upsert_publications:     creates or updates Publications for a batch
+load_pubmed_baseline:    loads a file, one batch at a time
+
+Files are parsed with iterparse, and each article's elements are cleared
+once read, so memory use does not depend on file size. Article records
+have the shape of Bio.Entrez records, so pubmed.publication_fields maps
+them the same way as fetched data.
+
+"""
+
+import gzip
+from xml.etree.cElementTree import iterparse
+from django.db import transaction
+from django.utils import timezone
+from .models import Publication, PublicationFetchJob
+from .pubmed import publication_fields
+
+# Number of articles written in one transaction.
+BATCH_SIZE = 5000
+
+# Number of PMIDs per query when looking up existing Publications; SQLite
+# allows at most 999 parameters.
+LOOKUP_SIZE = 900
+
+FIELDS = Publication.PUBMED_FIELDS + ['pending']
+
+
+def _text(element):
+    """Return all text in element, including in child elements."""
+    if element is None:
+        return None
+    return ''.join(element.itertext())
+
+
+def _add_text(record, element, tags):
+    """Add text of element's children named in tags to record dict.
+
+    Only for children holding plain text, without child elements.
+    """
+    for tag in tags:
+        text = element.findtext(tag)
+        if text is not None:
+            record[tag] = text
+    return record
+
+
+def article_record(element):
+    """Return record, shaped like Bio.Entrez's, for a PubmedArticle element.
+
+    Only the parts read by publication_fields are included.
+    """
+    citation = element.find('MedlineCitation')
+    article_element = citation.find('Article')
+    journal_element = article_element.find('Journal')
+    issue_element = journal_element.find('JournalIssue')
+
+    issue = _add_text(dict(), issue_element, ['Volume', 'Issue'])
+    issue['PubDate'] = _add_text(dict(), issue_element.find('PubDate'),
+                                 ['Year', 'Month', 'Day', 'MedlineDate'])
+    journal = _add_text({'JournalIssue': issue}, journal_element,
+                        ['ISOAbbreviation'])
+    article = {'Journal': journal,
+               'ArticleTitle': _text(article_element.find('ArticleTitle'))}
+    authors = article_element.find('AuthorList')
+    if authors is not None:
+        article['AuthorList'] = [
+            _add_text(dict(), author, ['LastName', 'Initials'])
+            for author in authors.findall('Author')]
+    pagination = article_element.find('Pagination')
+    if pagination is not None:
+        article['Pagination'] = _add_text(dict(), pagination, ['MedlinePgn'])
+    abstract = article_element.find('Abstract')
+    if abstract is not None:
+        article['Abstract'] = {'AbstractText': [
+            _text(text) for text in abstract.findall('AbstractText')]}
+    return {'MedlineCitation': {'PMID': citation.findtext('PMID'),
+                                'Article': article}}
+
+
+def iter_article_fields(xml_file):
+    """Yield Publication fields for each PubmedArticle in an XML file."""
+    events = iterparse(xml_file, events=('start', 'end'))
+    _, root = events.next()
+    for event, element in events:
+        if event == 'end' and element.tag == 'PubmedArticle':
+            fields = publication_fields(article_record(element))
+            fields.update(pending=False,
+                          content_hash=Publication.data_hash(fields))
+            yield fields
+            # Drop this and any earlier articles from the tree.
+            root.clear()
+
+
+def upsert_publications(batch):
+    """Create or update Publications from a list of field dicts.
+
+    Existing Publications are updated only if their data changed. Returns
+    dict counting 'created', 'updated' and 'unchanged' Publications.
+    """
+    now = timezone.now()
+    batch = dict([(fields['pmid'], dict(fields, last_fetched=now))
+                  for fields in batch])
+    pmids = batch.keys()
+    existing = dict()
+    for start in range(0, len(pmids), LOOKUP_SIZE):
+        for values in Publication.objects.filter(
+                pmid__in=pmids[start:start + LOOKUP_SIZE]).values(
+                'pk', 'pmid', *FIELDS):
+            existing[values['pmid']] = values
+
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    with transaction.commit_on_success():
+        Publication.objects.bulk_create([
+            Publication(**fields) for pmid, fields in batch.items()
+            if pmid not in existing])
+        counts['created'] = len(batch) - len(existing)
+        updated = []
+        filled = []
+        for pmid, values in existing.items():
+            fields = batch[pmid]
+            if all([values[field] == fields[field] for field in FIELDS]):
+                counts['unchanged'] += 1
+                continue
+            counts['updated'] += 1
+            updated.append(values['pk'])
+            if values['pending']:
+                filled.append(values['pk'])
+            Publication.objects.filter(pk=values['pk']).update(**fields)
+        for start in range(0, len(updated), LOOKUP_SIZE):
+            # Save cited Publications again to send post_save, so citing
+            # Variants get new revisions and search documents.
+            for pub in Publication.objects.filter(
+                    pk__in=updated[start:start + LOOKUP_SIZE],
+                    variantpublicationreview__isnull=False).distinct():
+                pub.save()
+            PublicationFetchJob.objects.filter(
+                publication__in=filled[start:start + LOOKUP_SIZE]).exclude(
+                status='don').update(status='don', error='', claim_token='')
+    return counts
+
+
+def load_pubmed_baseline(path, batch_size=BATCH_SIZE):
+    """Load Publications from a Pubmed XML file (or .gz), in batches.
+
+    Returns dict counting 'created', 'updated' and 'unchanged' records.
+    """
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as xml_file:
+        batch = []
+        for fields in iter_article_fields(xml_file):
+            batch.append(fields)
+            if len(batch) >= batch_size:
+                for key, value in upsert_publications(batch).items():
+                    counts[key] += value
+                batch = []
+        if batch:
+            for key, value in upsert_publications(batch).items():
+                counts[key] += value
+    return counts
@@ -0,0 +1,307 @@
+"""
+NCBI E-utilities client.
+
+All requests to NCBI go through one EntrezClient per process, which:
+
+- keeps a pool of keep-alive HTTP connections, shared by threads;
+- waits for a token from a TokenBucket whose state is kept in a locked
+  file, so all threads and processes on the host share NCBI's rate limit;
+- retries 429 and 5xx responses and connection errors, with jittered
+  exponential backoff (honouring Retry-After);
+- follows one redirect, so a moved endpoint still works but a
+  misconfigured URL fails clearly;
+- records request latencies, reported by stats().
+
+========
+Classes:
+========
+TokenBucket:    rate limiter shared through a locked state file
+EntrezClient:   pooled, rate-limited, retrying HTTP client for E-utilities
+EntrezError:    raised when a request fails for good
+
+==========
+Functions:
+==========
+entrez_client:  return this process's EntrezClient, configured by settings
+
+"""
+import fcntl
+import httplib
+import os
+import random
+import socket
+import threading
+import time
+import urllib
+from collections import deque
+from urlparse import urljoin, urlsplit
+from django.conf import settings
+
+
+class EntrezError(IOError):
+    """Request to NCBI failed after any retries."""
+
+
+class TokenBucket(object):
+    """Token bucket of rate tokens/second, holding at most burst tokens.
+
+    The bucket's state is kept in the file at path and updated under an
+    exclusive lock, so every TokenBucket using the same path, in any thread
+    or process, draws from the same tokens.
+    """
+
+    def __init__(self, path, rate, burst=1, clock=time.time,
+                 sleep=time.sleep):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+
+    def _take(self):
+        """Take a token if there is one; return seconds to wait if not."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                tokens, updated = map(float, os.read(fd, 64).split())
+            except ValueError:
+                tokens, updated = self.burst, self.clock()
+            now = self.clock()
+            tokens = min(self.burst,
+                         tokens + max(0, now - updated) * self.rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, '%r %r' % (tokens, now))
+            return wait
+        finally:
+            os.close(fd)
+
+    def acquire(self):
+        """Wait until a token is available and take it.
+
+        Returns total seconds spent waiting.
+        """
+        waited = 0
+        while True:
+            wait = self._take()
+            if not wait:
+                return waited
+            self.sleep(wait)
+            waited += wait
+
+
+class _PooledResponse(object):
+    """File-like response that returns its connection to the pool.
+
+    The connection is reused only if the response was read to the end and
+    the server allows keep-alive; otherwise it is closed.
+    """
+
+    def __init__(self, client, key, connection, response):
+        self.client = client
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+
+    def read(self, size=None):
+        if size is None or size < 0:
+            return self.response.read()
+        return self.response.read(size)
+
+    def close(self):
+        if self.connection is None:
+            return
+        if self.response.isclosed() and not self.response.will_close:
+            self.client._release(self.key, self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EntrezClient(object):
+    """HTTP client for NCBI E-utilities; see module docstring.
+
+    email, tool and api_key are sent with every request, as NCBI asks.
+    Retries start backoff seconds apart and double, up to max_retries.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    # Number of recent request latencies kept for stats().
+    LATENCY_WINDOW = 1000
+
+    def __init__(self, email, tool, api_key=None, bucket=None,
+                 max_retries=5, backoff=0.5, timeout=60):
+        self.email = email
+        self.tool = tool
+        self.api_key = api_key
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._idle = dict()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._counts = {'requests': 0, 'retries': 0, 'failures': 0,
+                        'connections': 0, 'rate_limit_wait': 0.0}
+
+    def _connect(self, key):
+        """Return idle pooled connection for key, or a new one."""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+            self._counts['connections'] += 1
+        scheme, host = key
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, timeout=self.timeout)
+        return httplib.HTTPConnection(host, timeout=self.timeout)
+
+    def _release(self, key, connection):
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def _delay(self, attempt, response=None):
+        """Return seconds to wait before retry number attempt (from 1)."""
+        if response is not None:
+            retry_after = response.getheader('retry-after')
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return random.uniform(0, self.backoff * 2 ** (attempt - 1))
+
+    def _split(self, url):
+        """Return ((scheme, host), path) of url."""
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        return (parts.scheme, parts.netloc), path
+
+    def request(self, url, params):
+        """POST params to url and return file-like response.
+
+        The response must be closed to return its connection to the pool.
+        One redirect is followed, re-POSTing to its Location. Raises
+        EntrezError if the request still fails after retries, or is
+        redirected again.
+        """
+        params = dict(params, email=self.email, tool=self.tool)
+        if self.api_key:
+            params['api_key'] = self.api_key
+        body = urllib.urlencode(params)
+        headers = {'Content-Type': 'application/x-www-form-urlencoded',
+                   'Connection': 'keep-alive'}
+        key, path = self._split(url)
+        redirected_from = None
+
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                waited = self.bucket.acquire()
+                with self._lock:
+                    self._counts['rate_limit_wait'] += waited
+            connection = self._connect(key)
+            start = time.time()
+            response = None
+            try:
+                connection.request('POST', path, body, headers)
+                response = connection.getresponse()
+                error = None
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                error = '%s: %s' % (e.__class__.__name__, e)
+            latency = time.time() - start
+            with self._lock:
+                self._counts['requests'] += 1
+                self._latencies.append(latency)
+
+            if response is not None:
+                if response.status == 200:
+                    return _PooledResponse(self, key, connection, response)
+                error = 'HTTP %d %s' % (response.status, response.reason)
+                location = response.getheader('Location')
+                response.read()
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._release(key, connection)
+                if (300 <= response.status < 400 and location and
+                        redirected_from is None):
+                    redirected_from = url
+                    url = urljoin(url, location)
+                    key, path = self._split(url)
+                    continue
+                if 300 <= response.status < 400:
+                    with self._lock:
+                        self._counts['failures'] += 1
+                    if redirected_from:
+                        url += ' (redirected from %s)' % redirected_from
+                    raise EntrezError(error + ' from ' + url +
+                                      ': is the URL misconfigured?')
+                if response.status not in self.RETRY_STATUSES:
+                    with self._lock:
+                        self._counts['failures'] += 1
+                    raise EntrezError(error + ' from ' + url)
+
+            attempt += 1
+            if attempt > self.max_retries:
+                with self._lock:
+                    self._counts['failures'] += 1
+                raise EntrezError(error + ' from ' + url +
+                                  ' after %d retries' % self.max_retries)
+            with self._lock:
+                self._counts['retries'] += 1
+            time.sleep(self._delay(attempt, response))
+
+    def stats(self):
+        """Return dict of request counts and latencies (in seconds).
+
+        Latency percentiles cover the last LATENCY_WINDOW requests.
+        """
+        with self._lock:
+            stats = dict(self._counts)
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats['latency_mean'] = sum(latencies) / len(latencies)
+            stats['latency_p50'] = latencies[len(latencies) / 2]
+            stats['latency_p95'] = latencies[int(len(latencies) * 0.95)]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+
+_client = None
+_client_config = None
+_client_lock = threading.Lock()
+
+
+def entrez_client():
+    """Return this process's EntrezClient, configured by ENTREZ_* settings.
+
+    A new client is made if the settings have changed.
+    """
+    global _client, _client_config
+    config = (settings.ENTREZ_EMAIL, settings.ENTREZ_TOOL,
+              settings.ENTREZ_API_KEY, settings.ENTREZ_RATE,
+              settings.ENTREZ_RATE_FILE, settings.ENTREZ_MAX_RETRIES,
+              settings.ENTREZ_BACKOFF, settings.ENTREZ_TIMEOUT)
+    with _client_lock:
+        if config != _client_config:
+            (email, tool, api_key, rate, rate_file, max_retries,
+             backoff, timeout) = config
+            _client = EntrezClient(email, tool, api_key=api_key,
+                                   bucket=TokenBucket(rate_file, rate),
+                                   max_retries=max_retries, backoff=backoff,
+                                   timeout=timeout)
+            _client_config = config
+        return _client
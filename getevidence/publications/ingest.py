@@ -0,0 +1,153 @@
+"""
+=====================
+Publication ingestion
+=====================
+
+Functions for fetching Pubmed data in the background. Adding a publication
+creates a pending Publication and a PublicationFetchJob straight away, so
+requests never wait on NCBI; workers fill in the data later.
+
+enqueue_fetch:        Returns Publication for a PMID, queuing a fetch if new
+claim_fetch_jobs:     Claims a batch of due PublicationFetchJobs
+run_fetch_jobs:       Fetches Pubmed data for a batch of claimed jobs
+process_fetch_queue:  Runs queued jobs until none are due
+
+Jobs are claimed with a conditional UPDATE, so several worker threads or
+processes can drain the queue at once without running a job twice.
+
+"""
+
+import threading
+import uuid
+from datetime import timedelta
+from django import db
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Publication, PublicationFetchJob
+
+# Number of jobs claimed, and PMIDs sent to NCBI, at a time.
+BATCH_SIZE = 50
+
+# Attempts before a job is dead-lettered.
+MAX_ATTEMPTS = 5
+
+# Seconds before a failed job is retried, doubled after each attempt.
+RETRY_DELAY = 60
+
+# Seconds after which a running job is assumed to be from a dead worker.
+CLAIM_TIMEOUT = 600
+
+
+def enqueue_fetch(pmid):
+    """Return Publication for pmid, queuing a fetch if it had to be created."""
+    pub, created = Publication.objects.get_or_create(
+        pmid=pmid, defaults={'pending': True})
+    if created:
+        PublicationFetchJob.objects.create(publication=pub)
+    return pub
+
+
+def claim_fetch_jobs(batch_size=BATCH_SIZE):
+    """Claim and return up to batch_size due jobs, oldest first.
+
+    Due jobs are queued jobs whose run_after has passed, and running jobs
+    claimed more than CLAIM_TIMEOUT seconds ago. Each claim counts as an
+    attempt.
+    """
+    now = timezone.now()
+    due = PublicationFetchJob.objects.filter(
+        Q(status='que', run_after__lte=now) |
+        Q(status='run', claimed__lt=now - timedelta(seconds=CLAIM_TIMEOUT)))
+    job_ids = list(due.order_by('run_after', 'pk')
+                   .values_list('pk', flat=True)[:batch_size])
+    if not job_ids:
+        return []
+    # Repeating the due filter skips jobs another worker claimed meanwhile.
+    token = uuid.uuid4().hex
+    due.filter(pk__in=job_ids).update(status='run', claimed=now,
+                                      claim_token=token,
+                                      attempts=F('attempts') + 1)
+    return list(PublicationFetchJob.objects.filter(claim_token=token)
+                .select_related('publication'))
+
+
+def run_fetch_jobs(jobs, max_attempts=MAX_ATTEMPTS):
+    """Fetch Pubmed data for claimed jobs with one batched request.
+
+    Fetched jobs are marked done. Others are queued again after a delay,
+    or dead-lettered once they have had max_attempts attempts. Returns dict
+    counting jobs 'done', 'retried' and 'dead'.
+    """
+    counts = {'done': 0, 'retried': 0, 'dead': 0}
+    if not jobs:
+        return counts
+    try:
+        fetched = Publication.fetch_many([job.publication.pmid
+                                          for job in jobs])
+        error = 'PMID not returned by Pubmed.'
+    except Exception as e:
+        # Network, HTTP and XML errors alike are retried; the worker must
+        # outlive a bad batch.
+        fetched = dict()
+        error = '%s: %s' % (e.__class__.__name__, e)
+
+    now = timezone.now()
+    for job in jobs:
+        # Only update jobs still held by this claim.
+        claimed_job = PublicationFetchJob.objects.filter(
+            pk=job.pk, claim_token=job.claim_token)
+        if job.publication.pmid in fetched:
+            claimed_job.update(status='don', error='', claim_token='')
+            counts['done'] += 1
+        elif job.attempts >= max_attempts:
+            claimed_job.update(status='dea', error=error, claim_token='')
+            counts['dead'] += 1
+        else:
+            delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+            claimed_job.update(status='que', error=error, claim_token='',
+                               run_after=now + timedelta(seconds=delay))
+            counts['retried'] += 1
+    return counts
+
+
+def _drain(batch_size, max_attempts, counts, lock):
+    """Run batches of due jobs until none are left, adding to counts."""
+    while True:
+        batch_counts = run_fetch_jobs(claim_fetch_jobs(batch_size),
+                                      max_attempts)
+        if not any(batch_counts.values()):
+            return
+        with lock:
+            for key, value in batch_counts.items():
+                counts[key] += value
+
+
+def _drain_thread(batch_size, max_attempts, counts, lock):
+    """Drain queue in a worker thread, closing its database connection."""
+    try:
+        _drain(batch_size, max_attempts, counts, lock)
+    finally:
+        db.close_connection()
+
+
+def process_fetch_queue(workers=1, batch_size=BATCH_SIZE,
+                        max_attempts=MAX_ATTEMPTS):
+    """Run due PublicationFetchJobs until none are left.
+
+    With more than one worker, batches run in that many threads, each with
+    its own database connection, so slow NCBI responses overlap. Returns
+    dict counting jobs 'done', 'retried' and 'dead'.
+    """
+    counts = {'done': 0, 'retried': 0, 'dead': 0}
+    lock = threading.Lock()
+    if workers <= 1:
+        _drain(batch_size, max_attempts, counts, lock)
+        return counts
+    threads = [threading.Thread(target=_drain_thread,
+                                args=(batch_size, max_attempts, counts, lock))
+               for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
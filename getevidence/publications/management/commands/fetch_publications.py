@@ -0,0 +1,48 @@
+"""Fetch Pubmed data for pending publications."""
+
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from ...entrez import entrez_client
+from ...ingest import BATCH_SIZE, MAX_ATTEMPTS, process_fetch_queue
+
+
+class Command(BaseCommand):
+    help = ('Runs queued Pubmed fetches for pending publications until ' +
+            'none are due')
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=1,
+                    help='Number of worker threads'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=BATCH_SIZE,
+                    help='Number of PMIDs fetched per request'),
+        make_option('--max-attempts', dest='max_attempts', type='int',
+                    default=MAX_ATTEMPTS,
+                    help='Attempts before a fetch is dead-lettered'),
+        make_option('--loop', dest='loop', type='int', default=0,
+                    help='Keep polling the queue every LOOP seconds'),
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            counts = process_fetch_queue(workers=options['workers'],
+                                         batch_size=options['batch_size'],
+                                         max_attempts=options['max_attempts'])
+            if any(counts.values()) or not options['loop']:
+                self.stdout.write('Fetched %(done)d publications, '
+                                  '%(retried)d to retry, %(dead)d dead.' %
+                                  counts)
+                self.write_entrez_stats()
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
+
+    def write_entrez_stats(self):
+        stats = entrez_client().stats()
+        if not stats['requests']:
+            return
+        self.stdout.write('NCBI requests: %(requests)d (%(retries)d retried, '
+                          '%(failures)d failed) on %(connections)d '
+                          'connections, latency p50 %(latency_p50).2fs, '
+                          'p95 %(latency_p95).2fs, max %(latency_max).2fs.'
+                          % stats)
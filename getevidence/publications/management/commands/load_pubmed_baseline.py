@@ -0,0 +1,35 @@
+"""Load Publications from Pubmed baseline or update XML files."""
+
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from ...baseline import BATCH_SIZE, load_pubmed_baseline
+
+
+class Command(BaseCommand):
+    args = '<pubmed_xml_file ...>'
+    help = ('Creates or updates Publications from Pubmed XML files ' +
+            '(e.g. baseline files, plain or .gz)')
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=BATCH_SIZE,
+                    help='Number of articles written per transaction'),
+        )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Please provide one or more Pubmed XML files.')
+        for path in args:
+            start = time.time()
+            try:
+                counts = load_pubmed_baseline(path,
+                                              batch_size=options['batch_size'])
+            except IOError as e:
+                raise CommandError(str(e))
+            elapsed = time.time() - start
+            total = sum(counts.values())
+            self.stdout.write('%s: %d articles (%d created, %d updated, '
+                              '%d unchanged) in %.1fs, %.0f articles/sec.' %
+                              (path, total, counts['created'],
+                               counts['updated'], counts['unchanged'],
+                               elapsed, total / max(elapsed, 0.001)))
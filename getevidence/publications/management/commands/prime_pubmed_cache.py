@@ -0,0 +1,37 @@
+"""Load Pubmed XML from bulk files into the Pubmed cache."""
+
+import gzip
+from django.core.management.base import BaseCommand, CommandError
+from ...pubmed import pubmed_cache
+from ...pubmed_cache import iter_articles
+
+
+def prime_pubmed_cache(path):
+    """Store each article in a Pubmed XML file (or .gz) in the cache.
+
+    The file has the format of an efetch response or a Pubmed baseline
+    file. Returns number of articles stored.
+    """
+    cache = pubmed_cache()
+    opener = gzip.open if path.endswith('.gz') else open
+    count = 0
+    with opener(path, 'rb') as xml_file:
+        for pmid, document in iter_articles(xml_file):
+            cache.set(pmid, document)
+            count += 1
+    return count
+
+
+class Command(BaseCommand):
+    args = '<pubmed_xml_file ...>'
+    help = 'Stores articles from Pubmed XML files in the Pubmed cache'
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Please provide one or more Pubmed XML files.')
+        for path in args:
+            try:
+                count = prime_pubmed_cache(path)
+            except IOError as e:
+                raise CommandError(str(e))
+            self.stdout.write('Cached %d articles from %s.' % (count, path))
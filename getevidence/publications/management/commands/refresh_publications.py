@@ -0,0 +1,81 @@
+"""Refresh Pubmed data of publications not fetched recently."""
+
+from datetime import timedelta
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ...models import Publication
+
+
+def refresh_publications(max_age=None, limit=None, batch_size=None):
+    """Fetch Pubmed data again for publications older than max_age days.
+
+    Publications never fetched, then the least recently fetched, are
+    requested from NCBI batch_size at a time, bypassing the Pubmed cache.
+    Only publications whose data changed are saved; the rest just have
+    last_fetched updated. PMIDs NCBI doesn't return have last_fetched
+    updated too, so they go to the back of the queue, unless
+    PUBMED_OFFLINE is set and nothing was requested. Returns dict counting
+    publications 'checked', 'changed' and 'failed' (not returned by NCBI,
+    or in a failed batch, which is retried next run).
+    """
+    if max_age is None:
+        max_age = settings.PUBLICATION_REFRESH_AGE
+    batch_size = batch_size or Publication.FETCH_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=max_age)
+    # Two queries, as databases differ on where NULLs sort.
+    publications = Publication.objects.filter(pending=False)
+    never_fetched = publications.filter(last_fetched__isnull=True).order_by(
+        'pk').values_list('pmid', flat=True)
+    stale = publications.filter(last_fetched__lt=cutoff).order_by(
+        'last_fetched', 'pk').values_list('pmid', flat=True)
+    pmids = list(never_fetched[:limit] if limit else never_fetched)
+    if not limit:
+        pmids.extend(stale)
+    elif len(pmids) < limit:
+        pmids.extend(stale[:limit - len(pmids)])
+
+    counts = {'checked': 0, 'changed': 0, 'failed': 0}
+    for start in range(0, len(pmids), batch_size):
+        batch = pmids[start:start + batch_size]
+        counts['checked'] += len(batch)
+        try:
+            pubs = Publication.fetch_many(batch, use_cache=False)
+        except Exception:
+            # Network, HTTP and XML errors: these are retried next run.
+            counts['failed'] += len(batch)
+            continue
+        counts['changed'] += len([pub for pub in pubs.values()
+                                  if pub.changed])
+        missing = [pmid for pmid in batch if pmid not in pubs]
+        if missing and not settings.PUBMED_OFFLINE:
+            Publication.objects.filter(pmid__in=missing).update(
+                last_fetched=timezone.now())
+        counts['failed'] += len(missing)
+    return counts
+
+
+class Command(BaseCommand):
+    help = ('Fetches Pubmed data again for publications not fetched ' +
+            'recently, saving only those that changed')
+    option_list = BaseCommand.option_list + (
+        make_option('--max-age', dest='max_age', type='int',
+                    help='Refresh data older than this many days ' +
+                    '(default: PUBLICATION_REFRESH_AGE)'),
+        make_option('--limit', dest='limit', type='int',
+                    help='Refresh at most this many publications'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=Publication.FETCH_BATCH_SIZE,
+                    help='Number of PMIDs fetched per request'),
+        )
+
+    def handle(self, *args, **options):
+        if settings.PUBMED_OFFLINE:
+            raise CommandError('PUBMED_OFFLINE is set: nothing to refresh '
+                               'from.')
+        counts = refresh_publications(max_age=options['max_age'],
+                                      limit=options['limit'],
+                                      batch_size=options['batch_size'])
+        self.stdout.write('Checked %(checked)d publications: %(changed)d '
+                          'changed, %(failed)d failed.' % counts)
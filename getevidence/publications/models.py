@@ -1,7 +1,10 @@
-import re
-from Bio import Entrez
-from django.db import models
+import hashlib
+import json
+from django.db import models, transaction
+from django.utils import timezone
 import reversion
+from .pubmed import (FIELD_LENGTHS, fetch_documents, parse_document,
+                     publication_fields)
 
 class Publication(models.Model):
     """Records publication information.
@@ -14,15 +17,29 @@ class Publication(models.Model):
     journal: Title of journal, with abbreviations (CharField)
     journal_location: Volume, issue, and pagination (CharField)
     abstract: Abstract text (TextField)
+    pending: True until data is fetched from Pubmed (BooleanField)
+    last_fetched: Time data was last fetched from Pubmed (DateTimeField)
+    content_hash: SHA-1 of the Pubmed data fields (CharField)
 
     """
     pmid = models.IntegerField(unique=True)
     author_list = models.TextField(blank=True)
     title = models.TextField()
-    pub_date = models.CharField(max_length=18)
-    journal = models.CharField(max_length=30)
-    journal_location = models.CharField(max_length=25)
+    pub_date = models.CharField(max_length=FIELD_LENGTHS['pub_date'])
+    journal = models.CharField(max_length=FIELD_LENGTHS['journal'])
+    journal_location = models.CharField(
+        max_length=FIELD_LENGTHS['journal_location'])
     abstract = models.TextField(blank=True)
+    pending = models.BooleanField(default=False)
+    last_fetched = models.DateTimeField(null=True, blank=True, db_index=True)
+    content_hash = models.CharField(max_length=40, blank=True)
+
+    # Fields filled in from Pubmed data, and covered by content_hash.
+    PUBMED_FIELDS = ['author_list', 'title', 'pub_date', 'journal',
+                     'journal_location', 'abstract']
+
+    # Number of PMIDs requested from NCBI in each efetch by fetch_many.
+    FETCH_BATCH_SIZE = 200
 
     def __unicode__(self):
         """Returns string with Pubmed ID."""
@@ -41,52 +58,119 @@ class Publication(models.Model):
         return pub_match
 
     def get_pubmed_data(self):
-        """Pull and parse abstract text from NCBI."""
-        Entrez.email = "mad-getevidence@printf.net"
-        handle = Entrez.efetch(db="pubmed", id=str(self.pmid), retmode="xml")
-        record = Entrez.parse(handle).next()
-
-        # Author data
-        authors = record['MedlineCitation']['Article']['AuthorList']
-        self.author_list = ', '.join([a['LastName'] + ' ' + a['Initials']
-                                 for a in authors[0:10]])
-        if len(authors) > 10:
-            self.author_list += ', et al.'
-        else:
-            self.author_list += '.'
-
-        # Article title
-        self.title = record['MedlineCitation']['Article']['ArticleTitle']
-
-        # Date data
-        date_data = record['MedlineCitation']['Article']['Journal']['JournalIssue']['PubDate']
-        self.pub_date = date_data['Year']
-        if 'Month' in date_data:
-            self.pub_date += ' ' + date_data['Month']
-            if 'Day' in date_data:
-                self.pub_date += ' ' + date_data['Day']
-
-        # Journal name (abbreviated)
-        self.journal = record['MedlineCitation']['Article']['Journal']['ISOAbbreviation']
-        self.journal = re.sub('\.','', self.journal)
-
-        # Journal article location (volume/issue/pagination)
-        journal_issue_data = record['MedlineCitation']['Article']['Journal']['JournalIssue']
-        self.journal_location = ''
-        if 'Volume' in journal_issue_data:
-            self.journal_location += journal_issue_data['Volume']
-        if 'Issue' in journal_issue_data:
-            self.journal_location += "(" + journal_issue_data['Issue'] + ")"
-        if ('Pagination' in record['MedlineCitation']['Article'] and
-            'MedlinePgn' in record['MedlineCitation']['Article']['Pagination']):
-            if self.journal_location:
-                self.journal_location += ':'
-            self.journal_location += record['MedlineCitation']['Article']['Pagination']['MedlinePgn']
-
-        if ('Abstract' in record['MedlineCitation']['Article'] and
-            'AbstractText' in record['MedlineCitation']['Article']['Abstract']):
-            self.abstract = ' '.join([x for x in
-                                      record['MedlineCitation']['Article']['Abstract']['AbstractText']])
+        """Pull and parse abstract text from NCBI, or the Pubmed cache."""
+        documents = dict(fetch_documents([self.pmid]))
+        record = parse_document(documents[self.pmid])
+        fields = publication_fields(record)
+        fields.update(last_fetched=timezone.now(),
+                      content_hash=self.data_hash(fields))
+        for field, value in fields.items():
+            setattr(self, field, value)
+
+    @classmethod
+    def data_hash(cls, fields):
+        """Return SHA-1 of the Pubmed data in a dict of field values."""
+        return hashlib.sha1(json.dumps(
+            [fields[field] for field in cls.PUBMED_FIELDS])).hexdigest()
+
+    @classmethod
+    def fetch_many(cls, pmids, use_cache=True):
+        """Create or update Publications for PMIDs with batched NCBI requests.
+
+        Cached Pubmed XML is used where available, unless use_cache is
+        False (see pubmed.py). Other PMIDs are requested FETCH_BATCH_SIZE
+        at a time, and each response is parsed article by article as it
+        arrives. New Publications are bulk created; existing ones are
+        saved only if their data's content_hash changed, and otherwise
+        just have last_fetched updated. Returns dict of Publications keyed
+        by PMID, each with a 'changed' attribute; PMIDs NCBI doesn't
+        return are left out.
+        """
+        pmids = sorted(set([int(pmid) for pmid in pmids]))
+        pubs = dict()
+        for start in range(0, len(pmids), cls.FETCH_BATCH_SIZE):
+            batch = pmids[start:start + cls.FETCH_BATCH_SIZE]
+            pubs.update(cls._store_fetched(fetch_documents(
+                batch, use_cache=use_cache)))
+        return pubs
+
+    @classmethod
+    def _store_fetched(cls, documents):
+        """Create or update Publications from (pmid, document) pairs."""
+        now = timezone.now()
+        fetched = dict()
+        for pmid, document in documents:
+            record = parse_document(document)
+            if 'MedlineCitation' not in record:
+                continue
+            fields = publication_fields(record)
+            fields.update(pending=False, last_fetched=now,
+                          content_hash=cls.data_hash(fields))
+            fetched[fields['pmid']] = fields
+
+        existing = dict([(pub.pmid, pub) for pub in
+                         cls.objects.filter(pmid__in=fetched.keys())])
+        changed = set([pmid for pmid in fetched if pmid not in existing])
+        with transaction.commit_on_success():
+            cls.objects.bulk_create([cls(**fetched[pmid])
+                                     for pmid in changed])
+            for pmid, pub in existing.items():
+                fields = fetched[pmid]
+                old_hash = (pub.content_hash or
+                            cls.data_hash(pub.__dict__))
+                if pub.pending or old_hash != fields['content_hash']:
+                    for field, value in fields.items():
+                        setattr(pub, field, value)
+                    pub.save()
+                    changed.add(pmid)
+            cls.objects.filter(pmid__in=[
+                pmid for pmid in existing if pmid not in changed]).update(
+                last_fetched=now)
+        pubs = dict()
+        for pub in cls.objects.filter(pmid__in=fetched.keys()):
+            pub.changed = pub.pmid in changed
+            pubs[pub.pmid] = pub
+        return pubs
+
+
+class PublicationFetchJob(models.Model):
+    """Queued fetch of Pubmed data for a pending Publication.
+
+    Jobs are claimed and run by publications.ingest.process_fetch_queue.
+    Failed fetches are retried after a delay; after the maximum number of
+    attempts a job is dead-lettered and left for someone to look at.
+
+    Data attributes:
+    publication: pending Publication to fetch (OneToOneField)
+    status:      queued, running, done or dead (CharField)
+    attempts:    number of times the job has been claimed (IntegerField)
+    error:       error from the most recent failed attempt (TextField)
+    created:     time job was created (DateTimeField)
+    run_after:   earliest time the job may be claimed (DateTimeField)
+    claimed:     time the job was last claimed by a worker (DateTimeField)
+    claim_token: identifies the worker batch holding the job (CharField)
+
+    """
+    publication = models.OneToOneField(Publication)
+    status_choices = (('que', 'queued'),
+                      ('run', 'running'),
+                      ('don', 'done'),
+                      ('dea', 'dead'))
+    status = models.CharField(max_length=3,
+                              choices=status_choices,
+                              default='que',
+                              db_index=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed = models.DateTimeField(null=True, blank=True)
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True)
+
+    def __unicode__(self):
+        """Returns string with Pubmed ID and status."""
+        return (str(self.publication) + ' fetch: ' +
+                self.get_status_display())
 
 
 # Register model with reversion.
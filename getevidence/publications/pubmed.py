@@ -0,0 +1,146 @@
+"""
+Retrieve and parse Pubmed article data from NCBI.
+
+==========
+Functions:
+==========
+efetch:                 open handle to Pubmed XML for a list of PMIDs
+pubmed_cache:           return PubmedCache configured by settings
+fetch_documents:        yield Pubmed XML for PMIDs, from cache or NCBI
+parse_document:         parse a single-article Pubmed XML document
+publication_fields:     map a parsed Pubmed record to Publication fields
+
+Documents fetched from NCBI are kept in the PUBMED_CACHE_DIR cache. With
+PUBMED_OFFLINE set, only cached documents are used and NCBI is never
+contacted.
+
+"""
+import re
+from cStringIO import StringIO
+from Bio import Entrez
+from django.conf import settings
+from .entrez import entrez_client
+from .pubmed_cache import PubmedCache, iter_articles
+
+# Maximum lengths of the short Publication fields; longer values (e.g.
+# "J Am Acad Child Adolesc Psychiatry") are cut to fit.
+FIELD_LENGTHS = {'pub_date': 18, 'journal': 30, 'journal_location': 25}
+
+
+def efetch(pmids):
+    """Return handle to Pubmed XML for the articles with the given PMIDs.
+
+    PMIDs are POSTed, so a single request can carry many of them. Records
+    are returned in NCBI's order, and PMIDs NCBI doesn't know are left out.
+    The request goes through the shared EntrezClient (see entrez.py).
+    """
+    return entrez_client().request(settings.PUBMED_EFETCH_URL,
+                                   {'db': 'pubmed',
+                                    'id': ','.join([str(p) for p in pmids]),
+                                    'retmode': 'xml'})
+
+
+# PubmedCaches by (directory, maximum size), shared by all calls in a
+# process so their writes add up toward checking the cache size.
+_pubmed_caches = dict()
+
+
+def pubmed_cache():
+    """Return this process's PubmedCache for PUBMED_CACHE_DIR."""
+    key = (settings.PUBMED_CACHE_DIR, settings.PUBMED_CACHE_MAX_SIZE)
+    if key not in _pubmed_caches:
+        _pubmed_caches[key] = PubmedCache(*key)
+    return _pubmed_caches[key]
+
+
+def fetch_documents(pmids, use_cache=True):
+    """Yield (pmid, document) of Pubmed XML for each PMID found.
+
+    Cached documents are yielded first. The rest are requested in one
+    efetch, unless PUBMED_OFFLINE is set, and stored in the cache as they
+    are read. If use_cache is False all PMIDs are requested, and the
+    cache is only written.
+    """
+    cache = pubmed_cache()
+    missing = []
+    for pmid in pmids:
+        document = cache.get(pmid) if use_cache else None
+        if document is None:
+            missing.append(pmid)
+        else:
+            yield pmid, document
+    if not missing or settings.PUBMED_OFFLINE:
+        return
+    handle = efetch(missing)
+    try:
+        for pmid, document in iter_articles(handle):
+            cache.set(pmid, document)
+            yield pmid, document
+    finally:
+        handle.close()
+
+
+def parse_document(document):
+    """Return parsed record of the article in a Pubmed XML document."""
+    return Entrez.parse(StringIO(document)).next()
+
+
+def publication_fields(record):
+    """Return dict of Publication field values from a parsed Pubmed record.
+
+    The record is one item from Bio.Entrez.parse on Pubmed XML. Values
+    are cut to FIELD_LENGTHS.
+    """
+    fields = dict()
+    article = record['MedlineCitation']['Article']
+    fields['pmid'] = int(record['MedlineCitation']['PMID'])
+
+    # Author data
+    authors = article.get('AuthorList', [])
+    fields['author_list'] = ', '.join([a['LastName'] + ' ' + a['Initials']
+                                       for a in authors[0:10]
+                                       if 'LastName' in a])
+    if len(authors) > 10:
+        fields['author_list'] += ', et al.'
+    else:
+        fields['author_list'] += '.'
+
+    # Article title
+    fields['title'] = article['ArticleTitle']
+
+    # Date data
+    date_data = article['Journal']['JournalIssue']['PubDate']
+    if 'Year' in date_data:
+        fields['pub_date'] = date_data['Year']
+        if 'Month' in date_data:
+            fields['pub_date'] += ' ' + date_data['Month']
+            if 'Day' in date_data:
+                fields['pub_date'] += ' ' + date_data['Day']
+    else:
+        fields['pub_date'] = date_data.get('MedlineDate', '')
+
+    # Journal name (abbreviated)
+    fields['journal'] = re.sub('\.', '',
+                               article['Journal'].get('ISOAbbreviation', ''))
+
+    # Journal article location (volume/issue/pagination)
+    journal_issue_data = article['Journal']['JournalIssue']
+    fields['journal_location'] = ''
+    if 'Volume' in journal_issue_data:
+        fields['journal_location'] += journal_issue_data['Volume']
+    if 'Issue' in journal_issue_data:
+        fields['journal_location'] += "(" + journal_issue_data['Issue'] + ")"
+    if ('Pagination' in article and
+        'MedlinePgn' in article['Pagination']):
+        if fields['journal_location']:
+            fields['journal_location'] += ':'
+        fields['journal_location'] += article['Pagination']['MedlinePgn']
+
+    fields['abstract'] = ''
+    if ('Abstract' in article and
+        'AbstractText' in article['Abstract']):
+        fields['abstract'] = ' '.join([x for x in
+                                       article['Abstract']['AbstractText']])
+    for field, length in FIELD_LENGTHS.items():
+        fields[field] = fields[field][:length]
+    return fields
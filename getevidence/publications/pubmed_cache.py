@@ -0,0 +1,196 @@
+"""
+================
+Pubmed XML cache
+================
+
+Persistent on-disk cache of Pubmed efetch XML, one document per PMID.
+
+Documents are stored under the SHA-1 of their content ("objects/ab/cdef..."),
+and small index files ("pmid/<last 2 digits>/<pmid>") hold the digest for
+each PMID. Reads check the digest, so a damaged file is a miss rather than
+bad data, and all writes go through a rename so readers in other processes
+never see partial files. Reads touch the document, and when the cache grows
+past its maximum size the least recently used documents are evicted.
+
+========
+Classes:
+========
+PubmedCache:     cache of Pubmed XML documents in a directory
+
+==========
+Functions:
+==========
+iter_articles:   yields (pmid, document) for each article in Pubmed XML
+
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+ARTICLE_START_RE = re.compile(r'<(PubmedArticle|PubmedBookArticle)>')
+PMID_RE = re.compile(r'<PMID[^>]*>(\d+)</PMID>')
+ARTICLE_SET_END = '\n</PubmedArticleSet>\n'
+
+# Bytes read at a time when splitting XML into articles.
+READ_SIZE = 64 * 1024
+
+
+def iter_articles(handle):
+    """Yield (pmid, document) for each article in a Pubmed XML handle.
+
+    The handle is an efetch response or a bulk file of the same format.
+    Each document is a complete PubmedArticleSet holding just that
+    article, under the handle's own XML and DOCTYPE declarations, so it
+    can be parsed on its own. The handle is read a block at a time.
+    """
+    buf = ''
+    header = None
+    eof = False
+    while True:
+        match = ARTICLE_START_RE.search(buf)
+        if match and header is None:
+            header = buf[:match.start()]
+        if match:
+            end_tag = '</%s>' % match.group(1)
+            end = buf.find(end_tag, match.end())
+            if end >= 0:
+                end += len(end_tag)
+                article = buf[match.start():end]
+                buf = buf[end:]
+                pmid = PMID_RE.search(article)
+                if pmid:
+                    yield (int(pmid.group(1)),
+                           header + article + ARTICLE_SET_END)
+                continue
+        if eof:
+            return
+        data = handle.read(READ_SIZE)
+        if not data:
+            eof = True
+        buf += data
+
+
+class PubmedCache(object):
+    """Cache of Pubmed XML documents, keyed by PMID, stored in path.
+
+    When the documents take up more than max_size bytes, the least
+    recently read or written are removed until they fit in 90% of it.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self._written = 0
+        self._checked = False
+
+    def _index_path(self, pmid):
+        pmid = str(pmid)
+        return os.path.join(self.path, 'pmid', pmid[-2:], pmid)
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest[2:])
+
+    def _write(self, path, content):
+        """Write content to path atomically, via a temporary file."""
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Made by another process meanwhile.
+                pass
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.rename(tmp_path, path)
+
+    def digest(self, pmid):
+        """Return digest of cached document for pmid, or None."""
+        try:
+            with open(self._index_path(pmid)) as index_file:
+                return index_file.read().strip() or None
+        except IOError:
+            return None
+
+    def get(self, pmid):
+        """Return cached document for pmid, or None if not cached."""
+        digest = self.digest(pmid)
+        if digest is None:
+            return None
+        object_path = self._object_path(digest)
+        try:
+            with open(object_path, 'rb') as object_file:
+                document = object_file.read()
+        except IOError:
+            # Evicted.
+            return None
+        if hashlib.sha1(document).hexdigest() != digest:
+            return None
+        try:
+            os.utime(object_path, None)
+        except OSError:
+            pass
+        return document
+
+    def set(self, pmid, document):
+        """Store document for pmid, and return its digest."""
+        digest = hashlib.sha1(document).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            self._write(object_path, document)
+            self._written += len(document)
+        else:
+            os.utime(object_path, None)
+        if self.digest(pmid) != digest:
+            self._write(self._index_path(pmid), digest)
+        # Check size on the first write, since other processes may have
+        # filled the cache, then after each tenth of max_size written.
+        if self._written > self.max_size / 10:
+            self._written = 0
+            self.evict()
+        elif not self._checked:
+            self.evict()
+        self._checked = True
+        return digest
+
+    def _objects(self):
+        """Return list of (mtime, size, path) for all cached documents."""
+        objects = []
+        for directory, _, filenames in os.walk(
+                os.path.join(self.path, 'objects')):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                objects.append((stat.st_mtime, stat.st_size, path))
+        return objects
+
+    def size(self):
+        """Return total bytes of cached documents."""
+        return sum([size for _, size, _ in self._objects()])
+
+    def evict(self):
+        """Remove least recently used documents if over max_size.
+
+        Returns number of documents removed. Index files of removed
+        documents are left behind, and are read as misses.
+        """
+        objects = self._objects()
+        total = sum([size for _, size, _ in objects])
+        if total <= self.max_size:
+            return 0
+        removed = 0
+        target = self.max_size * 9 / 10
+        for _, size, path in sorted(objects):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,6 @@
+from test_baseline import *
+from test_entrez import *
+from test_ingest import *
+from test_models import *
+from test_pubmed_cache import *
+from test_refresh import *
@@ -0,0 +1,122 @@
+"""
+Local HTTP server answering efetch requests from fixture Pubmed XML.
+
+========
+Classes:
+========
+PubmedFixtureServer:    efetch server running in a background thread
+
+"""
+import cgi
+import re
+import shutil
+import socket
+import tempfile
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from os.path import dirname, join
+from django.test.utils import override_settings
+
+FIXTURE_PATH = join(dirname(__file__), 'pubmed_efetch.xml')
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections is expected.
+        pass
+
+
+class PubmedFixtureServer(object):
+    """Serve Pubmed XML for requested PMIDs, as NCBI's efetch does.
+
+    Articles come from FIXTURE_PATH. Each request's PMIDs are recorded in
+    'requests', so tests can count round trips, and 'connections' counts
+    the keep-alive connections made. Status codes put in 'failures' are
+    answered, in order, before any further articles; 3xx statuses
+    redirect back to the server's url. Each server has its
+    own empty Pubmed cache directory, removed when the server stops.
+    """
+
+    def __init__(self, fixture_path=FIXTURE_PATH):
+        with open(fixture_path) as fixture:
+            xml = fixture.read()
+        self.head = xml[:xml.index('<PubmedArticle>')]
+        self.tail = '</PubmedArticleSet>\n'
+        self.articles = dict(
+            [(int(pmid), article) for article, pmid in re.findall(
+                r'(<PubmedArticle>.*?<PMID[^>]*>(\d+)</PMID>.*?'
+                r'</PubmedArticle>)', xml, re.S)])
+        self.requests = []
+        self.connections = 0
+        self.sockets = []
+        self.failures = []
+        self.cache_dir = tempfile.mkdtemp(prefix='getevidence-pubmed-')
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/efetch.fcgi' % self.httpd.server_port
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        # End handler threads waiting on keep-alive connections.
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def settings(self):
+        """Return override_settings using this server and its cache."""
+        return override_settings(PUBMED_EFETCH_URL=self.url,
+                                 PUBMED_CACHE_DIR=self.cache_dir,
+                                 PUBMED_OFFLINE=False)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                server.connections += 1
+                server.sockets.append(self.connection)
+
+            def do_POST(self):
+                length = int(self.headers.getheader('content-length'))
+                params = cgi.parse_qs(self.rfile.read(length))
+                if server.failures:
+                    status = server.failures.pop(0)
+                    self.send_response(status)
+                    if 300 <= status < 400:
+                        self.send_header('Location', server.url)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                pmids = [int(p) for p in params['id'][0].split(',')]
+                server.requests.append(pmids)
+                body = server.head + ''.join(
+                    [server.articles[p] for p in pmids
+                     if p in server.articles]) + server.tail
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/xml')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,81 @@
+"""
+Tests baseline.py in publications app.
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+from django.test import TestCase
+from ..baseline import iter_article_fields, load_pubmed_baseline
+from ..ingest import enqueue_fetch
+from ..models import Publication, PublicationFetchJob
+from ..pubmed import parse_document, publication_fields
+from ..pubmed_cache import iter_articles
+from .pubmed_server import FIXTURE_PATH
+
+
+class PubmedBaselineTest(TestCase):
+    """Tests loading Publications from Pubmed XML files."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='getevidence-baseline-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_fields_as_entrez(self):
+        """Test iterparse records map to the same fields as Entrez's."""
+        with open(FIXTURE_PATH) as xml_file:
+            loaded = list(iter_article_fields(xml_file))
+        with open(FIXTURE_PATH) as xml_file:
+            fetched = [publication_fields(parse_document(document))
+                       for _, document in iter_articles(xml_file)]
+        for fields in fetched:
+            fields.update(pending=False,
+                          content_hash=Publication.data_hash(fields))
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded, fetched)
+
+    def test_load(self):
+        """Test files are loaded, then reloaded without needless writes."""
+        gz_path = os.path.join(self.tmp_dir, 'pubmed.xml.gz')
+        with open(FIXTURE_PATH) as xml_file:
+            gz_file = gzip.open(gz_path, 'wb')
+            gz_file.write(xml_file.read())
+            gz_file.close()
+        pending = enqueue_fetch(1000002)
+        counts = load_pubmed_baseline(gz_path, batch_size=2)
+        self.assertEqual(counts, {'created': 2, 'updated': 1, 'unchanged': 0})
+        self.assertEqual(Publication.objects.count(), 3)
+        pub = Publication.pub_lookup(1000002)
+        self.assertEqual(pub.pk, pending.pk)
+        self.assertFalse(pub.pending)
+        self.assertEqual(PublicationFetchJob.objects.get().status, 'don')
+
+        Publication.objects.filter(pmid=1000001).update(title='Old title')
+        # Look up existing rows, update the changed one, check citations.
+        with self.assertNumQueries(3):
+            counts = load_pubmed_baseline(FIXTURE_PATH)
+        self.assertEqual(counts, {'created': 0, 'updated': 1, 'unchanged': 2})
+        self.assertEqual(Publication.pub_lookup(1000001).title,
+                         'A test article with many authors.')
+
+    def test_long_fields(self):
+        """Test values longer than their columns are cut to fit."""
+        with open(FIXTURE_PATH) as xml_file:
+            xml = xml_file.read()
+        xml = xml.replace(
+            '<ISOAbbreviation>Test J. Med.</ISOAbbreviation>',
+            '<ISOAbbreviation>J. Am. Acad. Child Adolesc. Psychiatry'
+            '</ISOAbbreviation>').replace(
+            '<MedlinePgn>1779-90</MedlinePgn>',
+            '<MedlinePgn>1779-90; discussion 1791-1799</MedlinePgn>')
+        path = os.path.join(self.tmp_dir, 'pubmed.xml')
+        with open(path, 'w') as xml_file:
+            xml_file.write(xml)
+        load_pubmed_baseline(path)
+        pub = Publication.pub_lookup(1000001)
+        self.assertEqual(pub.journal, 'J Am Acad Child Adolesc Psychi')
+        self.assertEqual(pub.journal_location, '352(17):1779-90; discussi')
+        self.assertEqual(load_pubmed_baseline(path)['unchanged'], 3)
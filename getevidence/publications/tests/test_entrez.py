@@ -0,0 +1,124 @@
+"""
+Tests entrez.py in publications app.
+"""
+
+import os
+import tempfile
+import threading
+from django.test import TestCase
+from ..entrez import EntrezClient, EntrezError, TokenBucket
+from .pubmed_server import PubmedFixtureServer
+
+
+class FakeClock(object):
+    """Clock for TokenBucket tests; sleeping moves the time on."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class EntrezTest(TestCase):
+    """Tests EntrezClient against a local efetch server."""
+
+    def setUp(self):
+        self.server = PubmedFixtureServer().start()
+        fd, self.rate_file = tempfile.mkstemp(prefix='getevidence-rate-')
+        os.close(fd)
+        self.client = EntrezClient('test@example.org', 'test',
+                                   max_retries=2, backoff=0.001)
+
+    def tearDown(self):
+        self.server.stop()
+        os.remove(self.rate_file)
+
+    def efetch(self, pmids):
+        return self.client.request(self.server.url,
+                                   {'db': 'pubmed', 'id': pmids})
+
+    def test_keep_alive(self):
+        """Test connections are reused once responses are read."""
+        for pmid in ['1000001', '1000002', '1000003']:
+            with self.efetch(pmid) as response:
+                self.assertTrue(pmid in response.read())
+        self.assertEqual(self.server.connections, 1)
+
+        # An unfinished response's connection is not reused.
+        response = self.efetch('1000001')
+        response.read(10)
+        response.close()
+        self.efetch('1000002').close()
+        self.assertEqual(self.server.connections, 2)
+        stats = self.client.stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['connections'], 2)
+        self.assertTrue(stats['latency_max'] >= stats['latency_p50'] > 0)
+
+    def test_retries(self):
+        """Test 429 and 5xx responses are retried, other errors raised."""
+        self.server.failures = [429, 503]
+        with self.efetch('1000001') as response:
+            self.assertTrue('1000001' in response.read())
+        self.assertEqual(self.client.stats()['retries'], 2)
+
+        self.server.failures = [500, 502, 504]
+        self.assertRaises(EntrezError, self.efetch, '1000001')
+        self.server.failures = [400]
+        self.assertRaises(EntrezError, self.efetch, '1000001')
+        stats = self.client.stats()
+        self.assertEqual((stats['retries'], stats['failures']), (4, 2))
+        with self.efetch('1000002') as response:
+            self.assertTrue('1000002' in response.read())
+
+    def test_redirects(self):
+        """Test one redirect is followed, and a second one raised."""
+        self.server.failures = [301]
+        moved_url = self.server.url.replace('efetch', 'moved')
+        with self.client.request(moved_url, {'db': 'pubmed',
+                                             'id': '1000001'}) as response:
+            self.assertTrue('1000001' in response.read())
+        self.assertEqual(self.server.requests, [[1000001]])
+
+        self.server.failures = [301, 302]
+        try:
+            self.efetch('1000001')
+            self.fail('Second redirect not raised.')
+        except EntrezError as e:
+            self.assertTrue('HTTP 302' in str(e))
+            self.assertTrue('misconfigured' in str(e))
+        stats = self.client.stats()
+        self.assertEqual((stats['retries'], stats['failures']), (0, 1))
+
+    def test_token_bucket(self):
+        """Test buckets sharing a state file share one rate limit."""
+        clock = FakeClock()
+        buckets = [TokenBucket(self.rate_file, 2, burst=2,
+                               clock=clock.time, sleep=clock.sleep)
+                   for _ in range(2)]
+        self.assertEqual(buckets[0].acquire(), 0)
+        self.assertEqual(buckets[1].acquire(), 0)
+        self.assertEqual(buckets[0].acquire(), 0.5)
+        self.assertEqual(buckets[1].acquire(), 0.5)
+        clock.sleep(10)
+        self.assertEqual(buckets[1].acquire(), 0)
+        self.assertEqual(buckets[0].acquire(), 0)
+        self.assertEqual(buckets[0].acquire(), 0.5)
+
+    def test_rate_limited_threads(self):
+        """Test threads sharing a client keep to its rate."""
+        self.client.bucket = TokenBucket(self.rate_file, 50)
+        def fetch():
+            self.efetch('1000001').close()
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The first request needs no wait; the other three share 3/50 sec.
+        self.assertTrue(self.client.stats()['rate_limit_wait'] >= 0.05)
+        self.assertEqual(self.client.stats()['requests'], 4)
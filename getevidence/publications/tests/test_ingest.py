@@ -0,0 +1,87 @@
+"""
+Tests ingest.py in publications app.
+"""
+
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from ..ingest import claim_fetch_jobs, enqueue_fetch, process_fetch_queue
+from ..models import Publication, PublicationFetchJob
+from .pubmed_server import PubmedFixtureServer
+
+
+class PublicationsIngestTest(TestCase):
+    """Tests the publication fetch queue against a local efetch server."""
+
+    def setUp(self):
+        self.server = PubmedFixtureServer().start()
+        self.settings_override = self.server.settings()
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.stop()
+
+    def test_enqueue_fetch(self):
+        """Test new PMIDs get a pending Publication and one queued job."""
+        pub = enqueue_fetch(1000001)
+        self.assertTrue(pub.pending)
+        self.assertEqual(enqueue_fetch('1000001').pk, pub.pk)
+        self.assertEqual(PublicationFetchJob.objects.count(), 1)
+        self.assertEqual(self.server.requests, [])
+
+    def test_process_fetch_queue(self):
+        """Test queued fetches are batched and fill in pending data."""
+        for pmid in [1000001, 1000002, 1000003]:
+            enqueue_fetch(pmid)
+        counts = process_fetch_queue(batch_size=2)
+        self.assertEqual(counts, {'done': 3, 'retried': 0, 'dead': 0})
+        self.assertEqual(len(self.server.requests), 2)
+        pub = Publication.pub_lookup(1000002)
+        self.assertFalse(pub.pending)
+        self.assertEqual(pub.title, 'A test article without an abstract.')
+        self.assertEqual(
+            PublicationFetchJob.objects.filter(status='don').count(), 3)
+        self.assertEqual(process_fetch_queue(),
+                         {'done': 0, 'retried': 0, 'dead': 0})
+
+    def test_retry_and_dead_letter(self):
+        """Test failed fetches are retried later, then dead-lettered."""
+        enqueue_fetch(9999999)
+        counts = process_fetch_queue(max_attempts=2)
+        self.assertEqual(counts, {'done': 0, 'retried': 1, 'dead': 0})
+        job = PublicationFetchJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('que', 1))
+        self.assertTrue(job.run_after > timezone.now())
+        self.assertEqual(job.error, 'PMID not returned by Pubmed.')
+
+        # Not due yet; once due, the last attempt dead-letters it.
+        self.assertEqual(claim_fetch_jobs(), [])
+        PublicationFetchJob.objects.update(run_after=timezone.now())
+        counts = process_fetch_queue(max_attempts=2)
+        self.assertEqual(counts, {'done': 0, 'retried': 0, 'dead': 1})
+        job = PublicationFetchJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('dea', 2))
+        self.assertTrue(Publication.pub_lookup(9999999).pending)
+
+    def test_network_error(self):
+        """Test an unreachable server is recorded and retried."""
+        enqueue_fetch(1000001)
+        self.server.stop()
+        counts = process_fetch_queue()
+        self.assertEqual(counts, {'done': 0, 'retried': 1, 'dead': 0})
+        self.assertTrue(PublicationFetchJob.objects.get().error)
+        self.server = PubmedFixtureServer().start()
+
+    def test_claims(self):
+        """Test claimed jobs aren't claimed again until their claim expires."""
+        enqueue_fetch(1000001)
+        jobs = claim_fetch_jobs()
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].status, 'run')
+        self.assertEqual(claim_fetch_jobs(), [])
+        PublicationFetchJob.objects.update(
+            claimed=timezone.now() - timedelta(hours=1))
+        jobs = claim_fetch_jobs()
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].attempts, 2)
@@ -0,0 +1,74 @@
+"""
+Tests models.py in publications app.
+"""
+
+from django.test import TestCase
+from ..models import Publication
+from .pubmed_server import PubmedFixtureServer
+
+
+class PublicationsModelsTest(TestCase):
+    """Tests Publication against a local efetch fixture server."""
+
+    def setUp(self):
+        self.server = PubmedFixtureServer().start()
+        self.settings_override = self.server.settings()
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.stop()
+
+    def test_fetch_many(self):
+        """Test fetch_many creates Publications with one request per batch."""
+        pubs = Publication.fetch_many(['1000001', 1000002, 1000003, 1000002,
+                                       9999999])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(sorted(pubs.keys()), [1000001, 1000002, 1000003])
+        self.assertEqual(Publication.objects.count(), 3)
+
+        pub = pubs[1000001]
+        self.assertEqual(pub.title, 'A test article with many authors.')
+        self.assertEqual(pub.pub_date, '2005 Apr 28')
+        self.assertEqual(pub.journal, 'Test J Med')
+        self.assertEqual(pub.journal_location, '352(17):1779-90')
+        self.assertTrue(pub.author_list.startswith('Author1 A, Author2 B'))
+        self.assertTrue(pub.author_list.endswith('Author10 J, et al.'))
+        self.assertEqual(pub.abstract, ('First part of abstract. ' +
+                                        'Second part of abstract.'))
+        pub = pubs[1000002]
+        self.assertEqual(pub.author_list, 'Smith J.')
+        self.assertEqual(pub.pub_date, '1999')
+        self.assertEqual(pub.journal_location, '12:5-7')
+        self.assertEqual(pub.abstract, '')
+        self.assertEqual(pubs[1000003].journal_location, '3(1)')
+
+    def test_fetch_many_batches(self):
+        """Test fetch_many splits PMIDs into FETCH_BATCH_SIZE requests."""
+        Publication.FETCH_BATCH_SIZE = 2
+        try:
+            pubs = Publication.fetch_many([1000003, 1000001, 1000002])
+        finally:
+            Publication.FETCH_BATCH_SIZE = 200
+        self.assertEqual(self.server.requests, [[1000001, 1000002],
+                                                [1000003]])
+        self.assertEqual(len(pubs), 3)
+
+    def test_fetch_many_updates(self):
+        """Test fetch_many updates changed Publications in place."""
+        stale = Publication.objects.create(pmid=1000003, title='Old title',
+                                           pub_date='2010', journal='',
+                                           journal_location='')
+        pubs = Publication.fetch_many([1000003])
+        self.assertEqual(pubs[1000003].pk, stale.pk)
+        self.assertEqual(pubs[1000003].title, 'A third test article.')
+        self.assertEqual(Publication.objects.count(), 1)
+        self.assertEqual(Publication.fetch_many([]), {})
+
+    def test_fetch_many_cached(self):
+        """Test fetched Pubmed XML is cached and not requested again."""
+        Publication.fetch_many([1000001, 1000002])
+        pubs = Publication.fetch_many([1000001, 1000002, 1000003])
+        self.assertEqual(self.server.requests, [[1000001, 1000002],
+                                                [1000003]])
+        self.assertEqual(len(pubs), 3)
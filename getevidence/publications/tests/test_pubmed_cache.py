@@ -0,0 +1,97 @@
+"""
+Tests pubmed_cache.py in publications app.
+"""
+
+import os
+import shutil
+import tempfile
+from django.test import TestCase
+from django.test.utils import override_settings
+from ..management.commands.prime_pubmed_cache import prime_pubmed_cache
+from ..models import Publication
+from ..pubmed import fetch_documents, parse_document, pubmed_cache
+from ..pubmed_cache import PubmedCache, iter_articles
+from .pubmed_server import FIXTURE_PATH
+
+
+class PubmedCacheTest(TestCase):
+    """Tests the Pubmed cache and offline use of it."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix='getevidence-pubmed-')
+        self.settings_override = override_settings(
+            PUBMED_CACHE_DIR=self.cache_dir, PUBMED_OFFLINE=True)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir)
+
+    def test_iter_articles(self):
+        """Test Pubmed XML is split into parseable one-article documents."""
+        with open(FIXTURE_PATH) as xml_file:
+            articles = list(iter_articles(xml_file))
+        self.assertEqual([pmid for pmid, _ in articles],
+                         [1000001, 1000002, 1000003])
+        record = parse_document(articles[1][1])
+        self.assertEqual(record['MedlineCitation']['Article']['ArticleTitle'],
+                         'A test article without an abstract.')
+
+    def test_get_set(self):
+        """Test documents are stored by content and checked when read."""
+        cache = PubmedCache(self.cache_dir, 1024 * 1024)
+        self.assertEqual(cache.get(1000001), None)
+        digest = cache.set(1000001, '<xml>one</xml>')
+        self.assertEqual(cache.get(1000001), '<xml>one</xml>')
+        self.assertEqual(cache.set(1000001, '<xml>one</xml>'), digest)
+        cache.set(1000001, '<xml>changed</xml>')
+        self.assertEqual(cache.get(1000001), '<xml>changed</xml>')
+
+        # Damaged documents are misses.
+        with open(cache._object_path(cache.digest(1000001)), 'w') as f:
+            f.write('<xml>dam')
+        self.assertEqual(cache.get(1000001), None)
+
+    def test_evict(self):
+        """Test least recently used documents are evicted past max_size."""
+        cache = PubmedCache(self.cache_dir, 1000)
+        for pmid in range(10):
+            cache.set(pmid, str(pmid) * 100)
+            path = cache._object_path(cache.digest(pmid))
+            os.utime(path, (pmid, pmid))
+        self.assertEqual(cache.size(), 1000)
+        cache.get(0)
+        cache.set(10, 'x' * 100)
+        self.assertEqual(cache.evict(), 2)
+        self.assertEqual(cache.size(), 900)
+        self.assertEqual(cache.get(1), None)
+        self.assertEqual(cache.get(2), None)
+        self.assertEqual(cache.get(0), '0' * 100)
+        self.assertEqual(cache.get(10), 'x' * 100)
+
+    def test_evict_across_instances(self):
+        """Test sizes are checked on first write and writes add up."""
+        cache = PubmedCache(self.cache_dir, 1000)
+        for pmid in range(12):
+            cache._write(cache._object_path(str(pmid) * 40), 'x' * 100)
+        self.assertEqual(cache.size(), 1200)
+        PubmedCache(self.cache_dir, 1000).set(100, 'y' * 10)
+        self.assertEqual(cache.size(), 810)
+
+        # fetch_documents' cache counts writes over every call.
+        self.assertTrue(pubmed_cache() is pubmed_cache())
+        with override_settings(PUBMED_CACHE_MAX_SIZE=1000):
+            cache = pubmed_cache()
+            for pmid in range(50):
+                pubmed_cache().set(pmid, str(pmid) * 20)
+            self.assertTrue(cache.size() <= 1000)
+
+    def test_offline(self):
+        """Test a primed cache serves Publications with no network."""
+        self.assertEqual(list(fetch_documents([1000001])), [])
+        self.assertEqual(prime_pubmed_cache(FIXTURE_PATH), 3)
+        pubs = Publication.fetch_many([1000001, 1000003, 9999999])
+        self.assertEqual(sorted(pubs.keys()), [1000001, 1000003])
+        self.assertEqual(pubs[1000003].title, 'A third test article.')
+        pub = Publication.create(pmid=1000002)
+        self.assertEqual(pub.author_list, 'Smith J.')
@@ -0,0 +1,104 @@
+"""
+Tests refresh_publications command in publications app.
+"""
+
+from datetime import timedelta
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models.signals import post_save
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from ..management.commands.refresh_publications import refresh_publications
+from ..models import Publication
+from .pubmed_server import PubmedFixtureServer
+
+
+class RefreshPublicationsTest(TestCase):
+    """Tests refreshing stale Publications against a local efetch server."""
+
+    def setUp(self):
+        self.server = PubmedFixtureServer().start()
+        self.settings_override = self.server.settings()
+        self.settings_override.enable()
+        Publication.fetch_many([1000001, 1000002, 1000003])
+        self.saved = []
+        post_save.connect(self.record_save, sender=Publication)
+
+    def tearDown(self):
+        post_save.disconnect(self.record_save, sender=Publication)
+        self.settings_override.disable()
+        self.server.stop()
+
+    def record_save(self, sender, instance, **kwargs):
+        self.saved.append(instance.pmid)
+
+    def test_refresh(self):
+        """Test only stale Publications are checked, changed ones saved."""
+        self.assertEqual(refresh_publications(),
+                         {'checked': 0, 'changed': 0, 'failed': 0})
+        old = timezone.now() - timedelta(days=365)
+        Publication.objects.update(last_fetched=old)
+        Publication.objects.create(pmid=9999999, title='Withdrawn',
+                                   pub_date='2000', journal='',
+                                   journal_location='')
+        self.server.articles[1000001] = self.server.articles[1000001].replace(
+            'many authors', 'many authors (corrected)')
+        requests = len(self.server.requests)
+        self.saved = []
+
+        counts = refresh_publications(batch_size=2)
+        self.assertEqual(counts, {'checked': 4, 'changed': 1, 'failed': 1})
+        self.assertEqual(len(self.server.requests), requests + 2)
+        self.assertEqual(self.saved, [1000001])
+        pub = Publication.pub_lookup(1000001)
+        self.assertEqual(pub.title, 'A test article with many authors ' +
+                         '(corrected).')
+        self.assertTrue(pub.last_fetched > old)
+        self.assertEqual(pub.content_hash,
+                         Publication.data_hash(pub.__dict__))
+        self.assertTrue(Publication.pub_lookup(1000002).last_fetched > old)
+        # PMIDs NCBI doesn't return wait until they're stale again.
+        self.assertTrue(Publication.pub_lookup(9999999).last_fetched > old)
+        self.assertEqual(refresh_publications(),
+                         {'checked': 0, 'changed': 0, 'failed': 0})
+
+        # Failed batches count as failed, and are tried again next time.
+        Publication.objects.filter(pmid=1000003).update(last_fetched=old)
+        self.server.stop()
+        self.assertEqual(refresh_publications(),
+                         {'checked': 1, 'changed': 0, 'failed': 1})
+        self.assertEqual(refresh_publications(),
+                         {'checked': 1, 'changed': 0, 'failed': 1})
+        self.server = PubmedFixtureServer().start()
+
+    def test_limit(self):
+        """Test limit refreshes least recently fetched first."""
+        Publication.objects.update(
+            last_fetched=timezone.now() - timedelta(days=365))
+        Publication.objects.filter(pmid=1000002).update(last_fetched=None)
+        counts = refresh_publications(limit=2)
+        self.assertEqual(counts, {'checked': 2, 'changed': 0, 'failed': 0})
+        self.assertEqual(self.server.requests[-1], [1000001, 1000002])
+        self.assertEqual(self.saved, [])
+
+    def test_never_fetched_first(self):
+        """Test never fetched Publications come first, whatever the order."""
+        Publication.objects.update(
+            last_fetched=timezone.now() - timedelta(days=365))
+        Publication.objects.filter(pmid=1000003).update(last_fetched=None)
+        refresh_publications(limit=1)
+        self.assertEqual(self.server.requests[-1], [1000003])
+        refresh_publications(limit=3)
+        self.assertEqual(self.server.requests[-1], [1000001, 1000002])
+
+    def test_offline(self):
+        """Test offline refreshes leave Publications queued."""
+        Publication.objects.update(last_fetched=None)
+        with override_settings(PUBMED_OFFLINE=True):
+            self.assertEqual(refresh_publications(),
+                             {'checked': 3, 'changed': 0, 'failed': 3})
+            self.assertRaises(CommandError, call_command,
+                              'refresh_publications')
+        self.assertEqual(Publication.objects.filter(
+            last_fetched__isnull=True).count(), 3)
@@ -0,0 +1,243 @@
+"""
+=================
+Full-text search
+=================
+
+Full-text index of variant reviews, kept in the database's own full-text
+engine: an FTS5 table on SQLite, or a tsvector column with a GIN index on
+PostgreSQL. Each Variant has one document with four weighted parts:
+
+name:          variant name and gene name (most weight)
+summary:       review summary
+review:        long review and publication review summaries
+publications:  titles and abstracts of cited publications (least weight)
+
+The index table is made by syncdb, and models.py keeps documents up to
+date as reviews, publication reviews, publications and gene names are
+saved.
+
+index_variants:     (re)index documents of Variants by primary key
+rebuild_index:      reindex all Variants
+search_backend:     return index backend for the database, or None
+SearchResults:      ranked results of a query, sliceable for Paginator
+
+"""
+
+import re
+from django.db import connection, transaction
+from variants.models import Variant, VariantPublicationReview, VariantReview
+
+TABLE = 'search_variantdocument'
+
+# Number of Variants indexed at a time.
+BATCH_SIZE = 500
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SqliteBackend(object):
+    """Index in an FTS5 table, ranked by bm25, rowid is the Variant pk."""
+
+    # bm25 weights of name, summary, review and publications.
+    WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+    def create(self, cursor):
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS " + TABLE +
+                       " USING fts5(name, summary, review, publications,"
+                       " tokenize='porter unicode61')")
+
+    def exists(self, cursor):
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE name = %s",
+                       [TABLE])
+        return cursor.fetchone()[0] > 0
+
+    def delete(self, cursor, variant_ids):
+        cursor.execute("DELETE FROM " + TABLE + " WHERE rowid IN (" +
+                       ','.join(['%s'] * len(variant_ids)) + ")",
+                       list(variant_ids))
+
+    def insert(self, cursor, documents):
+        cursor.executemany("INSERT INTO " + TABLE + " (rowid, name, summary,"
+                           " review, publications) VALUES (%s, %s, %s, %s, %s)",
+                           documents)
+
+    def _match(self, terms):
+        return ' '.join(['"%s"' % term for term in terms])
+
+    def count(self, cursor, terms):
+        cursor.execute("SELECT count(*) FROM " + TABLE + " WHERE " + TABLE +
+                       " MATCH %s", [self._match(terms)])
+        return cursor.fetchone()[0]
+
+    def query(self, cursor, terms, offset, limit):
+        # bm25 is lower for better matches.
+        cursor.execute("SELECT rowid, -bm25(" + TABLE + ", %s, %s, %s, %s)"
+                       " AS rank FROM " + TABLE + " WHERE " + TABLE +
+                       " MATCH %s ORDER BY rank DESC, rowid LIMIT %s OFFSET %s",
+                       list(self.WEIGHTS) +
+                       [self._match(terms), limit, offset])
+        return cursor.fetchall()
+
+
+class PostgresBackend(object):
+    """Index in a tsvector column with a GIN index, ranked by ts_rank_cd."""
+
+    DOCUMENT = ("setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'C') || "
+                "setweight(to_tsvector('english', %s), 'D')")
+
+    # Callers check exists() first, rather than using IF NOT EXISTS and
+    # to_regclass, which need PostgreSQL 9.5 and 9.4.
+    def create(self, cursor):
+        cursor.execute("CREATE TABLE " + TABLE +
+                       " (variant_id integer PRIMARY KEY,"
+                       " document tsvector NOT NULL)")
+        cursor.execute("CREATE INDEX " + TABLE + "_gin ON " +
+                       TABLE + " USING gin(document)")
+
+    def exists(self, cursor):
+        cursor.execute("SELECT count(*) FROM pg_class WHERE relname = %s"
+                       " AND relkind = 'r' AND pg_table_is_visible(oid)",
+                       [TABLE])
+        return cursor.fetchone()[0] > 0
+
+    def delete(self, cursor, variant_ids):
+        cursor.execute("DELETE FROM " + TABLE + " WHERE variant_id IN (" +
+                       ','.join(['%s'] * len(variant_ids)) + ")",
+                       list(variant_ids))
+
+    def insert(self, cursor, documents):
+        cursor.executemany("INSERT INTO " + TABLE + " (variant_id, document)"
+                           " VALUES (%s, " + self.DOCUMENT + ")", documents)
+
+    def count(self, cursor, terms):
+        cursor.execute("SELECT count(*) FROM " + TABLE + " WHERE document @@"
+                       " plainto_tsquery('english', %s)", [' '.join(terms)])
+        return cursor.fetchone()[0]
+
+    def query(self, cursor, terms, offset, limit):
+        cursor.execute("SELECT variant_id, ts_rank_cd(document, query) AS rank"
+                       " FROM " + TABLE + ", plainto_tsquery('english', %s)"
+                       " query WHERE document @@ query"
+                       " ORDER BY rank DESC, variant_id LIMIT %s OFFSET %s",
+                       [' '.join(terms), limit, offset])
+        return cursor.fetchall()
+
+
+BACKENDS = {'sqlite': SqliteBackend,
+            'postgresql': PostgresBackend}
+
+
+def search_backend():
+    """Return index backend for the default database, or None."""
+    backend = BACKENDS.get(connection.vendor)
+    return backend() if backend else None
+
+
+def variant_documents(variant_ids):
+    """Return list of (pk, name, summary, review, publications) documents.
+
+    Variants that don't exist are left out.
+    """
+    documents = dict()
+    for pk, name, gene_name in Variant.objects.filter(
+            pk__in=variant_ids).values_list('pk', 'name', 'gene__hgnc_name'):
+        documents[pk] = [pk, name + ' ' + gene_name, '', [], []]
+    for variant_id, summary, review in VariantReview.objects.filter(
+            variant__in=documents.keys()).values_list(
+            'variant_id', 'review_summary', 'review_long'):
+        documents[variant_id][2] = summary
+        documents[variant_id][3].append(review)
+    for variant_id, summary, title, abstract in (
+            VariantPublicationReview.objects.filter(
+                variantreview__variant__in=documents.keys()).values_list(
+                'variantreview__variant_id', 'summary', 'publication__title',
+                'publication__abstract')):
+        documents[variant_id][3].append(summary)
+        documents[variant_id][4].extend([title, abstract])
+    return [(pk, name, summary, '\n'.join(review), '\n'.join(publications))
+            for pk, name, summary, review, publications in documents.values()]
+
+
+def index_variants(variant_ids):
+    """Replace index documents of Variants, dropping deleted Variants."""
+    backend = search_backend()
+    variant_ids = list(set(variant_ids))
+    if backend is None or not variant_ids:
+        return
+    cursor = connection.cursor()
+    for start in range(0, len(variant_ids), BATCH_SIZE):
+        batch = variant_ids[start:start + BATCH_SIZE]
+        backend.delete(cursor, batch)
+        backend.insert(cursor, variant_documents(batch))
+    transaction.commit_unless_managed()
+
+
+def rebuild_index():
+    """Create the index if needed and reindex every Variant.
+
+    Returns number of Variants indexed.
+    """
+    backend = search_backend()
+    if backend is None:
+        return 0
+    cursor = connection.cursor()
+    # Only run DDL if needed: on SQLite it commits any open transaction.
+    if not backend.exists(cursor):
+        backend.create(cursor)
+    cursor.execute("DELETE FROM " + TABLE)
+    variant_ids = list(Variant.objects.values_list('pk', flat=True))
+    index_variants(variant_ids)
+    transaction.commit_unless_managed()
+    return len(variant_ids)
+
+
+class SearchResults(object):
+    """Variants matching a query, best first, with a 'rank' attribute.
+
+    Every word in the query must match. Slicing runs the ranked query
+    for just that slice, so results can be paged with Paginator.
+    """
+
+    # Number of results on each page.
+    PAGE_SIZE = 20
+
+    def __init__(self, query):
+        self.query = query
+        self.terms = TERM_RE.findall(query)
+        self.backend = search_backend()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not self.terms or self.backend is None:
+                self._count = 0
+            else:
+                self._count = self.backend.count(connection.cursor(),
+                                                 self.terms)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        if key.stop is None:
+            stop = self.count()
+        else:
+            stop = key.stop
+        if not self.terms or self.backend is None or stop <= start:
+            return []
+        ranked = self.backend.query(connection.cursor(), self.terms,
+                                    start, stop - start)
+        variants = Variant.objects.select_related(
+            'gene', 'variantreview').in_bulk([pk for pk, _ in ranked])
+        results = []
+        for pk, rank in ranked:
+            if pk in variants:
+                variants[pk].rank = rank
+                results.append(variants[pk])
+        return results
@@ -0,0 +1,17 @@
+"""Rebuild the full-text search index."""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from ...index import rebuild_index, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Creates the search index if needed and reindexes every variant'
+
+    def handle(self, *args, **options):
+        if search_backend() is None:
+            raise CommandError('Full-text search needs SQLite or PostgreSQL.')
+        start = time.time()
+        count = rebuild_index()
+        self.stdout.write('Indexed %d variants in %.1fs.' %
+                          (count, time.time() - start))
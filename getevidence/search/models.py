@@ -0,0 +1,71 @@
+"""
+The search index isn't a Django model: its table is made here when syncdb
+runs, and these signal receivers keep its documents up to date.
+"""
+
+import sys
+from django.db import connection
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      post_syncdb)
+from genes.models import Gene
+from publications.models import Publication
+from variants.models import Variant, VariantPublicationReview, VariantReview
+from .index import index_variants, rebuild_index, search_backend
+
+
+def _create_search_index(sender, **kwargs):
+    """Create the search index table, indexing existing Variants."""
+    backend = search_backend()
+    if backend is not None and not backend.exists(connection.cursor()):
+        rebuild_index()
+
+
+def _index_variant(sender, instance, **kwargs):
+    """Index a saved or deleted Variant."""
+    index_variants([instance.pk])
+
+
+def _index_review(sender, instance, **kwargs):
+    """Index the Variant of a saved or deleted VariantReview."""
+    index_variants([instance.variant_id])
+
+
+def _index_publication_review(sender, instance, **kwargs):
+    """Index the Variant of a saved or deleted VariantPublicationReview."""
+    index_variants(VariantReview.objects.filter(
+        pk=instance.variantreview_id).values_list('variant_id', flat=True))
+
+
+def _index_publication(sender, instance, created, **kwargs):
+    """Index the Variants citing an updated Publication."""
+    if created:
+        return
+    index_variants(Variant.objects.filter(
+        variantreview__variantpublicationreview__publication=instance)
+        .values_list('pk', flat=True))
+
+
+def _remember_gene_name(sender, instance, **kwargs):
+    """Record a Gene's name as loaded, to notice changes on save."""
+    instance._indexed_hgnc_name = instance.hgnc_name
+
+
+def _index_gene(sender, instance, created, **kwargs):
+    """Index the Variants of a Gene whose name changed."""
+    if not created and instance.hgnc_name != instance._indexed_hgnc_name:
+        index_variants(Variant.objects.filter(gene=instance)
+                       .values_list('pk', flat=True))
+    instance._indexed_hgnc_name = instance.hgnc_name
+
+
+post_syncdb.connect(_create_search_index, sender=sys.modules[__name__])
+post_save.connect(_index_variant, sender=Variant)
+post_delete.connect(_index_variant, sender=Variant)
+post_save.connect(_index_review, sender=VariantReview)
+post_delete.connect(_index_review, sender=VariantReview)
+post_save.connect(_index_publication_review, sender=VariantPublicationReview)
+post_delete.connect(_index_publication_review,
+                    sender=VariantPublicationReview)
+post_save.connect(_index_publication, sender=Publication)
+post_init.connect(_remember_gene_name, sender=Gene)
+post_save.connect(_index_gene, sender=Gene)
@@ -0,0 +1,113 @@
+"""
+Tests full-text search in search app.
+"""
+
+import json
+import shutil
+import tempfile
+from django.conf import settings
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from genes.models import Gene
+from publications.management.commands.prime_pubmed_cache import prime_pubmed_cache
+from publications.models import Publication
+from publications.tests.pubmed_server import FIXTURE_PATH
+from variants.management.commands.add_external_gene_data import add_external_gene_data
+from variants.management.commands.sample_data import create_sample_data
+from variants.models import Variant
+from ..index import SearchResults, rebuild_index
+
+
+class SearchTest(TestCase):
+    """Tests the search index and search view."""
+
+    def setUp(self):
+        self.cl = Client()
+        add_external_gene_data(settings.SITE_ROOT + '/../external_data/getevidence_external_gene_data_mini.csv')
+        create_sample_data()
+
+    def names(self, query):
+        return [variant.name for variant in SearchResults(query)[:]]
+
+    def test_search(self):
+        """Test reviews are found by any form of their words."""
+        self.assertEqual(self.names('sickle'), ['HBB-E7V'])
+        self.assertEqual(self.names('Sickle cells'), ['HBB-E7V'])
+        self.assertEqual(self.names('sickle myeloproliferative'), [])
+        self.assertEqual(self.names('"OR" NOT*'), [])
+        self.assertEqual(self.names(''), [])
+        self.assertEqual(self.names('hemoglobin'), ['HBB-E7V'])
+
+    def test_incremental(self):
+        """Test edits, publications and deletions update the index."""
+        self.cl.post('/variant/JAK2-V617F/edit',
+                     {'review_summary': "Erythrocytosis.",
+                      'review_long': "Somatic.",
+                      'impact': 'pat',
+                      'inheritance': 'oth'})
+        self.assertEqual(self.names('erythrocytosis'), ['JAK2-V617F'])
+        self.assertEqual(self.names('somatic'), ['JAK2-V617F'])
+
+        # Publication data is indexed once it arrives.
+        self.cl.post('/variant/JAK2-V617F/add_pub', {'pmid': '1000002'})
+        self.assertEqual(self.names('abstract'), [])
+        cache_dir = tempfile.mkdtemp()
+        try:
+            with override_settings(PUBMED_CACHE_DIR=cache_dir):
+                prime_pubmed_cache(FIXTURE_PATH)
+                Publication.fetch_many([1000002])
+        finally:
+            shutil.rmtree(cache_dir)
+        self.assertEqual(self.names('without abstract'), ['JAK2-V617F'])
+
+        # Gene names are indexed too.
+        gene = Gene.objects.get(hgnc_symbol='JAK2')
+        gene.hgnc_name = 'Janus tyrosine kinase'
+        gene.save()
+        self.assertEqual(self.names('tyrosine'), ['JAK2-V617F'])
+
+        Variant.variant_lookup('JAK2-V617F').delete()
+        self.assertEqual(self.names('somatic'), [])
+
+    def test_ranking(self):
+        """Test matches in names and summaries rank above longer text."""
+        self.cl.post('/variant/JAK2-V617F/edit',
+                     {'review_summary': "Acquired mutation.",
+                      'review_long': "Unlike HBB-E7V, found in tumours.",
+                      'impact': 'pat',
+                      'inheritance': 'oth'})
+        results = SearchResults('HBB')[:]
+        self.assertEqual([v.name for v in results], ['HBB-E7V', 'JAK2-V617F'])
+        self.assertTrue(results[0].rank > results[1].rank)
+        self.assertEqual(SearchResults('HBB').count(), 2)
+        self.assertEqual([v.name for v in SearchResults('HBB')[1:5]],
+                         ['JAK2-V617F'])
+
+    def test_rebuild(self):
+        """Test rebuilding the index finds the same variants."""
+        before = self.names('disease')
+        self.assertTrue(before)
+        self.assertEqual(rebuild_index(), 3)
+        self.assertEqual(self.names('disease'), before)
+
+    def test_view(self):
+        """Test search page, paging and JSON results."""
+        response = self.cl.get('/search/?q=sickle')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([v.name for v in response.context['results']],
+                         ['HBB-E7V'])
+
+        SearchResults.PAGE_SIZE = 1
+        try:
+            response = self.cl.get('/search/?q=to&page=2&format=json')
+        finally:
+            SearchResults.PAGE_SIZE = 20
+        data = json.loads(response.content)
+        self.assertEqual((data['page'], data['num_pages']), (2, data['count']))
+        self.assertEqual(len(data['results']), 1)
+
+        # Count, ranked page of matches, and their Variants.
+        with self.assertNumQueries(3):
+            response = self.cl.get('/search/?q=sickle&format=json')
+        self.assertEqual(json.loads(response.content)['count'], 1)
@@ -0,0 +1,8 @@
+from django.conf.urls import patterns, url
+
+from . import views
+
+urlpatterns = patterns(
+    '',
+    url(r'^$', views.search, name='search'),
+)
@@ -0,0 +1,49 @@
+"""
+============
+Search views
+============
+
+Views
+=====
+search:   view listing Variants matching a full-text query, best first
+
+"""
+
+import json
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.http import HttpResponse
+from django.shortcuts import render
+from .index import SearchResults, search_backend
+
+
+def search(request):
+    """List Variants whose reviews or cited publications match 'q'.
+
+    GET parameters: 'q' (words to match, all required), 'page', and
+    'format' ('json' for JSON instead of HTML).
+    """
+    query = request.GET.get('q', '')
+    paginator = Paginator(SearchResults(query), SearchResults.PAGE_SIZE)
+    try:
+        results = paginator.page(request.GET.get('page'))
+    except PageNotAnInteger:
+        results = paginator.page(1)
+    except EmptyPage:
+        results = paginator.page(paginator.num_pages)
+    if request.GET.get('format') == 'json':
+        return HttpResponse(json.dumps(
+            {'query': query,
+             'count': paginator.count,
+             'page': results.number,
+             'num_pages': paginator.num_pages,
+             'results': [{'name': variant.name,
+                          'review_summary':
+                              variant.variantreview.review_summary,
+                          'rank': variant.rank}
+                         for variant in results],
+             }), content_type='application/json')
+    return render(request, 'search/results.html',
+                  {'query': query,
+                   'results': results,
+                   'available': search_backend() is not None,
+                   })
@@ -0,0 +1,174 @@
+"""
+==================
+Variant annotation
+==================
+
+Functions for matching a file of variant strings (e.g. "HBB-E7V", one per
+line) against Variant and VariantReview data and writing a CSV report.
+
+read_variant_batches:  Yields lists of variant strings read from a file
+annotate_batch:        Returns report rows and counts for a list of strings
+run_annotation_job:    Runs an AnnotationJob, writing its report
+start_annotation_job:  Starts an AnnotationJob in a background process
+
+Input is read and reports are written one batch at a time, so memory use
+does not depend on the size of the input file.
+
+"""
+
+import csv
+import subprocess
+import sys
+from collections import deque
+from multiprocessing import Pool
+from os.path import join
+from django import db
+from django.conf import settings
+from django.utils import timezone
+from .models import AnnotationJob, Variant, VariantReview
+
+REPORT_HEADER = ['variant', 'status', 'impact', 'inheritance',
+                 'evidence_computational', 'evidence_functional',
+                 'evidence_casecontrol', 'evidence_familial',
+                 'clinical_severity', 'clinical_treatability',
+                 'clinical_penetrance']
+
+SCORE_FIELDS = REPORT_HEADER[4:]
+
+# Number of variant strings matched by a worker in one go.
+BATCH_SIZE = 1000
+
+
+def read_variant_batches(variant_file, batch_size=BATCH_SIZE):
+    """Yield lists of up to batch_size variant strings from variant_file.
+
+    Blank lines and lines starting with '#' are skipped.
+    """
+    batch = list()
+    for line in variant_file:
+        variant_string = line.strip()
+        if not variant_string or variant_string.startswith('#'):
+            continue
+        batch.append(variant_string)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = list()
+    if batch:
+        yield batch
+
+
+def annotate_batch(variant_strings):
+    """Match variant strings and return (report rows, counts).
+
+    Rows are in input order and follow REPORT_HEADER. Counts is a dict
+    with the number of 'found', 'missing' and 'malformed' strings.
+    """
+    results = Variant.variant_lookup_many(variant_strings)
+    found = results['found']
+    reviews = dict(
+        (review.variant_id, review) for review in
+        VariantReview.objects.filter(
+            variant__in=[variant.pk for variant in found.values()]))
+    missing = set(results['missing'])
+
+    rows = list()
+    for variant_string in variant_strings:
+        if variant_string in found:
+            review = reviews.get(found[variant_string].pk)
+            if review:
+                scores = [getattr(review, field) for field in SCORE_FIELDS]
+                rows.append([variant_string, 'found',
+                             review.get_impact_display(),
+                             review.get_inheritance_display()] +
+                            ['' if score is None else score
+                             for score in scores])
+                continue
+            rows.append([variant_string, 'found'])
+        elif variant_string in missing:
+            rows.append([variant_string, 'missing'])
+        else:
+            rows.append([variant_string, 'malformed'])
+    counts = {'found': 0, 'missing': 0, 'malformed': 0}
+    for row in rows:
+        counts[row[1]] += 1
+    return rows, counts
+
+
+def _annotated_batches(batches, workers):
+    """Yield annotate_batch results for batches, in order.
+
+    With more than one worker, batches are spread over a process pool.
+    At most two batches per worker are in flight at once, so the input is
+    never read far ahead of the report being written.
+    """
+    if workers <= 1:
+        for batch in batches:
+            yield annotate_batch(batch)
+        return
+    # Workers open their own database connections; don't share ours.
+    db.close_connection()
+    pool = Pool(workers)
+    try:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(annotate_batch, (batch,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run_annotation_job(job, workers=1, batch_size=BATCH_SIZE):
+    """Annotate the input file of an AnnotationJob and write its report.
+
+    Progress counts are saved to the job after each batch. If annotation
+    fails the job is marked as failed and the exception is re-raised.
+    """
+    job.status = 'run'
+    job.started = timezone.now()
+    job.save()
+    try:
+        with open(job.input_path) as infile:
+            with open(job.report_path, 'wb') as outfile:
+                report = csv.writer(outfile, lineterminator='\n')
+                report.writerow(REPORT_HEADER)
+                batches = read_variant_batches(infile, batch_size)
+                for rows, counts in _annotated_batches(batches, workers):
+                    report.writerows(rows)
+                    job.processed += len(rows)
+                    job.found += counts['found']
+                    job.missing += counts['missing']
+                    job.malformed += counts['malformed']
+                    AnnotationJob.objects.filter(pk=job.pk).update(
+                        processed=job.processed, found=job.found,
+                        missing=job.missing, malformed=job.malformed)
+        job.status = 'don'
+    except Exception as e:
+        job.status = 'err'
+        job.error = str(e)
+        raise
+    finally:
+        job.finished = timezone.now()
+        job.save()
+
+
+def start_annotation_job(job):
+    """Start running an AnnotationJob.
+
+    Normally the job is handed to a separate "manage.py annotate_variants"
+    process so the request returns at once. If ANNOTATION_BACKGROUND is
+    False (e.g. in tests) the job is run before returning. The job must
+    already be committed, so the other process can find it.
+    """
+    if not getattr(settings, 'ANNOTATION_BACKGROUND', True):
+        run_annotation_job(job)
+        return
+    subprocess.Popen([sys.executable, join(settings.SITE_ROOT, 'manage.py'),
+                      'annotate_variants', '--job', str(job.pk),
+                      '--workers', str(settings.ANNOTATION_WORKERS),
+                      '--settings', settings.SETTINGS_MODULE],
+                     close_fds=True)
@@ -0,0 +1,166 @@
+"""
+==============
+Variant export
+==============
+
+Functions for streaming all Variant and VariantReview data as CSV or
+newline-delimited JSON, optionally gzip compressed.
+
+export_records:  Yields a dict of exported data for each Variant
+csv_lines:       Yields CSV lines for records
+json_lines:      Yields JSON lines for records
+gzip_chunks:     Yields gzip-compressed data for a stream of strings
+export_chunks:   Yields exported data in a given format
+latest_revision: Returns id of latest revision that includes a Variant
+
+Variants are read by primary key in chunks of CHUNK_SIZE, with dbSNP IDs,
+publication PMIDs and latest revisions fetched for each chunk, so memory
+use does not depend on the number of Variants.
+
+"""
+
+import csv
+import json
+import zlib
+from StringIO import StringIO
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Max
+from reversion.models import Version
+from .models import Variant, VariantPublicationReview
+
+EXPORT_FIELDS = ['variant', 'gene', 'aa_reference', 'aa_position',
+                 'aa_variant', 'revision', 'impact', 'inheritance',
+                 'evidence_computational', 'evidence_functional',
+                 'evidence_casecontrol', 'evidence_familial',
+                 'clinical_severity', 'clinical_treatability',
+                 'clinical_penetrance', 'review_summary', 'review_long',
+                 'dbsnps', 'pmids']
+
+REVIEW_FIELDS = EXPORT_FIELDS[6:17]
+
+# Number of Variants read per query.
+CHUNK_SIZE = 500
+
+# Size of uncompressed output pieces, in bytes.
+BUFFER_SIZE = 64 * 1024
+
+
+def _variant_versions():
+    return Version.objects.filter(
+        content_type=ContentType.objects.get_for_model(Variant))
+
+
+def latest_revision():
+    """Return id of the latest revision including any Variant, or 0."""
+    return _variant_versions().aggregate(
+        Max('revision'))['revision__max'] or 0
+
+
+def export_records(since=None, chunk_size=CHUNK_SIZE):
+    """Yield a dict of EXPORT_FIELDS data for each Variant, by primary key.
+
+    If since is given, only Variants changed in later revisions are
+    exported. 'dbsnps' and 'pmids' are lists.
+    """
+    variants = Variant.objects.select_related(
+        'gene', 'variantreview').order_by('pk')
+    if since is not None:
+        variants = variants.filter(pk__in=_variant_versions().filter(
+            revision__id__gt=since).values('object_id_int'))
+    last_pk = 0
+    while True:
+        chunk = list(variants.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        pks = [variant.pk for variant in chunk]
+
+        dbsnps = dict((pk, list()) for pk in pks)
+        for pk, rsid in Variant.dbsnps.through.objects.filter(
+                variant__in=pks).values_list('variant_id', 'dbsnp__rsid'):
+            dbsnps[pk].append(rsid)
+        pmids = dict((pk, list()) for pk in pks)
+        for pk, pmid in VariantPublicationReview.objects.filter(
+                variantreview__variant__in=pks).values_list(
+                'variantreview__variant_id', 'publication__pmid'):
+            pmids[pk].append(pmid)
+        revisions = dict(_variant_versions().filter(
+            object_id_int__in=pks).values_list(
+            'object_id_int').annotate(Max('revision')))
+
+        for variant in chunk:
+            record = {'variant': variant.name,
+                      'gene': variant.gene.hgnc_symbol,
+                      'aa_reference': variant.aa_reference,
+                      'aa_position': variant.aa_position,
+                      'aa_variant': variant.aa_variant,
+                      'revision': revisions.get(variant.pk, 0),
+                      'dbsnps': sorted(dbsnps[variant.pk]),
+                      'pmids': sorted(pmids[variant.pk]),
+                      }
+            for field in REVIEW_FIELDS:
+                record[field] = getattr(variant.variantreview, field)
+            yield record
+
+
+def _buffered(pieces, size=BUFFER_SIZE):
+    """Join a stream of small strings into pieces of about size bytes."""
+    buf = list()
+    buf_size = 0
+    for piece in pieces:
+        buf.append(piece)
+        buf_size += len(piece)
+        if buf_size >= size:
+            yield ''.join(buf)
+            buf = list()
+            buf_size = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def csv_lines(records):
+    """Yield a CSV header line, then a CSV line for each record."""
+    line = StringIO()
+    writer = csv.writer(line, lineterminator='\n')
+
+    def format_line(row):
+        writer.writerow([unicode(value).encode('utf-8')
+                         if value is not None else '' for value in row])
+        value = line.getvalue()
+        line.seek(0)
+        line.truncate()
+        return value
+
+    yield format_line(EXPORT_FIELDS)
+    for record in records:
+        record['dbsnps'] = ' '.join(record['dbsnps'])
+        record['pmids'] = ' '.join(str(pmid) for pmid in record['pmids'])
+        yield format_line([record[field] for field in EXPORT_FIELDS])
+
+
+def json_lines(records):
+    """Yield a line of compact JSON for each record."""
+    for record in records:
+        yield json.dumps(record, separators=(',', ':'), sort_keys=True) + '\n'
+
+
+def gzip_chunks(pieces):
+    """Yield gzip-compressed data for a stream of strings."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(output_format='csv', compress=False, since=None):
+    """Yield exported data as CSV ('csv') or JSON lines ('json')."""
+    if output_format == 'json':
+        lines = json_lines(export_records(since=since))
+    else:
+        lines = csv_lines(export_records(since=since))
+    chunks = _buffered(lines)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    return chunks
@@ -1,5 +1,6 @@
 import re
 from django import forms
+from genes.models import AmbiguousGeneAlias, gene_resolver
 from .models import Gene, Variant, VariantReview, VariantPublicationReview
 
 class VariantReviewForm(forms.ModelForm):
@@ -30,6 +31,10 @@ class AddVarPubReviewForm(forms.Form):
     pmid = forms.IntegerField(min_value=1)
 
 
+class AnnotationUploadForm(forms.Form):
+    variant_file = forms.FileField()
+
+
 class NewVariantForm(forms.Form):
     gene = forms.CharField()
     aa_reference = forms.CharField()
@@ -37,12 +42,20 @@ class NewVariantForm(forms.Form):
     aa_variant = forms.CharField()
 
     def clean_gene(self):
+        """Return current symbol of the gene, which may be given by alias."""
         try:
-            gene = Gene.objects.get(hgnc_symbol=self.cleaned_data['gene'])
-            return self.cleaned_data['gene']
+            symbol = gene_resolver.resolve(self.cleaned_data['gene'])
+        except AmbiguousGeneAlias as e:
+            raise forms.ValidationError('Gene alias "' + e.alias +
+                                        '" could mean any of: ' +
+                                        ', '.join(e.symbols) + '.')
         except Gene.DoesNotExist:
             raise forms.ValidationError('No gene in database with gene symbol "' +
                                         self.cleaned_data['gene'] + '".')
+        if gene_resolver.is_retired(symbol):
+            raise forms.ValidationError('Gene "' + symbol +
+                                        '" has been retired from HGNC data.')
+        return symbol
 
     def clean_aa_reference(self):
         single_letter = '[ACDEFGHIKLMNPQRSTVWY]'
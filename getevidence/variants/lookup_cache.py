@@ -0,0 +1,89 @@
+"""
+====================
+Variant lookup cache
+====================
+
+VariantLookupCache: Bounded, process-local LRU map of variant strings
+                    (e.g. "HBB-E7V") to Variant primary keys.
+
+Entries are dropped by signal receivers in models.py whenever a Variant
+or Gene is saved or deleted, so a cached key never outlives the rows that
+produced it.
+
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class VariantLookupCache(object):
+    """Bounded LRU cache of variant strings to Variant primary keys.
+
+    Data attributes:
+    max_size: maximum number of entries kept (int)
+    hits:     number of lookups answered from the cache (int)
+    misses:   number of lookups not found in the cache (int)
+
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_pk = dict()
+
+    def get(self, variant_string):
+        """Return cached primary key for variant_string, or None."""
+        with self._lock:
+            try:
+                pk = self._entries.pop(variant_string)
+            except KeyError:
+                self.misses += 1
+                return None
+            # Re-insert to mark as most recently used.
+            self._entries[variant_string] = pk
+            self.hits += 1
+            return pk
+
+    def set(self, variant_string, pk):
+        """Cache primary key for variant_string, evicting the oldest entry."""
+        with self._lock:
+            self._remove(variant_string)
+            self._entries[variant_string] = pk
+            self._keys_by_pk[pk] = variant_string
+            if len(self._entries) > self.max_size:
+                oldest, oldest_pk = self._entries.popitem(last=False)
+                del self._keys_by_pk[oldest_pk]
+
+    def discard(self, variant_string):
+        """Remove entry for variant_string, if present."""
+        with self._lock:
+            self._remove(variant_string)
+
+    def discard_pk(self, pk):
+        """Remove entry for the Variant with primary key pk, if present."""
+        with self._lock:
+            if pk in self._keys_by_pk:
+                self._remove(self._keys_by_pk[pk])
+
+    def clear(self):
+        """Remove all entries. Hit and miss counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_pk.clear()
+
+    def stats(self):
+        """Return dict with hit and miss counters and current size."""
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self._entries),
+                    'max_size': self.max_size,
+                    }
+
+    def _remove(self, variant_string):
+        pk = self._entries.pop(variant_string, None)
+        if pk is not None:
+            del self._keys_by_pk[pk]
@@ -2,13 +2,23 @@
 
 import csv
 import sys
+import time
+from optparse import make_option
 from django.core.management.base import BaseCommand
-from ...models import Gene
+from django.db import transaction
+from genes.gene_data import GENE_FIELDS, read_gene_data, update_gene_registry
+from genes.models import GeneVariantSummary, gene_resolver
+from search.index import index_variants
+from ...models import Gene, Variant, variant_lookup_cache
 
 error_need_file = ("Please provide path to external gene data file as " +
                    "an argument.\nThis file should be generated by " +
                    "external_data/parse_external_data.py")
 
+# Number of new Genes created per query in bulk mode.
+BATCH_SIZE = 500
+
+
 def add_external_gene_data(gene_data_filepath):
     """Adds external gene-related data to database."""
     try:
@@ -32,11 +42,96 @@ def add_external_gene_data(gene_data_filepath):
         print error_need_file
 
 
+def bulk_add_external_gene_data(gene_data_filepath, batch_size=BATCH_SIZE):
+    """Adds external gene-related data to database in bulk.
+
+    Genes are matched to existing Genes by HGNC symbol. Existing Genes are
+    read in one query, new ones created in batches and changed ones
+    updated, all in one transaction. As in add_external_gene_data, blank
+    data leaves existing values alone. New Genes get an empty
+    GeneVariantSummary, and Variants of updated Genes are reindexed for
+    search. Returns dict counting 'created', 'updated' and 'unchanged'
+    Genes.
+    """
+    rows = list(read_gene_data(gene_data_filepath))
+
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    with transaction.commit_on_success():
+        existing = dict([(values[0], values) for values in
+                         Gene.objects.values_list('hgnc_symbol', 'pk',
+                                                  *GENE_FIELDS[1:])])
+        new_genes = []
+        updated = []
+        for fields in rows:
+            if fields['hgnc_symbol'] not in existing:
+                new_genes.append(Gene(**fields))
+                if len(new_genes) >= batch_size:
+                    Gene.objects.bulk_create(new_genes)
+                    new_genes = []
+                counts['created'] += 1
+                continue
+            values = existing[fields['hgnc_symbol']]
+            for field, value in zip(GENE_FIELDS[1:], values[2:]):
+                if not fields[field]:
+                    fields[field] = value
+            if list(values[2:]) == [fields[f] for f in GENE_FIELDS[1:]]:
+                counts['unchanged'] += 1
+                continue
+            Gene.objects.filter(pk=values[1]).update(**fields)
+            updated.append(values[1])
+        Gene.objects.bulk_create(new_genes)
+        if counts['created']:
+            GeneVariantSummary.create_missing(batch_size=batch_size)
+    counts['updated'] = len(updated)
+    # Bulk queries don't send post_save, which would clear these and
+    # reindex. Genes are matched by symbol, so none are renamed.
+    variant_lookup_cache.clear()
+    gene_resolver.clear()
+    for start in range(0, len(updated), batch_size):
+        index_variants(Variant.objects.filter(
+            gene__in=updated[start:start + batch_size]).values_list(
+            'pk', flat=True))
+    return counts
+
+
 class Command(BaseCommand):
+    args = '<gene_data_file>'
     help = 'Adds external gene-related data to database'
+    option_list = BaseCommand.option_list + (
+        make_option('--bulk', action='store_true', dest='bulk',
+                    default=False,
+                    help='Create and update genes in bulk, in one ' +
+                         'transaction'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=BATCH_SIZE,
+                    help='Number of new genes created per query in bulk ' +
+                         'mode'),
+        )
 
     def handle(self, *args, **options):
+        if not options['bulk']:
+            try:
+                add_external_gene_data(args[0])
+            except IndexError:
+                print error_need_file
+                return
+            update_gene_registry()
+            return
+        if not args:
+            print error_need_file
+            return
+        start = time.time()
         try:
-            add_external_gene_data(args[0])
-        except IndexError:
+            counts = bulk_add_external_gene_data(
+                args[0], batch_size=options['batch_size'])
+        except IOError:
             print error_need_file
+            return
+        update_gene_registry()
+        elapsed = time.time() - start
+        total = sum(counts.values())
+        self.stdout.write('%d genes (%d created, %d updated, %d unchanged) '
+                          'in %.1fs, %.0f rows/sec.' %
+                          (total, counts['created'], counts['updated'],
+                           counts['unchanged'], elapsed,
+                           total / max(elapsed, 0.001)))
@@ -0,0 +1,53 @@
+"""Annotate a file of variant strings with GET-Evidence data."""
+
+import os
+import time
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ...annotation import BATCH_SIZE, run_annotation_job
+from ...models import AnnotationJob
+
+
+class Command(BaseCommand):
+    args = '<variant_file>'
+    help = ('Matches a file of variant strings (e.g. "HBB-E7V", one per ' +
+            'line) against reviewed variants and writes a CSV report')
+    option_list = BaseCommand.option_list + (
+        make_option('--report', dest='report',
+                    help='Path for the report (default: ANNOTATION_DIR)'),
+        make_option('--job', dest='job', type='int',
+                    help='Run an existing queued job instead of a file'),
+        make_option('--workers', dest='workers', type='int',
+                    default=settings.ANNOTATION_WORKERS,
+                    help='Number of worker processes'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=BATCH_SIZE,
+                    help='Number of variant strings per batch'),
+        )
+
+    def handle(self, *args, **options):
+        if options['job']:
+            try:
+                job = AnnotationJob.objects.get(pk=options['job'],
+                                                status='que')
+            except AnnotationJob.DoesNotExist:
+                raise CommandError('No queued job %d.' % options['job'])
+        elif args:
+            if not os.path.exists(args[0]):
+                raise CommandError('No such file: ' + args[0])
+            job = AnnotationJob.create(input_path=os.path.abspath(args[0]),
+                                       report_path=options['report'])
+        else:
+            raise CommandError('Please provide a variant file or --job.')
+
+        start = time.time()
+        run_annotation_job(job, workers=options['workers'],
+                           batch_size=options['batch_size'])
+        elapsed = time.time() - start
+        self.stdout.write('Annotated %d variants (%d found, %d missing, '
+                          '%d malformed) in %.1fs, %.0f variants/sec.' %
+                          (job.processed, job.found, job.missing,
+                           job.malformed, elapsed,
+                           job.processed / max(elapsed, 0.001)))
+        self.stdout.write('Report: ' + job.report_path)
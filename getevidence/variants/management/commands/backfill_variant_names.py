@@ -0,0 +1,38 @@
+"""Fill in stored names of Variants from their gene and amino acid change."""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ...models import Variant
+
+# Number of Variants read per query.
+CHUNK_SIZE = 1000
+
+
+def backfill_variant_names():
+    """Sets Variant.name wherever it differs from canonical_name().
+
+    Returns the number of Variants updated.
+    """
+    updated = 0
+    last_pk = 0
+    with transaction.commit_on_success():
+        while True:
+            chunk = list(Variant.objects.select_related('gene').filter(
+                pk__gt=last_pk).order_by('pk')[:CHUNK_SIZE])
+            if not chunk:
+                break
+            for variant in chunk:
+                if variant.name != variant.canonical_name():
+                    Variant.objects.filter(pk=variant.pk).update(
+                        name=variant.canonical_name())
+                    updated += 1
+            last_pk = chunk[-1].pk
+    return updated
+
+
+class Command(BaseCommand):
+    help = 'Fills in stored Variant names (e.g. after adding the name column)'
+
+    def handle(self, *args, **options):
+        updated = backfill_variant_names()
+        self.stdout.write('Updated names of %d variants.' % updated)
@@ -0,0 +1,36 @@
+"""Export all Variant and VariantReview data as CSV or JSON lines."""
+
+import sys
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from ...export import export_chunks, latest_revision
+
+
+class Command(BaseCommand):
+    help = ('Writes data for every variant (scores, dbSNP IDs, PMIDs) ' +
+            'as CSV or newline-delimited JSON')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='csv',
+                    help='Output format: csv (default) or json'),
+        make_option('--gzip', dest='gzip', action='store_true', default=False,
+                    help='Compress output with gzip'),
+        make_option('--since', dest='since', type='int',
+                    help='Only export variants changed after this revision'),
+        make_option('-o', '--output', dest='output',
+                    help='Output file (default: standard output)'),
+        )
+
+    def handle(self, *args, **options):
+        if options['format'] not in ('csv', 'json'):
+            raise CommandError('Format must be csv or json.')
+        revision = latest_revision()
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout
+        try:
+            for chunk in export_chunks(output_format=options['format'],
+                                       compress=options['gzip'],
+                                       since=options['since']):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+        sys.stderr.write('Exported up to revision %d.\n' % revision)
@@ -2,6 +2,7 @@
 
 from django.core.management.base import BaseCommand
 from django.test.client import Client
+from publications.ingest import process_fetch_queue
 from ...models import DbSNP, Variant
 
 def create_HBB_E7V():
@@ -156,3 +157,6 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         create_sample_data()
+        counts = process_fetch_queue()
+        self.stdout.write('Fetched %(done)d publications, %(retried)d to '
+                          'retry, %(dead)d dead.' % counts)
@@ -6,14 +6,32 @@ Variant models
 DbSNP:         Information for a dbSNP entry
 Variant:       Tracks immutable variant data
 VariantReview: Tracks user-editable data for a variant
+AnnotationJob: Tracks annotation of a file of variant strings
 
 """
 
+import hashlib
+import os
 import re
 import reversion
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.db import models
-from genes.models import Gene
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save, pre_delete, pre_save)
+from django.utils import timezone
+from genes.models import (AmbiguousGeneAlias, Gene, GeneVariantSummary,
+                          gene_resolver)
+from publications.ingest import enqueue_fetch
 from publications.models import Publication
+from reversion.models import Version
+from .lookup_cache import VariantLookupCache
+
+
+# Process-local cache of variant strings to Variant primary keys.
+variant_lookup_cache = VariantLookupCache(
+    max_size=getattr(settings, 'VARIANT_LOOKUP_CACHE_SIZE', 1024))
 
 
 class DbSNP(models.Model):
@@ -36,6 +54,21 @@ class DbSNP(models.Model):
         return self.rsid
 
 
+class VariantManager(models.Manager):
+    """Manager for Variant, adding queries for data shown on Variant pages."""
+
+    def with_review_bundle(self):
+        """Return QuerySet of Variants with the data shown on their pages.
+
+        Gene and VariantReview are loaded in the same query. dbSNP IDs, and
+        VariantPublicationReviews with their Publications, are prefetched.
+        Evaluating the QuerySet costs four queries, however many Variants,
+        dbSNPs and publications are involved.
+        """
+        return self.select_related('gene', 'variantreview').prefetch_related(
+            'dbsnps', 'variantreview__variantpublicationreview_set__publication')
+
+
 class Variant(models.Model):
     """Tracks immutable variant data.
     
@@ -45,6 +78,8 @@ class Variant(models.Model):
     aa_position:  position of amino acid variant
     aa_variant:   variant amino acid(s) at this position
     dbsnps:       DbSNP (ManyToManyField)
+    name:         canonical variant string, e.g. "HBB-E7V" (CharField,
+                  unique, set on save)
     
     The combination of gene, aa_reference, aa_position, and aa_variant 
     is required to be unique.
@@ -52,6 +87,19 @@ class Variant(models.Model):
     """
     # Regex validates and parses strings representing variants.
     VARIANT_RE = r'^([A-Z0-9]+)-([A-Z]+)([0-9]+)([A-Z]+)$'
+    _variant_re = re.compile(VARIANT_RE)
+
+    # Number of variants listed per page of the variant index.
+    INDEX_PAGE_SIZE = 100
+
+    # Gene fields displayed on Variant pages, and so in their cache keys.
+    PAGE_GENE_FIELDS = ['hgnc_symbol', 'hgnc_name', 'hgnc_id',
+                        'ucsc_knowngene', 'ncbi_gene_id', 'mim_id',
+                        'clinical_testing', 'acmg_recommended', 'retired']
+
+    # Number of variant strings resolved per query by variant_lookup_many.
+    # Keeps IN clauses under SQLite's limit of 999 query parameters.
+    LOOKUP_BATCH_SIZE = 400
 
     # Combination of gene and amino acid change uniquely define Variant.
     gene = models.ForeignKey(Gene)
@@ -64,6 +112,11 @@ class Variant(models.Model):
     # ManyToMany because dbSNP entries can be duplicate or tri-allelic.
     dbsnps = models.ManyToManyField(DbSNP)
 
+    # Stored copy of canonical_name(), so lookups by name need no join.
+    name = models.CharField(max_length=50, unique=True, editable=False)
+
+    objects = VariantManager()
+
     @classmethod
     def create(cls, gene_name=None, aa_ref=None, aa_pos=None, aa_var=None):
         gene = Gene.objects.get(hgnc_symbol=gene_name)
@@ -92,8 +145,9 @@ class Variant(models.Model):
         After the dash is the reference amino acid, the amino acid position,
         and the variant amino acid.
         """
-        assert re.match(cls.VARIANT_RE, variant_string)
-        parsed = re.match(cls.VARIANT_RE, variant_string).groups()
+        match = cls._variant_re.match(variant_string)
+        assert match
+        parsed = match.groups()
         return { 'gene_name': parsed[0],
                  'aa_ref': parsed[1],
                  'aa_pos': int(parsed[2]),
@@ -102,27 +156,181 @@ class Variant(models.Model):
 
     @classmethod
     def variant_lookup(cls, variant_string):
-        """Find and return Variant in database matching identifying string."""
-        var_parse = cls.parse_variant(variant_string)
-        var_match = cls.objects.get(
-            gene__hgnc_symbol__exact=var_parse['gene_name'],
-            aa_reference__exact=var_parse['aa_ref'],
-            aa_position__exact=var_parse['aa_pos'],
-            aa_variant__exact=var_parse['aa_var'],
-            )
+        """Find and return Variant in database matching identifying string.
+
+        The string is matched against the indexed name column. Primary
+        keys of previously found Variants are kept in variant_lookup_cache,
+        so repeat lookups skip parsing and fetch by primary key. Only
+        well-formed strings are ever cached. The Variant's Gene is loaded
+        in the same query.
+
+        A gene alias (e.g. a previous symbol) in place of the current gene
+        symbol is resolved in memory by gene_resolver, and the Variant with
+        the current name is returned. Raises AmbiguousGeneAlias if the alias
+        belongs to more than one Gene.
+        """
+        pk = variant_lookup_cache.get(variant_string)
+        if pk is not None:
+            try:
+                var_match = cls.objects.select_related('gene').get(pk=pk)
+                # Guard against changes made by another process.
+                if var_match.name == variant_string:
+                    return var_match
+            except cls.DoesNotExist:
+                pass
+            variant_lookup_cache.discard(variant_string)
+        parsed = cls.parse_variant(variant_string)
+        try:
+            gene_symbol = gene_resolver.resolve(parsed['gene_name'])
+        except AmbiguousGeneAlias:
+            raise
+        except Gene.DoesNotExist:
+            raise cls.DoesNotExist('No gene for variant "%s".' %
+                                   variant_string)
+        if gene_symbol != parsed['gene_name']:
+            return cls.variant_lookup(
+                gene_symbol + variant_string[len(parsed['gene_name']):])
+        var_match = cls.objects.select_related('gene').get(
+            name__exact=variant_string)
+        variant_lookup_cache.set(variant_string, var_match.pk)
         return var_match
 
+    @classmethod
+    def variant_lookup_many(cls, variant_strings):
+        """Find Variants matching many identifying strings at once.
+
+        Strings are validated and resolved in batches of LOOKUP_BATCH_SIZE,
+        each batch a single query on the indexed name column, so the number
+        of queries is bounded by the number of batches rather than the
+        number of strings.
+
+        Gene aliases are resolved in memory, as in variant_lookup. Strings
+        with an ambiguous alias are reported as missing, and listed with
+        the Genes the alias could mean.
+
+        Returns a dict with:
+        'found':     dict mapping variant string to Variant
+        'missing':   list of well-formed strings with no matching Variant
+        'malformed': list of strings that failed to parse
+        'ambiguous': dict mapping strings with an ambiguous gene alias to
+                     lists of gene symbols
+        """
+        results = {'found': dict(), 'missing': list(), 'malformed': list(),
+                   'ambiguous': dict()}
+        parsed = list()
+        seen = set()
+        for variant_string in variant_strings:
+            if variant_string in seen:
+                continue
+            seen.add(variant_string)
+            try:
+                gene_name = cls.parse_variant(variant_string)['gene_name']
+            except AssertionError:
+                results['malformed'].append(variant_string)
+                continue
+            try:
+                gene_symbol = gene_resolver.resolve(gene_name,
+                                                    check_database=False)
+            except AmbiguousGeneAlias as e:
+                results['ambiguous'][variant_string] = e.symbols
+                results['missing'].append(variant_string)
+                continue
+            except Gene.DoesNotExist:
+                # Perhaps added by another process: look up as given.
+                gene_symbol = gene_name
+            parsed.append((variant_string, gene_symbol +
+                           variant_string[len(gene_name):]))
+
+        for start in range(0, len(parsed), cls.LOOKUP_BATCH_SIZE):
+            batch = parsed[start:start + cls.LOOKUP_BATCH_SIZE]
+            by_name = dict((variant.name, variant) for variant in
+                           cls.objects.filter(
+                               name__in=[name for unused, name in batch]))
+            for variant_string, name in batch:
+                if name in by_name:
+                    results['found'][variant_string] = by_name[name]
+                else:
+                    results['missing'].append(variant_string)
+        return results
+
+    @classmethod
+    def index_page(cls, after=None, page_size=None):
+        """Return one page of Variants in index order, and the next cursor.
+
+        Variants are ordered by their indexed name column. Pages are found
+        by keyset: 'after' is the name of the last Variant on the previous
+        page, and only Variants sorting after it are fetched, so a page
+        costs one query regardless of table size.
+
+        Returns a tuple of (list of Variants, cursor for next page or None).
+        """
+        page_size = page_size or cls.INDEX_PAGE_SIZE
+        variants = cls.objects.order_by('name')
+        if after:
+            variants = variants.filter(name__gt=after)
+        # Fetch one extra row to learn whether another page follows.
+        variant_list = list(variants[:page_size + 1])
+        if len(variant_list) > page_size:
+            variant_list = variant_list[:page_size]
+            return variant_list, variant_list[-1].name
+        return variant_list, None
+
     class Meta:
         """Defines combination of gene and amino acid change as unique."""
         unique_together = (('gene', 'aa_reference', 
                             'aa_position', 'aa_variant'),)
 
-    def __unicode__(self):
+    def latest_revision(self):
+        """Return (id, date created) of latest revision including Variant.
+
+        VariantReview and VariantPublicationReview revisions follow their
+        Variant, and changes to dbSNP IDs save a revision of the Variant,
+        so this changes whenever data displayed for the Variant changes.
+        Returns (0, None) if the Variant has no revisions.
+        """
+        latest = Version.objects.filter(
+            content_type=ContentType.objects.get_for_model(Variant),
+            object_id_int=self.pk,
+            ).order_by('-revision').values_list(
+            'revision_id', 'revision__date_created')[:1]
+        return latest[0] if latest else (0, None)
+
+    def gene_state(self):
+        """Return hash of the Gene data displayed with the Variant.
+
+        Gene data changes outside Variant revisions (e.g. refreshes from
+        external gene data), so page keys include this as well.
+        """
+        values = [getattr(self.gene, field) for field in self.PAGE_GENE_FIELDS]
+        return hashlib.md5(repr(values)).hexdigest()
+
+    def page_cache_key(self, page):
+        """Return cache key for a rendered page of the current Variant data.
+
+        The key includes the latest revision's date as well as its id, so
+        a rebuilt database reusing revision ids can't hit old entries, and
+        a hash of the Gene's data. Variants from variant_lookup have their
+        Gene loaded already.
+        """
+        revision_id, revision_date = self.latest_revision()
+        return 'variants:%s:%d:%d:%s:%s' % (
+            page, self.pk, revision_id,
+            revision_date.isoformat() if revision_date else '',
+            self.gene_state())
+
+    def canonical_name(self):
         """Returns string with gene name and amino acid change."""
         return (self.gene.hgnc_symbol + '-' + self.aa_reference +
                 str(self.aa_position) + self.aa_variant)
 
-    name = property(__unicode__)
+    def save(self, *args, **kwargs):
+        """Saves Variant, keeping name in sync with canonical_name()."""
+        self.name = self.canonical_name()
+        super(Variant, self).save(*args, **kwargs)
+
+    def __unicode__(self):
+        """Returns canonical variant string."""
+        return self.name
 
 
 class VariantReview(models.Model):
@@ -194,10 +402,46 @@ class VariantReview(models.Model):
     publications = models.ManyToManyField(Publication,
                                           through='VariantPublicationReview')
 
+    # Number of versions listed per page of review history.
+    HISTORY_PAGE_SIZE = 20
+
     def __unicode__(self):
         """Returns text containing long variant review."""
         return self.review_summary
 
+    def history(self):
+        """Return QuerySet of reversion Versions of review, newest first."""
+        return reversion.get_for_object(self)
+
+    def version_diff(self, version):
+        """Return list of review fields changed in a version of the review.
+
+        Each change is a dict with the field's 'name' and its 'old' and
+        'new' values (choice fields use display values). Versions never
+        change, so diffs are computed on first request and then cached.
+        """
+        cache_key = 'variants:review_diff:%d:%s' % (
+            version.pk, version.revision.date_created.isoformat())
+        diff = cache.get(cache_key)
+        if diff is not None:
+            return diff
+        previous = list(self.history().filter(pk__lt=version.pk)[:1])
+        old_data = previous[0].field_dict if previous else dict()
+        new_data = version.field_dict
+        diff = list()
+        for field in self._meta.fields:
+            if field.name in ('id', 'variant'):
+                continue
+            old = old_data.get(field.name)
+            new = new_data.get(field.name)
+            if old != new:
+                choices = dict(field.flatchoices)
+                diff.append({'name': field.verbose_name,
+                             'old': choices.get(old, old),
+                             'new': choices.get(new, new)})
+        cache.set(cache_key, diff, settings.VARIANT_PAGE_CACHE_TIMEOUT)
+        return diff
+
 
 class VariantPublicationReview(models.Model):
     """Tracks user-editable variant-specific publication reviews.
@@ -222,17 +466,210 @@ class VariantPublicationReview(models.Model):
 
     @classmethod
     def create(cls, variantreview=None, pmid=None):
-        try:
-            pub = Publication.pub_lookup(pmid)
-        except Publication.DoesNotExist:
-            pub = Publication.create(pmid=pmid)
-            pub.save()
+        """Create review of publication, queuing a Pubmed fetch if it's new.
+
+        Publications not yet in the database are created pending, and
+        their data is filled in by publications.ingest workers.
+        """
+        pub = enqueue_fetch(pmid)
         varpubreview = cls(variantreview=variantreview, publication=pub)
         varpubreview.save()
         return varpubreview
 
 
-# Register models with reversion.
-reversion.register(VariantReview)
-reversion.register(VariantPublicationReview)
+class AnnotationJob(models.Model):
+    """Tracks annotation of a file of variant strings.
+
+    Jobs are run by variants.annotation.run_annotation_job, which updates
+    the progress counts after each batch of variant strings.
+
+    Data attributes:
+    input_path:  path to file of variant strings, one per line (CharField)
+    report_path: path to CSV report written by the job (CharField)
+    status:      queued, running, done or failed (CharField)
+    error:       error message if the job failed (TextField)
+    created:     time job was created (DateTimeField)
+    started:     time job started running (DateTimeField)
+    finished:    time job finished or failed (DateTimeField)
+    processed:   number of variant strings processed (IntegerField)
+    found:       number of strings matching a Variant (IntegerField)
+    missing:     number of well-formed strings not matched (IntegerField)
+    malformed:   number of strings that failed to parse (IntegerField)
+
+    """
+    input_path = models.CharField(max_length=255)
+    report_path = models.CharField(max_length=255)
+    status_choices = (('que', 'queued'),
+                      ('run', 'running'),
+                      ('don', 'done'),
+                      ('err', 'failed'))
+    status = models.CharField(max_length=3,
+                              choices=status_choices,
+                              default='que')
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    processed = models.IntegerField(default=0)
+    found = models.IntegerField(default=0)
+    missing = models.IntegerField(default=0)
+    malformed = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        """Returns string with job ID and status."""
+        return 'annotation job ' + str(self.pk) + ': ' + self.get_status_display()
+
+    @classmethod
+    def create(cls, input_path=None, report_path=None):
+        """Create a queued job, with default file paths in ANNOTATION_DIR.
+
+        If input_path is None the job's input is expected to be written to
+        the returned job's input_path (e.g. from an uploaded file).
+        """
+        if not os.path.isdir(settings.ANNOTATION_DIR):
+            os.makedirs(settings.ANNOTATION_DIR)
+        job = cls()
+        job.save()
+        base_path = os.path.join(settings.ANNOTATION_DIR,
+                                 'annotation-' + str(job.pk))
+        job.input_path = input_path or base_path + '-input.txt'
+        job.report_path = report_path or base_path + '-report.csv'
+        job.save()
+        return job
+
+    @property
+    def variants_per_second(self):
+        """Return throughput of the job so far, or None if not started."""
+        if not self.started:
+            return None
+        elapsed = ((self.finished or timezone.now()) -
+                   self.started).total_seconds()
+        return self.processed / max(elapsed, 0.001)
+
+    def progress(self):
+        """Return dict describing the job's status and progress."""
+        return {'id': self.pk,
+                'status': self.get_status_display(),
+                'processed': self.processed,
+                'found': self.found,
+                'missing': self.missing,
+                'malformed': self.malformed,
+                'variants_per_second': self.variants_per_second,
+                'error': self.error,
+                }
+
+
+def _uncache_variant(sender, instance, **kwargs):
+    """Drop a saved or deleted Variant from variant_lookup_cache."""
+    variant_lookup_cache.discard_pk(instance.pk)
+
+
+def _uncache_gene(sender, instance, **kwargs):
+    """Clear variant_lookup_cache when any Gene is saved or deleted."""
+    variant_lookup_cache.clear()
+
+
+def _remember_gene_symbol(sender, instance, **kwargs):
+    """Record a Gene's symbol as loaded, to notice renames on save."""
+    instance._loaded_hgnc_symbol = instance.hgnc_symbol
+
+
+def _rename_gene_variants(sender, instance, created, **kwargs):
+    """Update Variant names after a Gene's symbol changes."""
+    if not created and instance.hgnc_symbol != instance._loaded_hgnc_symbol:
+        for variant in Variant.objects.filter(gene=instance):
+            variant.gene = instance
+            variant.save()
+    instance._loaded_hgnc_symbol = instance.hgnc_symbol
+
+
+def _remember_review_counts(sender, instance, **kwargs):
+    """Record a VariantReview's Gene, and what it adds to its summary.
+
+    Read from the database before the review is saved or deleted, so
+    every way of changing reviews (forms, reverting revisions) is
+    summarized alike.
+    """
+    instance._summary_gene_id = None
+    instance._summary_counts = None
+    if instance.pk:
+        reviews = VariantReview.objects.filter(pk=instance.pk)
+        for values in reviews.values_list(
+                'variant__gene', 'impact', *GeneVariantSummary.EVIDENCE_FIELDS):
+            instance._summary_gene_id = values[0]
+            instance._summary_counts = GeneVariantSummary.review_counts(
+                values[1], values[2:])
+    if instance._summary_gene_id is None:
+        for gene_id in Variant.objects.filter(
+                pk=instance.variant_id).values_list('gene', flat=True):
+            instance._summary_gene_id = gene_id
+
+
+def _summarize_saved_review(sender, instance, **kwargs):
+    """Apply a saved VariantReview's changes to its Gene's summary."""
+    GeneVariantSummary.add_counts(
+        instance._summary_gene_id, old=instance._summary_counts,
+        new=GeneVariantSummary.review_counts(
+            instance.impact, [getattr(instance, field) for field in
+                              GeneVariantSummary.EVIDENCE_FIELDS]))
+
+
+def _summarize_deleted_review(sender, instance, **kwargs):
+    """Remove a deleted VariantReview from its Gene's summary."""
+    GeneVariantSummary.add_counts(instance._summary_gene_id,
+                                  old=instance._summary_counts)
+
+
+def _revise_variant_dbsnps(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Save a Variant revision when its dbSNP IDs change."""
+    if reverse:
+        # Changed from the DbSNP side: instance is a DbSNP.
+        if action == 'pre_clear':
+            instance._cleared_variant_pks = list(
+                instance.variant_set.values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = instance._cleared_variant_pks
+        variants = Variant.objects.filter(pk__in=pk_set or [])
+    else:
+        variants = [instance]
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        for variant in variants:
+            reversion.default_revision_manager.save_revision(
+                [variant], comment='Changed dbSNP IDs.')
+
+
+def _revise_publication_variants(sender, instance, created, **kwargs):
+    """Save a revision of each Variant citing an updated Publication.
+
+    This moves the Variants' latest revisions, so cached pages showing the
+    old (e.g. pending) publication data are no longer used.
+    """
+    if created:
+        return
+    for variant in Variant.objects.filter(
+            variantreview__variantpublicationreview__publication=instance):
+        reversion.default_revision_manager.save_revision(
+            [variant], comment='Updated publication data.')
+
+
+post_save.connect(_uncache_variant, sender=Variant)
+post_delete.connect(_uncache_variant, sender=Variant)
+post_save.connect(_uncache_gene, sender=Gene)
+post_delete.connect(_uncache_gene, sender=Gene)
+post_init.connect(_remember_gene_symbol, sender=Gene)
+post_save.connect(_rename_gene_variants, sender=Gene)
+pre_save.connect(_remember_review_counts, sender=VariantReview)
+post_save.connect(_summarize_saved_review, sender=VariantReview)
+pre_delete.connect(_remember_review_counts, sender=VariantReview)
+post_delete.connect(_summarize_deleted_review, sender=VariantReview)
+m2m_changed.connect(_revise_variant_dbsnps, sender=Variant.dbsnps.through)
+post_save.connect(_revise_publication_variants, sender=Publication)
+
+
+# Register models with reversion. Reviews follow their Variant so every
+# revision of a review also records the Variant it belongs to.
+reversion.register(VariantReview, follow=['variant'])
+reversion.register(VariantPublicationReview, follow=['variantreview'])
 reversion.register(Variant)
@@ -1,2 +1,5 @@
+from test_annotation import *
+from test_export import *
+from test_gene_data import *
 from test_models import *
 from test_views import *
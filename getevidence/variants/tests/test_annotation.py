@@ -0,0 +1,82 @@
+"""
+Tests annotation.py in variants app.
+"""
+
+import csv
+import json
+import os
+from StringIO import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.client import Client
+from ..annotation import annotate_batch, read_variant_batches
+from ..management.commands.add_external_gene_data import add_external_gene_data
+from ..management.commands.sample_data import create_HBB_E7V
+from ..models import AnnotationJob
+
+VARIANT_LIST = "# Sample genome\nHBB-E7V\n\nHFE-C282Y\nE7V-HBB\nHBB-E7V\n"
+
+
+class VariantsAnnotationTest(TestCase):
+    """Tests annotation of variant lists."""
+
+    def setUp(self):
+        add_external_gene_data(settings.SITE_ROOT + '/../external_data/getevidence_external_gene_data_mini.csv')
+        create_HBB_E7V()
+
+    def test_read_variant_batches(self):
+        """Tests batching of variant strings, skipping comments."""
+        batches = list(read_variant_batches(StringIO(VARIANT_LIST),
+                                            batch_size=2))
+        self.assertEqual(batches, [['HBB-E7V', 'HFE-C282Y'],
+                                   ['E7V-HBB', 'HBB-E7V']])
+
+    def test_annotate_batch(self):
+        """Tests report rows and counts for a batch."""
+        rows, counts = annotate_batch(['HBB-E7V', 'HFE-C282Y', 'E7V-HBB'])
+        self.assertEqual(rows[0], ['HBB-E7V', 'found', 'pathogenic',
+                                   'recessive', 1, 3, 5, 5, 4, 3, 5])
+        self.assertEqual(rows[1], ['HFE-C282Y', 'missing'])
+        self.assertEqual(rows[2], ['E7V-HBB', 'malformed'])
+        self.assertEqual(counts, {'found': 1, 'missing': 1, 'malformed': 1})
+
+    def test_annotate_variants_command(self):
+        """Tests annotate_variants management command."""
+        job = AnnotationJob.create()
+        with open(job.input_path, 'w') as input_file:
+            input_file.write(VARIANT_LIST)
+        call_command('annotate_variants', job.input_path,
+                     workers=1, stdout=StringIO())
+        job = AnnotationJob.objects.latest('pk')
+        self.assertEqual(job.status, 'don')
+        self.assertEqual((job.processed, job.found, job.missing,
+                          job.malformed), (4, 2, 1, 1))
+        with open(job.report_path) as report_file:
+            report = list(csv.reader(report_file))
+        self.assertEqual(len(report), 5)
+        self.assertEqual(report[1][:3], ['HBB-E7V', 'found', 'pathogenic'])
+        os.remove(job.report_path)
+
+    def test_annotate_views(self):
+        """Tests upload, progress and report download views."""
+        cl = Client()
+        response = cl.get('/variant/annotate')
+        self.assertEqual(response.status_code, 200)
+        upload = StringIO(VARIANT_LIST)
+        upload.name = 'genome.txt'
+        response = cl.post('/variant/annotate', {'variant_file': upload})
+        self.assertEqual(response.status_code, 302)
+        job = AnnotationJob.objects.latest('pk')
+        response = cl.get('/variant/annotate/%d' % job.pk,
+                          {'format': 'json'})
+        progress = json.loads(response.content)
+        self.assertEqual(progress['status'], 'done')
+        self.assertEqual(progress['processed'], 4)
+        self.assertTrue(progress['variants_per_second'] > 0)
+        response = cl.get('/variant/annotate/%d/report' % job.pk)
+        self.assertEqual(response.status_code, 200)
+        report = ''.join(response.streaming_content)
+        self.assertTrue(report.startswith('variant,status,impact'))
+        os.remove(job.input_path)
+        os.remove(job.report_path)
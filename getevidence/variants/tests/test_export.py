@@ -0,0 +1,77 @@
+"""
+Tests export.py in variants app.
+"""
+
+import csv
+import gzip
+import json
+from StringIO import StringIO
+from django.conf import settings
+from django.test import TestCase
+from django.test.client import Client
+from ..export import export_chunks, export_records, latest_revision
+from ..management.commands.add_external_gene_data import add_external_gene_data
+from ..management.commands.sample_data import create_sample_data
+
+
+class VariantsExportTest(TestCase):
+    """Tests streaming export of variant data."""
+
+    def setUp(self):
+        add_external_gene_data(settings.SITE_ROOT + '/../external_data/getevidence_external_gene_data_mini.csv')
+        create_sample_data()
+
+    def test_export_records(self):
+        """Tests exported data and queries per chunk."""
+        with self.assertNumQueries(9):
+            records = list(export_records(chunk_size=2))
+        self.assertEqual([r['variant'] for r in records],
+                         ['HBB-E7V', 'JAK2-V617F', 'SCN5A-G615E'])
+        self.assertEqual(records[0]['dbsnps'], ['rs334'])
+        self.assertEqual(records[0]['pmids'], [655188, 10631276])
+        self.assertEqual(records[0]['evidence_casecontrol'], 5)
+        self.assertTrue(records[0]['revision'] > 0)
+
+    def test_export_since(self):
+        """Tests incremental export of changed variants."""
+        revision = latest_revision()
+        self.assertEqual(list(export_records(since=revision)), [])
+        Client().post('/variant/JAK2-V617F/edit',
+                      {'review_summary': "Somatic.", 'review_long': '',
+                       'impact': 'not', 'inheritance': 'unk'})
+        self.assertEqual([r['variant'] for r in
+                          export_records(since=revision)], ['JAK2-V617F'])
+
+    def test_export_formats(self):
+        """Tests CSV, JSON lines and gzip output."""
+        rows = list(csv.DictReader(StringIO(''.join(export_chunks('csv')))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['pmids'], '655188 10631276')
+        lines = ''.join(export_chunks('json')).splitlines()
+        self.assertEqual(json.loads(lines[1])['variant'], 'JAK2-V617F')
+        compressed = ''.join(export_chunks('json', compress=True))
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed)).read(),
+                         ''.join(export_chunks('json')))
+
+    def test_export_view(self):
+        """Tests streaming export view."""
+        cl = Client()
+        response = cl.get('/variant/export', {'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['X-Latest-Revision']), latest_revision())
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 3)
+        response = cl.get('/variant/export',
+                          {'since': response['X-Latest-Revision'],
+                           'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = ''.join(response.streaming_content)
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(content)).read(),
+                         'variant,gene,aa_reference,aa_position,aa_variant,'
+                         'revision,impact,inheritance,evidence_computational,'
+                         'evidence_functional,evidence_casecontrol,'
+                         'evidence_familial,clinical_severity,'
+                         'clinical_treatability,clinical_penetrance,'
+                         'review_summary,review_long,dbsnps,pmids\n')
+        response = cl.get('/variant/export', {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,75 @@
+"""
+Tests add_external_gene_data.py in variants app.
+"""
+
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from django.test import TestCase
+from search.index import SearchResults
+from ..management.commands.add_external_gene_data import add_external_gene_data, bulk_add_external_gene_data, GENE_FIELDS
+from ..models import Gene, Variant, variant_lookup_cache
+
+MINI_DATA = settings.SITE_ROOT + '/../external_data/getevidence_external_gene_data_mini.csv'
+
+
+class VariantsGeneDataTest(TestCase):
+    """Tests importing external gene data."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def gene_values(self):
+        return list(Gene.objects.order_by('hgnc_symbol').values_list(
+            *GENE_FIELDS))
+
+    def test_bulk_matches_default(self):
+        """Test bulk import creates the same Genes as the default import."""
+        add_external_gene_data(MINI_DATA)
+        expected = self.gene_values()
+        self.assertEqual(len(expected), 4)
+        Gene.objects.all().delete()
+        # One to read Genes, two to create them and three for summaries.
+        with self.assertNumQueries(6):
+            counts = bulk_add_external_gene_data(MINI_DATA, batch_size=3)
+        self.assertEqual(counts, {'created': 4, 'updated': 0,
+                                  'unchanged': 0})
+        self.assertEqual(self.gene_values(), expected)
+
+        # Reimporting the same data writes nothing.
+        with self.assertNumQueries(1):
+            counts = bulk_add_external_gene_data(MINI_DATA)
+        self.assertEqual(counts, {'created': 0, 'updated': 0,
+                                  'unchanged': 4})
+
+    def test_bulk_update(self):
+        """Test bulk import updates only changed Genes."""
+        bulk_add_external_gene_data(MINI_DATA)
+        Variant.create(gene_name='HFE', aa_ref='C', aa_pos=282, aa_var='Y')
+        Variant.create(gene_name='JAK2', aa_ref='V', aa_pos=617, aa_var='F')
+        Variant.variant_lookup('HFE-C282Y')
+        path = os.path.join(self.tempdir, 'genes.csv')
+        with open(MINI_DATA) as mini_data:
+            data = mini_data.read()
+        with open(path, 'w') as changed_data:
+            changed_data.write(
+                data.replace('Janus kinase 2', 'Janus kinase 2 (new)')
+                .replace('141900,Y,', '141900,,') +
+                'TP53,11998,tumor protein p53,uc002gim.2,7157,191170,Y,\n')
+        counts = bulk_add_external_gene_data(path)
+        self.assertEqual(counts, {'created': 1, 'updated': 1,
+                                  'unchanged': 3})
+        self.assertEqual(Gene.objects.get(hgnc_symbol='JAK2').hgnc_name,
+                         'Janus kinase 2 (new)')
+        # Blank data doesn't replace existing values.
+        self.assertTrue(Gene.objects.get(hgnc_symbol='HBB').clinical_testing)
+        self.assertEqual(Gene.objects.get(hgnc_symbol='TP53').mim_id, '191170')
+        # Cached variant lookups don't outlive the changed Genes.
+        self.assertEqual(variant_lookup_cache.stats()['size'], 0)
+        # Variants of changed Genes are reindexed.
+        self.assertEqual([variant.name for variant in SearchResults('new')],
+                         ['JAK2-V617F'])
@@ -4,8 +4,11 @@ Tests models.py in variants app.
 
 from django.conf import settings
 from django.test import TestCase
-from ..models import DbSNP, Gene, Variant, VariantReview
+from genes.gene_data import load_gene_aliases
+from genes.models import AmbiguousGeneAlias, GeneAlias
+from ..models import DbSNP, Gene, Variant, VariantReview, variant_lookup_cache
 from ..management.commands.add_external_gene_data import add_external_gene_data
+from ..management.commands.backfill_variant_names import backfill_variant_names
 from ..management.commands.sample_data import create_HBB_E7V
 
 class VariantsModelsTest(TestCase):
@@ -35,6 +38,101 @@ class VariantsModelsTest(TestCase):
         self.assertEqual(variant.aa_position, 7)
         self.assertEqual(variant.aa_variant, 'V')
 
+    def test_variant_lookup_cache(self):
+        """Tests variant_lookup caching and invalidation by signals."""
+        variant_lookup_cache.clear()
+        Variant.variant_lookup('HBB-E7V')
+        hits = variant_lookup_cache.stats()['hits']
+        with self.assertNumQueries(1):
+            variant = Variant.variant_lookup('HBB-E7V')
+        self.assertEqual(variant.name, 'HBB-E7V')
+        self.assertEqual(variant_lookup_cache.stats()['hits'], hits + 1)
+        Variant.remove(variant=variant)
+        self.assertEqual(variant_lookup_cache.stats()['size'], 0)
+        self.assertRaises(Variant.DoesNotExist,
+                          Variant.variant_lookup, 'HBB-E7V')
+        Variant.create(gene_name='HFE', aa_ref='C', aa_pos=282, aa_var='Y')
+        Variant.variant_lookup('HFE-C282Y')
+        Gene.objects.get(hgnc_symbol='HFE').save()
+        self.assertEqual(variant_lookup_cache.stats()['size'], 0)
+
+    def test_variant_lookup_alias(self):
+        """Tests variant_lookup and variant_lookup_many with gene aliases."""
+        load_gene_aliases(settings.SITE_ROOT + '/../external_data/getevidence_external_gene_aliases_mini.csv')
+        Variant.create(gene_name='HFE', aa_ref='C', aa_pos=282, aa_var='Y')
+        Variant.variant_lookup('HFE-C282Y')
+        with self.assertNumQueries(1):
+            variant = Variant.variant_lookup('HFE1-C282Y')
+        self.assertEqual(variant.name, 'HFE-C282Y')
+        self.assertRaises(Variant.DoesNotExist,
+                          Variant.variant_lookup, 'NOTAGENE-C282Y')
+
+        GeneAlias.objects.create(gene=Gene.objects.get(hgnc_symbol='JAK2'),
+                                 alias='HFE1', alias_type='syn')
+        self.assertRaises(AmbiguousGeneAlias,
+                          Variant.variant_lookup, 'HFE1-C282Y')
+        results = Variant.variant_lookup_many(['JTK10-V617F', 'HFE-C282Y',
+                                               'HFE1-C282Y', 'NOTAGENE-C1Y'])
+        self.assertEqual(sorted(results['found']), ['HFE-C282Y'])
+        self.assertEqual(sorted(results['missing']),
+                         ['HFE1-C282Y', 'JTK10-V617F', 'NOTAGENE-C1Y'])
+        self.assertEqual(results['ambiguous'],
+                         {'HFE1-C282Y': ['HFE', 'JAK2']})
+
+    def test_variant_lookup_many(self):
+        """Tests classmethod variant_lookup_many against variant_lookup."""
+        Variant.create(gene_name='HFE', aa_ref='C', aa_pos=282, aa_var='Y')
+        Variant.create(gene_name='HFE', aa_ref='H', aa_pos=63, aa_var='D')
+        strings = ['HFE-C282Y', 'HBB-E7V', 'HFE-H63D', 'HBB-E7K',
+                   'E7V-HBB', 'HBB-E7V']
+        with self.assertNumQueries(1):
+            results = Variant.variant_lookup_many(strings)
+        self.assertEqual(sorted(results['found'].keys()),
+                         ['HBB-E7V', 'HFE-C282Y', 'HFE-H63D'])
+        for variant_string, variant in results['found'].items():
+            self.assertEqual(variant, Variant.variant_lookup(variant_string))
+        self.assertEqual(results['missing'], ['HBB-E7K'])
+        self.assertEqual(results['malformed'], ['E7V-HBB'])
+
+    def test_variant_lookup_many_batches(self):
+        """Tests that variant_lookup_many issues one query per batch."""
+        count = 2 * Variant.LOOKUP_BATCH_SIZE + 1
+        strings = ['HBB-E%dV' % pos for pos in range(1, count + 1)]
+        with self.assertNumQueries(3):
+            results = Variant.variant_lookup_many(strings)
+        self.assertEqual(results['found'].keys(), ['HBB-E7V'])
+        self.assertEqual(len(results['missing']), len(strings) - 1)
+
+    def test_with_review_bundle(self):
+        """Tests that a review bundle costs a fixed number of queries."""
+        with self.assertNumQueries(4):
+            variant = Variant.objects.with_review_bundle().get(
+                gene__hgnc_symbol='HBB', aa_position=7)
+            self.assertEqual(variant.gene.hgnc_symbol, 'HBB')
+            self.assertEqual(variant.variantreview.impact, 'pat')
+            self.assertEqual([s.rsid for s in variant.dbsnps.all()],
+                             ['rs334'])
+            pmids = sorted(varpubreview.publication.pmid for varpubreview in
+                           variant.variantreview.variantpublicationreview_set.all())
+            self.assertEqual(pmids, [655188, 10631276])
+
+    def test_Variant_name_follows_gene_symbol(self):
+        """Tests that Variant names are updated when a gene is renamed."""
+        gene = Gene.objects.get(hgnc_symbol='HBB')
+        gene.hgnc_symbol = 'HBBX'
+        gene.save()
+        variant = Variant.variant_lookup('HBBX-E7V')
+        self.assertEqual(variant.name, 'HBBX-E7V')
+        self.assertRaises(Variant.DoesNotExist,
+                          Variant.variant_lookup, 'HBB-E7V')
+
+    def test_backfill_variant_names(self):
+        """Tests filling in missing Variant names."""
+        Variant.objects.filter(name='HBB-E7V').update(name='')
+        self.assertEqual(backfill_variant_names(), 1)
+        self.assertEqual(backfill_variant_names(), 0)
+        self.assertTrue(Variant.objects.get(name='HBB-E7V'))
+
     def test_Variant_create_with_JAK2_V617F(self):
         """Tests Variant creation."""
         Variant.create(gene_name='JAK2', aa_ref='V', aa_pos=617, aa_var='F')
@@ -60,3 +158,21 @@ class VariantsModelsTest(TestCase):
                                 aa_position=7, aa_variant='V')
         v.dbsnps.add(s)
         v.dbsnps.remove(s)
+
+    def test_index_page_keyset(self):
+        """Tests keyset pages from classmethod index_page."""
+        Variant.create(gene_name='HBB', aa_ref='E', aa_pos=27, aa_var='K')
+        Variant.create(gene_name='HBB', aa_ref='A', aa_pos=7, aa_var='G')
+        Variant.create(gene_name='HFE', aa_ref='C', aa_pos=282, aa_var='Y')
+        with self.assertNumQueries(1):
+            page, cursor = Variant.index_page(page_size=2)
+            names = [variant.name for variant in page]
+        self.assertEqual(names, ['HBB-A7G', 'HBB-E27K'])
+        self.assertEqual(cursor, 'HBB-E27K')
+        with self.assertNumQueries(1):
+            page, cursor = Variant.index_page(after=cursor, page_size=2)
+            names = [variant.name for variant in page]
+        self.assertEqual(names, ['HBB-E7V', 'HFE-C282Y'])
+        self.assertEqual(cursor, None)
+        page, cursor = Variant.index_page(after='HFE-C282Y', page_size=2)
+        self.assertEqual(page, [])
@@ -4,11 +4,16 @@ Tests views.py in variants app.
 
 import re
 from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.client import Client
+from genes.gene_data import load_gene_aliases
+from genes.models import Gene, GeneAlias
+from publications.ingest import process_fetch_queue
+from publications.tests.pubmed_server import PubmedFixtureServer
 from ..management.commands.add_external_gene_data import add_external_gene_data
 from ..management.commands.sample_data import create_sample_data
-from ..models import Variant, VariantReview
+from ..models import DbSNP, Variant, VariantReview
 
 
 class VariantsViewsTest(TestCase):
@@ -25,6 +30,14 @@ class VariantsViewsTest(TestCase):
         response = self.cl.get('/variant/')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context['variant_list']), 3)
+        self.assertEqual(response.context['next_cursor'], None)
+
+    def test_index_after(self):
+        """Test variants index page following a cursor."""
+        response = self.cl.get('/variant/', {'after': 'HBB-E7V'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([v.name for v in response.context['variant_list']],
+                         ['JAK2-V617F', 'SCN5A-G615E'])
 
     def test_edit(self):
         """Test a sample edit submission."""
@@ -111,3 +124,163 @@ class VariantsViewsTest(TestCase):
         # Test not existing variant.
         response = self.cl.get('/variant/HBB-E27V')
         self.assertTrue(re.search("No variant found", response.content))
+
+    def test_detail_alias(self):
+        """Test variant pages found by gene alias."""
+        load_gene_aliases(settings.SITE_ROOT + '/../external_data/getevidence_external_gene_aliases_mini.csv')
+        response = self.cl.get('/variant/JTK10-V617F')
+        self.assertEqual(response.status_code, 301)
+        self.assertTrue(response['Location'].endswith('/variant/JAK2-V617F'))
+        GeneAlias.objects.create(gene=Variant.variant_lookup('HBB-E7V').gene,
+                                 alias='JTK10', alias_type='syn')
+        response = self.cl.get('/variant/JTK10-V617F')
+        self.assertTrue(re.search("did you mean HBB or JAK2", response.content))
+
+        # New variants can be added by gene alias too.
+        self.cl.post('/variant/new', {'gene': 'LQT3',
+                                      'aa_reference': 'E',
+                                      'aa_position': '1784',
+                                      'aa_variant': 'K'})
+        self.assertEqual(Variant.variant_lookup('SCN5A-E1784K').gene.hgnc_id,
+                         '10593')
+
+    def test_detail_cache(self):
+        """Test variant detail page caching and invalidation."""
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertEqual(response['X-Cache'], 'miss')
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertEqual(response['X-Cache'], 'hit')
+        self.assertTrue(re.search("Acquired mutation", response.content))
+
+        # Edits invalidate the cached page.
+        self.cl.post('/variant/JAK2-V617F/edit',
+                     {'review_summary': "Myeloproliferative disorders.",
+                      'review_long': "Somatic.",
+                      'impact': 'pat',
+                      'inheritance': 'oth'})
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertTrue(re.search("Somatic.", response.content))
+
+        # So do added publications and dbSNP IDs.
+        self.cl.post('/variant/JAK2-V617F/add_pub', {'pmid': '15793561'})
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertTrue(re.search("15793561", response.content))
+        variant = Variant.variant_lookup('JAK2-V617F')
+        variant.dbsnps.add(DbSNP.objects.create(rsid='rs1'))
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertTrue(re.search("rs1", response.content))
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertEqual(response['X-Cache'], 'hit')
+
+        # And changes to the Gene, even by bulk update.
+        Gene.objects.filter(hgnc_symbol='JAK2').update(mim_id='999999')
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertTrue(re.search("999999", response.content))
+
+    def test_edit_form_query_count(self):
+        """Test the edit form loads only the Variant and its review."""
+        Variant.variant_lookup('HBB-E7V')
+        with self.assertNumQueries(2):
+            response = self.cl.get('/variant/HBB-E7V/edit')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].instance.impact, 'pat')
+
+    def test_detail_query_count(self):
+        """Test that the detail page costs a fixed number of queries."""
+        # Variant, latest revision and review bundle (4); history is
+        # loaded separately.
+        cache.clear()
+        with self.assertNumQueries(6):
+            response = self.cl.get('/variant/HBB-E7V')
+        self.assertEqual(len(response.context['varpubreviews']), 2)
+        for pmid in ['2296310', '15793561', '11997281']:
+            self.cl.post('/variant/HBB-E7V/add_pub', {'pmid': pmid})
+        cache.clear()
+        with self.assertNumQueries(6):
+            response = self.cl.get('/variant/HBB-E7V')
+        self.assertEqual(len(response.context['varpubreviews']), 5)
+        self.assertEqual(response['X-Cache'], 'miss')
+        with self.assertNumQueries(2):
+            response = self.cl.get('/variant/HBB-E7V')
+        self.assertEqual(response['X-Cache'], 'hit')
+
+    def test_history(self):
+        """Test paginated review history and revision diffs."""
+        review = Variant.variant_lookup('JAK2-V617F').variantreview
+        initial_count = review.history().count()
+        for impact in ['pat', 'ben', 'pha', 'pat']:
+            self.cl.post('/variant/JAK2-V617F/edit',
+                         {'review_summary': "Acquired mutation " + impact,
+                          'review_long': "Somatic.",
+                          'impact': impact,
+                          'inheritance': 'oth'})
+        self.assertEqual(review.history().count(), initial_count + 4)
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertFalse(re.search("Acquired mutation ben", response.content))
+
+        VariantReview.HISTORY_PAGE_SIZE = 4
+        try:
+            response = self.cl.get('/variant/JAK2-V617F/history')
+            versions = response.context['versions']
+            self.assertEqual(len(versions), 4)
+            self.assertTrue(versions.has_next())
+            response = self.cl.get('/variant/JAK2-V617F/history?page=2')
+            self.assertEqual(len(response.context['versions']),
+                             initial_count)
+            response = self.cl.get('/variant/JAK2-V617F/history?page=9')
+            self.assertEqual(response.context['versions'].number, 2)
+        finally:
+            VariantReview.HISTORY_PAGE_SIZE = 20
+
+        # Diffs only list changed fields and are cached once computed.
+        cache.clear()
+        newest = review.history()[0]
+        url = '/variant/JAK2-V617F/history/%d' % newest.pk
+        response = self.cl.get(url)
+        diff = response.context['diff']
+        self.assertEqual([change['name'] for change in diff],
+                         ['review summary', 'impact'])
+        self.assertEqual(diff[1]['old'], 'pharmacogenetic')
+        self.assertEqual(diff[1]['new'], 'pathogenic')
+        with self.assertNumQueries(0):
+            self.assertEqual(review.version_diff(newest), diff)
+        response = self.cl.get('/variant/JAK2-V617F/history/999999')
+        self.assertEqual(response.status_code, 404)
+
+        # Scores changed to 0 are shown, not left blank.
+        self.cl.post('/variant/JAK2-V617F/edit',
+                     {'review_summary': "Acquired mutation pat",
+                      'review_long': "Somatic.",
+                      'impact': 'pat',
+                      'inheritance': 'oth',
+                      'evidence_computational': '0'})
+        response = self.cl.get('/variant/JAK2-V617F/history/%d' %
+                               review.history()[0].pk)
+        self.assertTrue(re.search(r'<td>evidence computational</td>'
+                                  r'<td></td><td>0</td>', response.content,
+                                  re.I))
+
+    def test_pending_publication(self):
+        """Test added publications show as pending until fetched."""
+        response = self.cl.post('/variant/JAK2-V617F/add_pub',
+                                {'pmid': '1000001'})
+        self.assertEqual(response.status_code, 302)
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertTrue(re.search("being fetched", response.content))
+        self.assertEqual(response['X-Cache'], 'miss')
+
+        server = PubmedFixtureServer().start()
+        try:
+            with server.settings():
+                process_fetch_queue()
+        finally:
+            server.stop()
+        response = self.cl.get('/variant/JAK2-V617F')
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertFalse(re.search("being fetched", response.content))
+        self.assertTrue(re.search("A test article with many authors",
+                                  response.content))
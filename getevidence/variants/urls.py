@@ -6,7 +6,15 @@ urlpatterns = patterns(
     '',
     url(r'^/?$', views.index, name='index'),
     url(r'^/new/?$', views.new, name='new'),
+    url(r'^/export/?$', views.export, name='export'),
+    url(r'^/annotate/?$', views.annotate, name='annotate'),
+    url(r'^/annotate/(\d+)/?$', views.annotation_status,
+        name='annotation_status'),
+    url(r'^/annotate/(\d+)/report/?$', views.annotation_report,
+        name='annotation_report'),
     url(r'^/(.+)/edit/?$', views.edit, name='edit'),
     url(r'^/(.+)/add_pub/?$', views.add_pub, name='add_pub'),
+    url(r'^/(.+)/history/?$', views.history, name='history'),
+    url(r'^/(.+)/history/(\d+)/?$', views.history_diff, name='history_diff'),
     url(r'^/(.+)/?$', views.detail, name='detail'),
 )
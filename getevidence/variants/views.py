@@ -9,22 +9,53 @@ index:       view to list Variants
 new:         view to create new Variant
 edit:        view to edit Variant
 detail:      view to display Variant
+history:     view to list revisions of a VariantReview
+history_diff:       view to display changes made in a revision
+annotate:           view to upload a file of variants for annotation
+annotation_status:  view to display progress of an annotation job
+annotation_report:  view to download report of an annotation job
+export:             view to download data for all Variants
 
 """
 
-import reversion
-from django.http import HttpResponse, HttpResponseRedirect
-from django.db import IntegrityError
-from django.shortcuts import render
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.servers.basehttp import FileWrapper
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         HttpResponsePermanentRedirect, HttpResponseRedirect,
+                         StreamingHttpResponse)
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.core.urlresolvers import reverse
 from django.contrib import messages
-from .models import Variant, VariantReview, VariantPublicationReview
-from .forms import VariantReviewForm, AddVarPubReviewForm, NewVariantForm
+from genes.models import AmbiguousGeneAlias
+from .annotation import start_annotation_job
+from .export import export_chunks, latest_revision
+from .models import (AnnotationJob, Variant, VariantReview,
+                     VariantPublicationReview)
+from .forms import (AnnotationUploadForm, VariantReviewForm,
+                    AddVarPubReviewForm, NewVariantForm)
+
+
+def _ambiguous_gene_message(error):
+    """Return message listing the Genes an ambiguous gene alias could mean."""
+    return ('Ambiguous gene symbol "' + error.alias + '"; did you mean ' +
+            ' or '.join(error.symbols) + '?')
+
 
 def index(request):
-    """Lists Variants."""
-    variant_list = Variant.objects.order_by('gene__hgnc_symbol')
-    return render(request, 'variants/index.html', {'variant_list': variant_list})
+    """Lists Variants, one keyset-paginated page at a time."""
+    after = request.GET.get('after')
+    variant_list, next_cursor = Variant.index_page(after=after)
+    return render(request, 'variants/index.html',
+                  {'variant_list': variant_list,
+                   'after': after,
+                   'next_cursor': next_cursor,
+                   })
 
 
 def edit(request, variant_pattern):
@@ -37,6 +68,7 @@ def edit(request, variant_pattern):
             return HttpResponseRedirect(reverse('variants:detail',
                                                 args=(variant_pattern,)))
         else:
+            # edit.html shows only the form, so the review is all it needs.
             return render(request, 'variants/edit.html',
                       {'variant': variant,
                        'variant_review': variant.variantreview,
@@ -46,6 +78,8 @@ def edit(request, variant_pattern):
     except AssertionError:
         return HttpResponse("Submit edit - Badly formatted variant? " + 
                             variant_pattern)
+    except AmbiguousGeneAlias as e:
+        return HttpResponse(_ambiguous_gene_message(e))
     except Variant.DoesNotExist:
         return HttpResponse("Submit edit - No variant found? " + 
                             variant_pattern)
@@ -63,7 +97,9 @@ def add_pub(request, variant_pattern):
                         variantreview = variant.variantreview,
                         pmid = form.cleaned_data['pmid'])
                     messages.success(request, "<strong>Success:</strong> PMID " +
-                                     str(form.cleaned_data['pmid']) + " added.",
+                                     str(form.cleaned_data['pmid']) + " added." +
+                                     " Citation details will appear once " +
+                                     "fetched from Pubmed.",
                                      extra_tags='htmlsafe')
                 except IntegrityError:
                     messages.error(request, "Publication not added: PMID " +
@@ -79,6 +115,8 @@ def add_pub(request, variant_pattern):
     except AssertionError:
         return HttpResponse("Add publication - Badly formatted variant? " +
                             variant_pattern)
+    except AmbiguousGeneAlias as e:
+        return HttpResponse(_ambiguous_gene_message(e))
     except Variant.DoesNotExist:
         return HttpResponse("Add publication - No variant found? " +
                             variant_pattern)
@@ -124,23 +162,164 @@ def detail(request, variant_pattern):
     Default template displays for viewing. Another template may be used 
     to provide forms for editing.
 
+    The read-only review section is cached, keyed by the Variant's latest
+    revision, so it is rebuilt only after the Variant's data changes. The
+    X-Cache response header reports whether it was a hit or a miss.
+
     """
     try:
         variant = Variant.variant_lookup(variant_pattern)
-        varpubreviews = VariantPublicationReview.objects.filter(
-                            variantreview__id=variant.variantreview.id
-                            ).order_by('publication__pmid')
+        if variant.name != variant_pattern:
+            # Found by gene alias: send to the page for the current name.
+            return HttpResponsePermanentRedirect(
+                reverse('variants:detail', args=(variant.name,)))
+        cache_key = variant.page_cache_key('detail')
+        review_html = cache.get(cache_key)
+        cache_status = 'hit'
+        if review_html is None:
+            cache_status = 'miss'
+            variant = Variant.objects.with_review_bundle().get(pk=variant.pk)
+            varpubreviews = sorted(
+                variant.variantreview.variantpublicationreview_set.all(),
+                key=lambda varpubreview: varpubreview.publication.pmid)
+            review_html = render_to_string('variants/detail_review.html',
+                          {'variant': variant,
+                           'variantreview': variant.variantreview,
+                           'dbsnps': variant.dbsnps.all(),
+                           'varpubreviews': varpubreviews,
+                           })
+            cache.set(cache_key, review_html,
+                      settings.VARIANT_PAGE_CACHE_TIMEOUT)
         addvarpubreview_form = AddVarPubReviewForm()
-        variantreview_history = reversion.get_for_object(variant.variantreview)
-        return render(request, 'variants/detail.html',
+        response = render(request, 'variants/detail.html',
+                          {'variant': variant,
+                           'review_html': mark_safe(review_html),
+                           'addvarpubreview_form': addvarpubreview_form,
+                           })
+        response['X-Cache'] = cache_status
+        return response
+    except AssertionError:
+        return HttpResponse("Badly formatted variant? " + variant_pattern)
+    except AmbiguousGeneAlias as e:
+        return HttpResponse(_ambiguous_gene_message(e))
+    except Variant.DoesNotExist:
+        return HttpResponse("No variant found? " + variant_pattern)
+
+
+def history(request, variant_pattern):
+    """List revisions of a Variant's VariantReview, one page at a time."""
+    try:
+        variant = Variant.variant_lookup(variant_pattern)
+        paginator = Paginator(variant.variantreview.history(),
+                              VariantReview.HISTORY_PAGE_SIZE)
+        try:
+            versions = paginator.page(request.GET.get('page'))
+        except PageNotAnInteger:
+            versions = paginator.page(1)
+        except EmptyPage:
+            versions = paginator.page(paginator.num_pages)
+        return render(request, 'variants/history.html',
                       {'variant': variant,
-                       'variantreview': variant.variantreview,
-                       'variantreview_history': variantreview_history,
-                       'dbsnps': variant.dbsnps.all(),
-                       'varpubreviews': varpubreviews,
-                       'addvarpubreview_form': addvarpubreview_form,
+                       'versions': versions,
                        })
     except AssertionError:
         return HttpResponse("Badly formatted variant? " + variant_pattern)
+    except AmbiguousGeneAlias as e:
+        return HttpResponse(_ambiguous_gene_message(e))
     except Variant.DoesNotExist:
         return HttpResponse("No variant found? " + variant_pattern)
+
+
+def history_diff(request, variant_pattern, version_id):
+    """Display changes to VariantReview fields made in one revision."""
+    try:
+        variant = Variant.variant_lookup(variant_pattern)
+        version = get_object_or_404(variant.variantreview.history(),
+                                    pk=version_id)
+        return render(request, 'variants/history_diff.html',
+                      {'variant': variant,
+                       'version': version,
+                       'diff': variant.variantreview.version_diff(version),
+                       })
+    except AssertionError:
+        return HttpResponse("Badly formatted variant? " + variant_pattern)
+    except AmbiguousGeneAlias as e:
+        return HttpResponse(_ambiguous_gene_message(e))
+    except Variant.DoesNotExist:
+        return HttpResponse("No variant found? " + variant_pattern)
+
+
+def annotate(request):
+    """Upload a file of variant strings and start annotating it."""
+    if request.method == 'POST':
+        form = AnnotationUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Commit the job now: the annotate_variants process started
+            # below can't see rows in this request's open transaction.
+            with transaction.commit_on_success():
+                job = AnnotationJob.create()
+            with open(job.input_path, 'wb') as input_file:
+                for chunk in request.FILES['variant_file'].chunks():
+                    input_file.write(chunk)
+            start_annotation_job(job)
+            return HttpResponseRedirect(reverse('variants:annotation_status',
+                                                args=(job.pk,)))
+    else:
+        form = AnnotationUploadForm()
+    return render(request, 'variants/annotate.html', {'form': form})
+
+
+def annotation_status(request, job_id):
+    """Display progress of an annotation job, as HTML or JSON."""
+    job = get_object_or_404(AnnotationJob, pk=job_id)
+    if request.GET.get('format') == 'json':
+        return HttpResponse(json.dumps(job.progress()),
+                            content_type='application/json')
+    return render(request, 'variants/annotation_status.html', {'job': job})
+
+
+def annotation_report(request, job_id):
+    """Download the CSV report of a finished annotation job."""
+    job = get_object_or_404(AnnotationJob, pk=job_id)
+    if job.status != 'don':
+        raise Http404
+    response = StreamingHttpResponse(FileWrapper(open(job.report_path, 'rb')),
+                                     content_type='text/csv')
+    response['Content-Disposition'] = ('attachment; filename=annotation-' +
+                                       str(job.pk) + '.csv')
+    return response
+
+
+def export(request):
+    """Stream data for all Variants as CSV or newline-delimited JSON.
+
+    GET parameters: 'format' ('csv' or 'json'), 'gzip' (any value to
+    compress) and 'since' (only Variants changed after this revision).
+    The X-Latest-Revision header gives the revision to use as 'since' for
+    the next incremental export.
+    """
+    output_format = request.GET.get('format', 'csv')
+    if output_format not in ('csv', 'json'):
+        return HttpResponseBadRequest('format must be csv or json.')
+    try:
+        since = int(request.GET['since']) if 'since' in request.GET else None
+    except ValueError:
+        return HttpResponseBadRequest('since must be a revision id.')
+    compress = bool(request.GET.get('gzip'))
+
+    revision = latest_revision()
+    filename = 'getevidence-variants.' + output_format
+    if output_format == 'csv':
+        content_type = 'text/csv'
+    else:
+        content_type = 'application/x-ndjson'
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(
+        export_chunks(output_format=output_format, compress=compress,
+                      since=since),
+        content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename=' + filename
+    response['X-Latest-Revision'] = str(revision)
+    return response